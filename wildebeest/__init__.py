@@ -1,15 +1,54 @@
-from .buildsystemdriver import BuildSystemDriver, get_buildsystem_driver
-from .defaultbuildalgorithm import DefaultBuildAlgorithm, DockerBuildAlgorithm
-from .experiment import Experiment, ExpState
-from .gitrepository import GitRepository
-from .projectbuild import ProjectBuild, GitRepository
-from .projectrecipe import ProjectRecipe
-from .projectlist import ProjectList
+from importlib import import_module
+
 from .runconfig import *
 from .sourcelanguages import *
-from .experimentalgorithm import RunStep, ExpStep
-from .reciperepository import get_recipe, get_recipe_names, get_recipes
-from .projectlistrepository import get_project_list_names, get_project_list
-from .experimentrepository import create_experiment, load_experiment, get_experiment_names
+from .ghidrautil import *
+
+# everything else is imported on first access, so "import wildebeest" (and every
+# wdb command/job) doesn't pay for modules it doesn't use. Maps name -> module
+_lazy_names = {
+    'BuildSystemDriver': '.buildsystemdriver',
+    'get_buildsystem_driver': '.buildsystemdriver',
+    'DefaultBuildAlgorithm': '.defaultbuildalgorithm',
+    'DockerBuildAlgorithm': '.defaultbuildalgorithm',
+    'Experiment': '.experiment',
+    'ExpState': '.experiment',
+    'GitRepository': '.gitrepository',
+    'ProjectBuild': '.projectbuild',
+    'ProjectRecipe': '.projectrecipe',
+    'ProjectList': '.projectlist',
+    'RunStep': '.experimentalgorithm',
+    'ExpStep': '.experimentalgorithm',
+    'get_recipe': '.reciperepository',
+    'get_recipe_names': '.reciperepository',
+    'get_recipe_source_languages': '.reciperepository',
+    'get_recipes': '.reciperepository',
+    'get_project_list_names': '.projectlistrepository',
+    'get_project_list': '.projectlistrepository',
+    'create_experiment': '.experimentrepository',
+    'load_experiment': '.experimentrepository',
+    'get_experiment_names': '.experimentrepository',
+}
+
+# submodules that "from wildebeest import *" has always provided (when these
+# were imported eagerly). They're imported when first accessed too
+_lazy_submodules = [
+    'algorithmstep', 'buildsystemdriver', 'defaultbuildalgorithm', 'experiment',
+    'experimentalgorithm', 'experimentpaths', 'experimentrepository', 'gitrepository',
+    'jobrunner', 'postprocessing', 'preprocessing', 'projectbuild', 'projectlist',
+    'projectlistrepository', 'projectrecipe', 'reciperepository', 'run', 'utils',
+]
+
+__all__ = [n for n in globals() if not n.startswith('_') and n != 'import_module'] + list(_lazy_names) + _lazy_submodules
+
+def __getattr__(name:str):
+    if name in _lazy_names:
+        value = getattr(import_module(_lazy_names[name], __name__), name)
+        globals()[name] = value     # only look it up once
+        return value
+    if name in _lazy_submodules:
+        return import_module(f'.{name}', __name__)  # (importing it sets it on the package)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-from .ghidrautil import *
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names) | set(_lazy_submodules))
@@ -56,30 +56,33 @@ class RunStep:
 
     Parallelism
     -----------
-    IF A PROCESSING STEP RETURNS A LIST, IT WILL BE INTERPRETED AS AN OPPORTUNITY
-    FOR PARALLEL PROCESSING AT THE DISCRETION OF THE EXPERIMENT RUNNER.
-
-    In other words, if a processing step returns a list of things then the list
-    may be partitioned into separate jobs and run in parallel.
-
-    Note that even for a list that gets partitioned into a sub-list per job, the
-    entry for that list in each job's output dictionary will always be a list, even
-    if there is only one element. It will just have fewer elements instead of all the
-    original elements.
-
-    Thus, any code that consumes these outputs can be written to expect a list,
-    BUT MUST FUNCTION PROPERLY IF THE LIST IS NOT THE COMPLETE LIST. If this behavior
-    is not acceptable, it can be prevented on an individual processing step's outputs
-    by setting do_not_parallelize.
+    A step that processes the items of an earlier step's list (or dict) output
+    independently can opt in to having that work split across parallel processes
+    by naming the earlier step in fanout_over.
+
+    When the JobRunner has more job slots than runs in flight, it partitions the
+    fanout_over output (from this phase or an earlier one) and forks a process per
+    partition that runs this step - along with any steps right after it that fan out
+    over the same output - with outputs[fanout_over] holding just its partition.
+    The outputs are merged back into the run afterward (lists concatenated, dicts
+    merged, see ExperimentAlgorithm.execute_from), including changes the steps made
+    to the partitioned items themselves.
+
+    Thus, a step that fans out MUST FUNCTION PROPERLY IF outputs[fanout_over] IS
+    NOT THE COMPLETE LIST, and the partitions must not step on each other (e.g. by
+    writing the same files).
     '''
     def __init__(self, name:str, process:Callable[[Run, Dict[str,Any], Dict[str, Any]], Any],
             params:Dict[str,Any]={},
             run_in_docker:bool=False,
-            do_not_parallelize:bool=False) -> None:
+            do_not_parallelize:bool=False,
+            fanout_over:str=None) -> None:
         '''
         name: The unique name of this RunStep
         parameters: A dictionary of parameters for this step
         process: The Callable that executes this step in the algorithm
+        fanout_over: Name of the earlier step whose list/dict output this step may be
+                     run on in parallel partitions (see RunStep parallelism)
         '''
         # https://stackoverflow.com/questions/37835179/how-can-i-specify-the-function-type-in-my-type-hints
         self.name = name
@@ -98,8 +101,11 @@ class RunStep:
         particular algorithm step'''
 
         self.do_not_parallelize = do_not_parallelize
-        '''Indicates that the outputs of this processing step should not be split
-        into multiple parallel jobs, even if a list is returned'''
+        '''Indicates that this step should never be fanned out (overrides fanout_over)'''
+
+        self.fanout_over = fanout_over
+        '''Name of the earlier step whose list/dict output this step may be run on
+        in parallel partitions'''
 
         self.run_in_docker = run_in_docker
         '''Indicates this RunStep is intended to be run within the docker container'''
\ No newline at end of file
@@ -0,0 +1,153 @@
+import hashlib
+from pathlib import Path
+import shutil
+import subprocess
+import tarfile
+from typing import Any, Dict, List
+from urllib.parse import unquote, urlparse
+from urllib.request import urlopen
+
+from .utils import atomic_write, file_lock
+
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar.xz', '.tar.bz2', '.tar')
+
+# multi-threaded decompressors to use when they're installed (by archive suffix)
+_PARALLEL_DECOMPRESSORS = {
+    '.tar.gz': [['pigz', '-dc']],
+    '.tgz': [['pigz', '-dc']],
+    '.tar.xz': [['xz', '-T0', '-dc']],
+    '.tar.bz2': [['lbzip2', '-dc'], ['pbzip2', '-dc']],
+}
+
+def is_archive_url(url:str) -> bool:
+    return url.endswith(ARCHIVE_SUFFIXES)
+
+def _archive_suffix(name:str) -> str:
+    return next(s for s in ARCHIVE_SUFFIXES if name.endswith(s))
+
+def _local_path(url:str) -> Path:
+    '''Returns the local path for file:// URLs and plain paths, None for anything else'''
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        return Path(unquote(parsed.path))
+    return Path(url) if not parsed.scheme else None
+
+def _sha256(path:Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024*1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+def extract_archive(archive:Path, dest:Path):
+    '''
+    Extracts the tar archive into dest, streaming it through a multi-threaded
+    decompressor when one is installed (otherwise tarfile decompresses it)
+    '''
+    suffix = _archive_suffix(archive.name)
+    decompressor = next((cmd for cmd in _PARALLEL_DECOMPRESSORS.get(suffix, []) if shutil.which(cmd[0])), None)
+    # the 'tar' filter keeps permissions (configure scripts need +x) but refuses
+    # members outside dest, like GNU tar does
+    extract_args = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+    if decompressor:
+        p = subprocess.Popen([*decompressor, str(archive)], stdout=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=p.stdout, mode='r|') as tar:
+                tar.extractall(dest, **extract_args)
+        finally:
+            p.stdout.close()
+            if p.wait() != 0:
+                raise Exception(f'{decompressor[0]} failed to decompress {archive} [return code {p.returncode}]')
+    else:
+        with tarfile.open(archive, mode='r|*') as tar:
+            tar.extractall(dest, **extract_args)
+
+class ArchiveCache:
+    '''
+    Host-wide cache of downloaded source archives (~/.wildebeest/archives), so
+    archive-based recipes are only downloaded once per host.
+
+    Archives with a known checksum (see checksums) are verified when they are
+    downloaded, before they go into the cache, and a mismatch is an error. Each
+    cached archive has a .sha256 file written when it was downloaded, and is
+    verified against it before it is used (a corrupt/truncated archive is simply
+    downloaded again). Without a known checksum this only catches corruption after
+    the download, not a truncated or tampered download.
+
+    Archives are looked up in the mirror folder (if given) before
+    being downloaded, so experiments can be recreated offline from a local copy
+    of the archives. file:// remotes are copied from the local path.
+    '''
+    def __init__(self, cache_dir:Path=None, mirror:str=None, checksums:Dict[str,str]=None) -> None:
+        '''
+        cache_dir: The cache folder (defaults to ~/.wildebeest/archives)
+        mirror: Local folder (or file:// URL) holding archives by file name, which
+                is checked before downloading
+        checksums: Expected sha256 (hex) of archives, by URL or archive file name
+        '''
+        self.cache_dir = cache_dir if cache_dir else Path.home()/'.wildebeest'/'archives'
+        self.mirror = _local_path(mirror) if mirror else None
+        self.checksums = {k: v.lower() for k, v in checksums.items()} if checksums else {}
+
+    @staticmethod
+    def from_params(params:Dict[str,Any]) -> 'ArchiveCache':
+        '''Returns the cache configured by these experiment params (archive_mirror, archive_sha256)'''
+        return ArchiveCache(mirror=params.get('archive_mirror', None), checksums=params.get('archive_sha256', None))
+
+    def expected_sha256(self, url:str) -> str:
+        '''The known sha256 of this archive, or None if we don't have one'''
+        name = url.rstrip('/').split('/')[-1]
+        return self.checksums.get(url, self.checksums.get(name))
+
+    def archive_path(self, url:str) -> Path:
+        name = url.rstrip('/').split('/')[-1]
+        return self.cache_dir/f'{hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]}-{name}'
+
+    def _download(self, url:str, path:Path, log:List[str]):
+        name = url.rstrip('/').split('/')[-1]
+        mirrored = self.mirror/name if self.mirror else None
+        local = _local_path(url)
+        source = mirrored if mirrored and mirrored.exists() else local
+
+        tmp = path.with_name(f'{path.name}.part')
+        if source:
+            log.append(f'Copying {source} into the archive cache\n')
+            shutil.copyfile(source, tmp)
+        else:
+            log.append(f'Downloading {url} into the archive cache\n')
+            with urlopen(url) as response, open(tmp, 'wb') as f:
+                shutil.copyfileobj(response, f, 1024*1024)
+
+        checksum = _sha256(tmp)
+        expected = self.expected_sha256(url)
+        if expected and checksum != expected:
+            tmp.unlink()
+            raise Exception(f'Archive {url} failed checksum verification (expected sha256 {expected}, got {checksum})')
+        tmp.rename(path)
+        atomic_write(path.with_name(f'{path.name}.sha256'), checksum, fsync=False)
+
+    def fetch(self, url:str, log:List[str]=None) -> Path:
+        '''
+        Returns the path of the verified, cached archive for url, downloading it
+        (or copying it from the mirror) if needed
+
+        log: Progress messages are appended here (they're printed if not given)
+        '''
+        messages = log if log is not None else []
+        path = self.archive_path(url)
+        checksum_file = path.with_name(f'{path.name}.sha256')
+        expected = self.expected_sha256(url)
+        with file_lock(path):
+            if path.exists() and checksum_file.exists():
+                recorded = checksum_file.read_text().strip()
+                if expected and recorded != expected:
+                    messages.append(f'Cached archive {path} does not have the expected checksum, downloading it again\n')
+                elif _sha256(path) == recorded:
+                    return path
+                else:
+                    messages.append(f'Cached archive {path} is corrupt, downloading it again\n')
+            self._download(url, path, messages)
+
+        if log is None:
+            print(''.join(messages), end='')
+        return path
@@ -1,4 +1,3 @@
-from importlib import metadata
 from os import environ
 import subprocess
 from typing import Any, Callable, Dict, List
@@ -156,6 +155,7 @@ class BuildSystemDriverFactory:
         Loads all BuildSystemDrivers that may be found from the
         wildebeest.build_system_drivers entry point
         '''
+        from importlib import metadata      # (slow to import)
         driver_dict = {}
         driver_eps = metadata.entry_points()['wildebeest.build_system_drivers']
         for ep in driver_eps:
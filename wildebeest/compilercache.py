@@ -0,0 +1,388 @@
+from collections import Counter
+import hashlib
+import os
+from pathlib import Path
+import random
+import re
+import shutil
+import subprocess
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+from .scheduling import format_mem_size, parse_mem_size
+from .utils import file_lock
+
+_CACHE_VERSION = 1
+
+DEFAULT_CC_CACHE_SIZE = '10G'
+'''Max total size of the compiler cache before the least recently used entries are removed'''
+
+CC_CACHE_ENV = 'WDB_CC_CACHE'
+CC_CACHE_SIZE_ENV = 'WDB_CC_CACHE_SIZE'
+CC_CACHE_STATS_ENV = 'WDB_CC_CACHE_STATS'
+CC_CACHE_BASE_DIRS_ENV = 'WDB_CC_CACHE_BASE_DIRS'
+
+STATS_FILENAME = '.wdb_cc_cache_stats'
+
+SOURCE_SUFFIXES = ('.c', '.cc', '.cp', '.cpp', '.cxx', '.c++', '.C', '.CPP', '.i', '.ii')
+
+# options whose value is the next argument
+_OPTIONS_WITH_VALUE = {'-o', '-I', '-D', '-U', '-include', '-imacros', '-isystem', '-idirafter',
+    '-iquote', '-iprefix', '-iwithprefix', '-iwithprefixbefore', '-isysroot', '-MF', '-MT', '-MQ',
+    '-Xlinker', '-Xassembler', '-Xpreprocessor', '-Xclang', '-L', '-l', '-aux-info', '--param',
+    '-arch', '-target', '--sysroot', '-T', '-u', '-z'}
+
+# dependency file options we drop when preprocessing (-MF etc. take a value)
+_DEP_OPTIONS = {'-MD', '-MMD', '-MP'}
+_DEP_OPTIONS_WITH_VALUE = {'-MF', '-MT', '-MQ'}
+
+def _is_uncacheable(arg:str) -> bool:
+    '''True for args that mean we can't cache the compile (other outputs, or inputs we can't hash)'''
+    return (arg in ('-E', '-S', '-M', '-MM', '-', '--coverage', '-ftest-coverage', '-x', '-load', '-add-plugin')
+            or arg.startswith(('@', '-save-temps', '-fprofile-', '-fplugin', '-fdump-', '-specs',
+                               '-fcallgraph-info', '-fstack-usage', '-Wl,', '-MJ')))
+
+def parse_compile_args(args:List[str]) -> Tuple[str,str,str]:
+    '''
+    Returns (source, object file, dependency file or None) for a cacheable compile
+    (a single source file compiled with -c), or None if these args aren't one
+    '''
+    if '-c' not in args or any(_is_uncacheable(a) for a in args):
+        return None
+    sources = []
+    output = None
+    depfile = None
+    write_deps = False
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in _OPTIONS_WITH_VALUE:
+            if i + 1 >= len(args):
+                return None
+            if arg == '-o':
+                output = args[i+1]
+            elif arg == '-MF':
+                depfile = args[i+1]
+            i += 2
+            continue
+        if arg.startswith('-o') and len(arg) > 2:
+            output = arg[2:]
+        elif arg.startswith('-MF') and len(arg) > 3:
+            depfile = arg[3:]
+        elif arg in ('-MD', '-MMD'):
+            write_deps = True
+        elif not arg.startswith('-'):
+            if not arg.endswith(SOURCE_SUFFIXES):
+                return None     # (object files, libraries... this isn't a plain compile)
+            sources.append(arg)
+        i += 1
+
+    if len(sources) != 1:
+        return None
+    source = sources[0]
+    if output is None:
+        output = Path(source).with_suffix('.o').name
+    if not write_deps:
+        depfile = None
+    elif depfile is None:
+        # gcc/clang put it next to the object file
+        depfile = str(Path(output).with_suffix('.d'))
+    return (source, output, depfile)
+
+def preprocess_args(args:List[str]) -> List[str]:
+    '''Converts the args of a cacheable compile into the args that preprocess it to stdout'''
+    pp_args = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ('-o', *_DEP_OPTIONS_WITH_VALUE):
+            skip = True
+        elif arg == '-c' or arg in _DEP_OPTIONS or arg.startswith(('-o', '-MF', '-MT', '-MQ')):
+            continue
+        else:
+            pp_args.append(arg)
+    return [*pp_args, '-E']
+
+def read_cache_stats(stats_file:Path) -> Dict[str,int]:
+    '''Counts the hit/miss/uncacheable lines the cc_wrapper appended to stats_file'''
+    counts = Counter({'hit': 0, 'miss': 0, 'uncacheable': 0})
+    if stats_file.exists():
+        counts.update(stats_file.read_text().split())
+    return dict(counts)
+
+def format_cache_stats(stats:Dict[str,int]) -> str:
+    cacheable = stats['hit'] + stats['miss']
+    hit_rate = f'{stats["hit"]/cacheable*100:.1f}%' if cacheable else 'n/a'
+    return f'{stats["hit"]} hits, {stats["miss"]} misses, {stats["uncacheable"]} uncacheable (hit rate {hit_rate})'
+
+class CompilerCache:
+    '''
+    Host-wide cache of compiled object files (~/.wildebeest/cc_cache, which is also
+    mounted into run containers), so rebuilding the same project with the same
+    RunConfig doesn't compile everything again - in this or any other experiment.
+
+    The cc_wrapper looks each compile up by a hash of:
+        - the compiler (path, size and mtime)
+        - its final arguments (after the optimization flags were filtered and
+          OPT_LEVEL put in front), except where the object and dependency files go
+          (the dependency file targets do count, since they're written into it)
+        - the filtered CFLAGS/CXXFLAGS
+        - the preprocessed source (linemarkers and all, so the paths of the source
+          and headers count as well as their contents)
+        - the working directory if debug info is being generated (it is embedded
+          in the debug info)
+
+    By default the cache doesn't change what gets built: the compiler arguments are
+    left alone and all paths are hashed as-is. Since every run builds in its own
+    folder and the paths end up in the debug info, that means hits only happen
+    when the same build folder is rebuilt (e.g. rerunning a run).
+
+    With relocatable set (the cc_cache_relocatable param), paths under the base dirs
+    (the run's build folder and the project source folder) are hashed relative to
+    them, like ccache's base_dir, so runs and experiments share entries. This DOES
+    change the binaries: every compile (cached or not) gets -fdebug-prefix-map and
+    -fmacro-prefix-map options that map the build folder to . and the source folder
+    to its path relative to that, so DW_AT_comp_dir/DW_AT_name and __FILE__ hold
+    relative paths (e.g. ../../../source/proj/a.c) instead of absolute ones. This
+    needs gcc 8+ or clang 10+. Cached dependency files and warnings have the base
+    dirs replaced by placeholders, which are filled back in on a hit.
+
+    Only plain compiles of a single source file to an object file (-c) are cached,
+    along with their dependency file and compiler warnings. Anything with other
+    side outputs (profiling, coverage, clang plugins...) always runs the compiler.
+
+    Entries are written with a rename, so concurrent builds can share the cache.
+    Once the cache is bigger than max_size the least recently used entries are
+    removed (checked every so often by the wrapper, not on every compile).
+    '''
+    CLEANUP_PERIOD = 100
+    '''The wrapper checks the cache size after about this many stores'''
+
+    def __init__(self, cache_dir:Path=None, max_size:int=None, relocatable:bool=False, base_dirs:List[str]=None) -> None:
+        '''
+        cache_dir: The cache folder (defaults to ~/.wildebeest/cc_cache)
+        max_size: Max total size of the cache in bytes (defaults to DEFAULT_CC_CACHE_SIZE)
+        relocatable: Make paths under the build's base dirs relative, in the cache keys
+                     AND the objects (see CompilerCache)
+        base_dirs: The base dirs of the build being compiled, if relocatable (the build
+                   folder first, its path is mapped to .)
+        '''
+        self.cache_dir = cache_dir if cache_dir else Path.home()/'.wildebeest'/'cc_cache'
+        self.max_size = max_size if max_size is not None else parse_mem_size(DEFAULT_CC_CACHE_SIZE)
+        self.relocatable = relocatable
+        self.base_dirs = [os.path.abspath(d) for d in base_dirs] if relocatable and base_dirs else []
+        # longest first, so nested base dirs get the most specific placeholder
+        # (and not in the middle of a folder name, e.g. run1 in run10)
+        self._base_patterns = [(re.compile(re.escape(d) + r'(?![\w.+~-])'), f'@WDB_BASE{i}@', d)
+                               for i, d in sorted(enumerate(self.base_dirs), key=lambda x: -len(x[1]))]
+
+    @staticmethod
+    def from_params(params:Dict[str,Any]) -> 'CompilerCache':
+        '''Returns the cache configured by these experiment params, or None if cc_cache isn't enabled'''
+        if not params.get('cc_cache', False):
+            return None
+        return CompilerCache(max_size=parse_mem_size(params.get('cc_cache_size', DEFAULT_CC_CACHE_SIZE)),
+                             relocatable=params.get('cc_cache_relocatable', False))
+
+    @staticmethod
+    def from_env() -> 'CompilerCache':
+        '''Returns the cache the build step enabled for the cc_wrapper, or None if it isn't enabled'''
+        if CC_CACHE_ENV not in os.environ:
+            return None
+        # (only set for relocatable caches)
+        base_dirs = [d for d in os.environ.get(CC_CACHE_BASE_DIRS_ENV, '').split(os.pathsep) if d]
+        return CompilerCache(Path(os.environ[CC_CACHE_ENV]), int(os.environ[CC_CACHE_SIZE_ENV]), bool(base_dirs), base_dirs)
+
+    def build_env(self, stats_file:Path, base_dirs:List[Path]) -> Dict[str,str]:
+        '''
+        Environment variables that enable the cache in the cc_wrapper
+
+        stats_file: The wrapper counts hits/misses in this file
+        base_dirs: The build folder, then any other folders (e.g. the source folder)
+                   whose paths are made relative if the cache is relocatable
+        '''
+        return {
+            CC_CACHE_ENV: str(self.cache_dir),
+            CC_CACHE_SIZE_ENV: str(self.max_size),
+            CC_CACHE_STATS_ENV: str(stats_file),
+            CC_CACHE_BASE_DIRS_ENV: os.pathsep.join(str(d) for d in base_dirs) if self.relocatable else '',
+        }
+
+    def entry_path(self, key:str) -> Path:
+        return self.cache_dir/key[:2]/key
+
+    def prefix_map_args(self) -> List[str]:
+        '''Compiler options that map the base dirs to relative paths in the objects (if relocatable)'''
+        if not self.base_dirs:
+            return []
+        build_folder = self.base_dirs[0]
+        args = []
+        for d in self.base_dirs:
+            mapped = os.path.relpath(d, build_folder)
+            args.extend([f'-fdebug-prefix-map={d}={mapped}', f'-fmacro-prefix-map={d}={mapped}'])
+        return args
+
+    def normalize(self, text:str) -> str:
+        '''Replaces the base dirs in text with placeholders'''
+        for pattern, placeholder, _ in self._base_patterns:
+            text = pattern.sub(placeholder, text)
+        return text
+
+    def denormalize(self, text:str) -> str:
+        '''Replaces the placeholders in text with our base dirs'''
+        for _, placeholder, d in self._base_patterns:
+            text = text.replace(placeholder, d)
+        return text
+
+    def _normalize_bytes(self, data:bytes) -> bytes:
+        return self.normalize(data.decode('utf-8', 'surrogateescape')).encode('utf-8', 'surrogateescape')
+
+    def _denormalize_bytes(self, data:bytes) -> bytes:
+        return self.denormalize(data.decode('utf-8', 'surrogateescape')).encode('utf-8', 'surrogateescape')
+
+    def compute_key(self, compiler:str, args:List[str], flags:str, preprocessed:bytes, depfile:str=None) -> str:
+        '''
+        Hashes everything that determines the outputs of this compile (see CompilerCache)
+
+        depfile: The dependency file this compile writes, if any
+        '''
+        h = hashlib.sha256()
+        st = os.stat(compiler)
+        h.update(f'{_CACHE_VERSION}\0{compiler}\0{st.st_size}\0{st.st_mtime_ns}\0{self.normalize(flags)}\0'.encode('utf-8'))
+        skip = False
+        has_targets = False
+        for arg in args:
+            if skip:
+                skip = False
+                continue
+            if arg in ('-o', '-MF'):
+                skip = True     # (where the outputs go doesn't change them)
+            elif not arg.startswith(('-o', '-MF')):
+                has_targets = has_targets or arg.startswith(('-MT', '-MQ'))
+                h.update(self.normalize(arg).encode('utf-8') + b'\0')
+        if depfile and not has_targets:
+            # the object file is the dependency file's target
+            output = parse_compile_args(args)[1]
+            h.update(f'target={self.normalize(output)}\0'.encode('utf-8'))
+        if any(a.startswith('-g') and a != '-g0' for a in args):
+            h.update(f'cwd={self.normalize(os.getcwd())}\0'.encode('utf-8'))
+        if self._base_patterns:
+            # (only in the linemarkers - anything else with a path in it is part of the code)
+            preprocessed = re.sub(rb'^#(?: line)? \d+ "[^\n]*', lambda m: self._normalize_bytes(m.group(0)),
+                                  preprocessed, flags=re.MULTILINE)
+        h.update(preprocessed)
+        return h.hexdigest()
+
+    @staticmethod
+    def _record(outcome:str):
+        stats_file = os.environ.get(CC_CACHE_STATS_ENV)
+        if stats_file:
+            # O_APPEND writes this small are atomic, so parallel compiles don't need a lock
+            fd = os.open(stats_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, f'{outcome}\n'.encode('utf-8'))
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _write_out(data:bytes, dst:str):
+        tmp = f'{dst}.wdb_tmp{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, dst)
+
+    def _store(self, entry:Path, output:str, depfile:str, stderr:bytes):
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f'{entry.name}.tmp{os.getpid()}')
+        # the .o goes last: it's what marks the entry complete
+        tmp.write_bytes(self._normalize_bytes(stderr))
+        os.replace(tmp, entry.with_name(f'{entry.name}.stderr'))
+        if depfile:
+            tmp.write_bytes(self._normalize_bytes(Path(depfile).read_bytes()))
+            os.replace(tmp, entry.with_name(f'{entry.name}.d'))
+        shutil.copyfile(output, tmp)
+        os.replace(tmp, entry.with_name(f'{entry.name}.o'))
+
+    def compile(self, compiler:str, args:List[str], flags:str, run_compiler:Callable[..., subprocess.CompletedProcess]) -> int:
+        '''
+        Runs the compile through the cache, returning the compiler's return code
+
+        compiler: Full path to the compiler
+        args: The final compiler arguments
+        flags: The (filtered) CFLAGS/CXXFLAGS the compiler will see
+        run_compiler: Runs the compiler with the given args (and subprocess.run kwargs)
+        '''
+        # (if relocatable, every compile gets these so objects don't depend on whether they were cached)
+        args = [*args, *self.prefix_map_args()]
+        parsed = parse_compile_args(args)
+        if parsed is None:
+            self._record('uncacheable')
+            return run_compiler(args).returncode
+        _, output, depfile = parsed
+
+        pp = run_compiler(preprocess_args(args), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if pp.returncode != 0:
+            # let the real compile report the error
+            self._record('uncacheable')
+            return run_compiler(args).returncode
+
+        entry = self.entry_path(self.compute_key(compiler, args, flags, pp.stdout, depfile))
+        obj = entry.with_name(f'{entry.name}.o')
+        if obj.exists():
+            try:
+                if depfile:
+                    self._write_out(self._denormalize_bytes(entry.with_name(f'{entry.name}.d').read_bytes()), depfile)
+                self._write_out(obj.read_bytes(), output)
+                sys.stderr.buffer.write(self._denormalize_bytes(entry.with_name(f'{entry.name}.stderr').read_bytes()))
+                sys.stderr.flush()
+                os.utime(obj)   # (for LRU cleanup)
+                self._record('hit')
+                return 0
+            except FileNotFoundError:
+                pass    # removed by a cleanup, just compile it
+
+        p = run_compiler(args, stderr=subprocess.PIPE)
+        sys.stderr.buffer.write(p.stderr)
+        sys.stderr.flush()
+        self._record('miss')
+        if p.returncode == 0 and os.path.exists(output) and (not depfile or os.path.exists(depfile)):
+            try:
+                self._store(entry, output, depfile, p.stderr)
+                if random.randrange(self.CLEANUP_PERIOD) == 0:
+                    self.cleanup()
+            except OSError as e:
+                print(f'Warning: failed to store {output} in the compiler cache: {e}', file=sys.stderr)
+        return p.returncode
+
+    def size(self) -> int:
+        return sum(f.stat().st_size for f in self.cache_dir.glob('*/*') if f.is_file())
+
+    def cleanup(self):
+        '''Removes the least recently used entries until the cache fits in max_size'''
+        try:
+            with file_lock(self.cache_dir/'cleanup', blocking=False):
+                entries = {}    # entry -> [mtime of its .o, total size]
+                for f in self.cache_dir.glob('*/*'):
+                    try:
+                        st = f.stat()
+                    except FileNotFoundError:
+                        continue
+                    e = entries.setdefault(f.with_suffix(''), [0, 0])
+                    e[1] += st.st_size
+                    if f.suffix == '.o':
+                        e[0] = st.st_mtime
+                total = sum(size for _, size in entries.values())
+                if total <= self.max_size:
+                    return
+                # leave some room, so we don't clean up again right away
+                target = self.max_size*0.8
+                for entry, (_, size) in sorted(entries.items(), key=lambda e: e[1][0]):
+                    if total <= target:
+                        break
+                    for suffix in ('.o', '.d', '.stderr'):
+                        entry.with_name(f'{entry.name}{suffix}').unlink(missing_ok=True)
+                    total -= size
+                print(f'Cleaned up the compiler cache to {format_mem_size(total)}', file=sys.stderr)
+        except BlockingIOError:
+            pass    # someone else is already cleaning up
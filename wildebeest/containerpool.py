@@ -0,0 +1,199 @@
+from datetime import datetime
+import getpass
+import hashlib
+from pathlib import Path
+import subprocess
+from typing import Any, Dict, List, TYPE_CHECKING
+
+from .utils import file_lock, load_from_yaml, save_to_yaml
+
+if TYPE_CHECKING:
+    # avoid cyclic dependencies this way
+    from .run import Run
+
+DEFAULT_POOL_SIZE = 4
+'''Max number of idle containers kept warm per recipe image'''
+
+POOL_CONTAINER_PREFIX = 'wdbpool'
+
+def _docker(*args:str) -> subprocess.CompletedProcess:
+    return subprocess.run(['docker', *args], capture_output=True)
+
+def _run_image(run:'Run') -> str:
+    from .defaultbuildalgorithm import get_recipe_docker_imagename
+    return get_recipe_docker_imagename(run.experiment, run.build.recipe)
+
+def _pool_key(run:'Run') -> str:
+    '''
+    Containers can only be shared by runs with the same image and bind mounts
+    (the mounts only depend on the experiment folder)
+    '''
+    return f'{_run_image(run)}:{run.exp_root}'
+
+def _lease_owner(run:'Run') -> str:
+    # this is the run's unique (non-pooled) container name
+    return f'{run.workload_id}_run{run.number}'
+
+class ContainerPool:
+    '''
+    Keeps docker containers warm between runs so runs of the same recipe image
+    don't each pay for container create/start/teardown (and start with cold
+    filesystem caches).
+
+    A run leases a container in docker_init and its docker phases are exec'd
+    into it like before (each phase still uses its own working directory via
+    docker exec -w). docker_cleanup returns the container to the pool instead of
+    removing it, and at most max_idle idle containers are kept per image. When a
+    docker phase fails the job runner discards the run's container instead (we
+    don't know what the failed phase left running in it).
+
+    The pool is shared by every wdb process for this user, so its state lives
+    in ~/.wildebeest/containers.yaml and is only touched under a file_lock.
+    '''
+    def __init__(self, max_idle:int=DEFAULT_POOL_SIZE, state_file:Path=None) -> None:
+        '''
+        max_idle: Max number of idle containers to keep per image (extras are removed)
+        state_file: Pool state file (defaults to ~/.wildebeest/containers.yaml)
+        '''
+        self.max_idle = max_idle
+        self.state_file = state_file if state_file else Path.home()/'.wildebeest'/'containers.yaml'
+
+    def _load(self) -> Dict[str,Dict[str,Any]]:
+        '''Maps container name -> {key, image, lease, last_used}'''
+        if not self.state_file.exists():
+            return {}
+        containers = load_from_yaml(self.state_file)
+        return containers if containers else {}
+
+    def _save(self, containers:Dict[str,Dict[str,Any]]):
+        save_to_yaml(containers, self.state_file)
+
+    def _new_name(self, key:str, containers:Dict[str,Dict[str,Any]]) -> str:
+        prefix = f'{POOL_CONTAINER_PREFIX}_{hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]}'
+        i = 0
+        while f'{prefix}_{i}' in containers:
+            i += 1
+        return f'{prefix}_{i}'
+
+    def lease(self, run:'Run', keep_state:bool=False) -> str:
+        '''
+        Leases a healthy, running container for this run (creating one if no idle
+        container of its image is available) and returns its name. A run that
+        already holds a lease gets the same container back.
+
+        keep_state: Don't reset the container if the run already holds it (e.g. when
+                    resuming the run in a later docker phase)
+        '''
+        key = _pool_key(run)
+        owner = _lease_owner(run)
+
+        while True:
+            with file_lock(self.state_file):
+                containers = self._load()
+                name = next((n for n, c in containers.items() if c['lease'] == owner), None)
+                held = name is not None
+                if name is None:
+                    idle = sorted([n for n, c in containers.items() if c['key'] == key and not c['lease']],
+                                  key=lambda n: containers[n]['last_used'], reverse=True)   # warmest first
+                    name = idle[0] if idle else None
+                    if name is None:
+                        name = self._new_name(key, containers)
+                        containers[name] = {'key': key, 'image': _run_image(run), 'last_used': datetime.now()}
+                containers[name]['lease'] = owner
+                self._save(containers)
+
+            # don't hold the lock while we talk to docker, other jobs are leasing too
+            try:
+                healthy = self._ensure_healthy(name, run, reset=not (held and keep_state))
+            except:
+                self.discard(name)
+                raise
+            if healthy:
+                return name
+
+            print(f'Pooled container {name} is unhealthy, removing it')
+            self.discard(name)
+
+    def _ensure_healthy(self, name:str, run:'Run', reset:bool=True) -> bool:
+        '''Makes sure the container exists, is running, and (if reset) is reset for a new run'''
+        from .defaultbuildalgorithm import docker_run
+
+        p = _docker('container', 'inspect', '-f', '{{.State.Running}}', name)
+        if p.returncode != 0:
+            docker_run(run, name)
+        elif p.stdout.decode('utf-8').strip() != 'true':
+            if _docker('start', name).returncode != 0:
+                return False
+
+        # health check + clear out the per-run state the last run left behind (install_cc_wrapper)
+        cmd = 'rm -f /wrapper_bin/* ~/cc_path.txt ~/cxx_path.txt; true' if reset else 'true'
+        p = _docker('exec', '--user', getpass.getuser(), name, 'sh', '-c', cmd)
+        return p.returncode == 0
+
+    def release(self, run:'Run'):
+        '''
+        Returns this run's container to the pool, removing the least recently
+        used idle containers of its image beyond max_idle
+        '''
+        owner = _lease_owner(run)
+        to_remove = []
+        with file_lock(self.state_file):
+            containers = self._load()
+            for name, c in containers.items():
+                if c['lease'] == owner:
+                    c['lease'] = None
+                    c['last_used'] = datetime.now()
+                    key = c['key']
+                    idle = sorted([n for n, x in containers.items() if x['key'] == key and not x['lease']],
+                                  key=lambda n: containers[n]['last_used'], reverse=True)
+                    to_remove = idle[self.max_idle:]
+                    break
+            for name in to_remove:
+                containers.pop(name)
+            self._save(containers)
+
+        for name in to_remove:
+            _docker('rm', '-f', name)
+
+    def discard_lease(self, run:'Run') -> str:
+        '''
+        Removes the container leased to this run from docker and the pool (e.g. after
+        a docker phase failed in it), returning its name (None if it held no lease)
+        '''
+        owner = _lease_owner(run)
+        with file_lock(self.state_file, shared=True):
+            name = next((n for n, c in self._load().items() if c['lease'] == owner), None)
+        if name:
+            self.discard(name)
+        return name
+
+    def discard(self, name:str):
+        '''Removes this container from docker and the pool'''
+        with file_lock(self.state_file):
+            containers = self._load()
+            containers.pop(name, None)
+            self._save(containers)
+        _docker('rm', '-f', name)
+
+    def containers(self, image:str=None) -> Dict[str,Dict[str,Any]]:
+        '''Returns the pooled containers (optionally only those for this image)'''
+        with file_lock(self.state_file, shared=True):
+            containers = self._load()
+        return {n: c for n, c in containers.items() if image is None or c['image'] == image}
+
+    def remove_containers(self, images:List[str], include_leased:bool=False) -> List[str]:
+        '''
+        Removes the pooled containers for these images, returning their names.
+        Leased containers are skipped unless include_leased is set (leases are
+        left behind when a job is killed or fails inside its container)
+        '''
+        with file_lock(self.state_file):
+            containers = self._load()
+            names = [n for n, c in containers.items() if c['image'] in images and (include_leased or not c['lease'])]
+            for name in names:
+                containers.pop(name)
+            self._save(containers)
+
+        for name in names:
+            _docker('rm', '-f', name)
+        return names
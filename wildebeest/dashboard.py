@@ -0,0 +1,243 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from rich.console import Group
+from rich.live import Live
+from rich.progress_bar import ProgressBar
+from rich.table import Table
+from rich.text import Text
+from typing import Dict, List, Tuple
+
+from .experiment import Experiment
+from .experimentpaths import ExpRelPaths
+from .jobrunner import JobRelPaths
+from .run import Run, RunStatus
+from .scheduling import RunHistory
+from .statuscache import FolderWatcher, RunStatusCache
+
+run_formats = {
+    RunStatus.RUNNING: 'bold cyan',
+    RunStatus.READY: '',
+    RunStatus.FAILED: 'bold red',
+    RunStatus.FINISHED: 'bold green',
+}
+
+def calc_inprogress_runtime(r:'Run') -> Tuple[timedelta, timedelta]:
+    now = datetime.now()
+    totalrt = now - r.starttime
+    totalrt = timedelta(days=totalrt.days, seconds=totalrt.seconds)    # remove subsecond precision
+    steprt = now - r.step_starttimes[r.current_step]
+    steprt = timedelta(days=steprt.days, seconds=steprt.seconds)
+    return steprt, totalrt
+
+def calc_total_completed_runtime(r:'Run', step_rt:timedelta=None) -> timedelta:
+    '''
+    step_rt: In-progress step runtime, if applicable
+    '''
+    all_runtimes = list(r.step_runtimes.values())
+    if step_rt:
+        all_runtimes.append(step_rt)
+    all_steps_rt = all_runtimes[0] if all_runtimes else timedelta(days=0, seconds=0)
+    for x in all_runtimes[1:]:
+        all_steps_rt += x
+    all_steps_rt = timedelta(days=all_steps_rt.days, seconds=all_steps_rt.seconds)  # remove subsecond precision
+
+    return all_steps_rt
+
+def _whole_seconds(td:timedelta) -> timedelta:
+    return timedelta(days=td.days, seconds=td.seconds)
+
+def dashboard_exp_folders(exp_parent_folder:Path) -> List[Path]:
+    '''The experiment folders shown for exp_parent_folder (which may be an experiment itself)'''
+    if Experiment.is_exp_folder(exp_parent_folder):
+        return [exp_parent_folder]
+    return sorted([x for x in exp_parent_folder.iterdir() if Experiment.is_exp_folder(x)])
+
+def estimate_remaining_runtime(exp:Experiment, runs:List[Run], history:RunHistory) -> Tuple[timedelta, int]:
+    '''
+    Estimates the total (serial) runtime left for the unfinished runs from the historical
+    runtimes of their remaining steps. Runs with no history count as the average of
+    the others.
+
+    Returns the estimate and the number of runs that had no history
+    '''
+    step_names = [s.name for s in exp.algorithm.steps]
+    estimates = []
+    for r in runs:
+        if r.status == RunStatus.RUNNING and r.current_step in step_names:
+            idx = step_names.index(r.current_step)
+            current = history.runtime(r, [r.current_step])
+            later = history.runtime(r, step_names[idx+1:]) if idx+1 < len(step_names) else timedelta()
+            if current is None and later is None:
+                estimates.append(None)
+                continue
+            elapsed = datetime.now() - r.step_starttimes.get(r.current_step, datetime.now())
+            current_left = max(current - elapsed, timedelta()) if current is not None else timedelta()
+            estimates.append(current_left + (later if later is not None else timedelta()))
+        elif r.status == RunStatus.READY:
+            estimates.append(history.runtime(r, step_names))
+
+    known = [e for e in estimates if e is not None]
+    mean = sum(known, timedelta())/len(known) if known else timedelta()
+    return sum([e if e is not None else mean for e in estimates], timedelta()), estimates.count(None)
+
+class _DashboardExp:
+    '''One experiment on the dashboard: its runs (via a RunStatusCache) and cached table rows'''
+    def __init__(self, folder:Path) -> None:
+        self.folder = folder
+        self.yaml_mtime = None
+        self.cache:RunStatusCache = None
+        self.rows:Dict[int,Tuple[Run,list,str]] = {}
+        '''Run number -> (the Run the row was built from, cells, style)'''
+        self.reload_exp()
+
+    @property
+    def exp(self) -> Experiment:
+        return self.cache.exp
+
+    def reload_exp(self):
+        '''Reloads the experiment if exp.yaml changed (e.g. a new wdb run started)'''
+        mtime = (self.folder/ExpRelPaths.ExpYaml).stat().st_mtime_ns
+        if mtime != self.yaml_mtime:
+            self.cache = RunStatusCache(Experiment.load_exp_from_yaml(self.folder))
+            self.yaml_mtime = mtime
+            self.rows = {}
+
+class Dashboard:
+    '''
+    Status table for all experiments in a folder (or a single experiment). The table
+    rows of runs that aren't running are only rebuilt when their runstate changes,
+    and run_live() keeps it on screen, re-rendering as runstate/job files change.
+    '''
+    def __init__(self, exp_parent_folder:Path, running_only:bool=False, run_numbers:List[int]=None) -> None:
+        self.exp_parent_folder = exp_parent_folder
+        self.running_only = running_only
+        self.run_numbers = run_numbers
+        self._exps:Dict[Path,_DashboardExp] = {}
+        self._runs:Dict[Path,List[Run]] = {}
+
+    @property
+    def num_running(self) -> int:
+        return sum(1 for runs in self._runs.values() for r in runs if r.status == RunStatus.RUNNING)
+
+    def refresh(self):
+        '''Picks up added/removed experiments and reloads any runs that changed'''
+        folders = dashboard_exp_folders(self.exp_parent_folder)
+        self._exps = {f: self._exps[f] if f in self._exps else _DashboardExp(f) for f in folders}
+        self._runs = {}
+        for folder, dexp in self._exps.items():
+            dexp.reload_exp()
+            # (we need all runs for the throughput numbers, even if only showing running ones)
+            self._runs[folder] = dexp.cache.load_runs()
+
+    def watched_folders(self) -> List[Path]:
+        folders = [self.exp_parent_folder]
+        for folder, dexp in self._exps.items():
+            # runstate files, or exp.yaml and the state db (and its WAL) in .wildebeest
+            folders.extend([folder/ExpRelPaths.Runstates, folder/ExpRelPaths.Wdb])
+            if dexp.exp.workload_folder:
+                folders.append(dexp.exp.workload_folder/JobRelPaths.Jobs)
+        return folders
+
+    def _row(self, dexp:_DashboardExp, r:Run, folder_name:str) -> Tuple[list,str]:
+        exp = dexp.exp
+        cached = dexp.rows.get(r.number)
+        if cached and cached[0] is r and r.status != RunStatus.RUNNING:
+            return cached[1], cached[2]     # unchanged (running rows tick, so always rebuild those)
+
+        fmt = run_formats[r.status]
+        if r.status == RunStatus.RUNNING:
+            step_rt, run_runtime = calc_inprogress_runtime(r)
+        else:
+            step_rt = '--'
+            run_runtime = r.runtime
+        step_num = exp.algorithm.get_index_of_step(r.current_step)+1 if r.current_step else 1
+        num_steps = len(exp.algorithm.steps)
+        done_steps = step_num if r.status == RunStatus.FINISHED else step_num-1
+        step_prog = Table.grid(padding=(0, 1))
+        step_prog.add_row(ProgressBar(total=num_steps, completed=done_steps, width=10), f'{step_num}/{num_steps}')
+        step_color = '[yellow]' if r.status == RunStatus.RUNNING else ''
+        overall_rt_color = '[blue]' if r.status == RunStatus.RUNNING else ''
+
+        overall_rt = calc_total_completed_runtime(r, None if step_rt == '--' else step_rt)
+        cells = [folder_name,
+                exp.name,
+                f'Run {r.number}',
+                r.config.name,
+                r.status,
+                str(run_runtime),
+                step_prog,
+                f'{step_color}{r.current_step}',
+                f'{step_color}{str(step_rt)}',
+                f'{overall_rt_color}{overall_rt}']
+        dexp.rows[r.number] = (r, cells, fmt)
+        return cells, fmt
+
+    def _summary(self, dexp:_DashboardExp, runs:List[Run]) -> Text:
+        '''Progress, throughput and ETA line for one experiment'''
+        done = [r for r in runs if r.status in (RunStatus.FINISHED, RunStatus.FAILED)]
+        running = [r for r in runs if r.status == RunStatus.RUNNING]
+        failed = sum(1 for r in done if r.status == RunStatus.FAILED)
+        parts = [f'{dexp.exp.name}: {len(done)}/{len(runs)} done ({failed} failed), {len(running)} running']
+
+        started = [r.starttime for r in runs if r.starttime and r.status != RunStatus.READY]
+        if done and started:
+            finishes = [r.starttime + r.runtime for r in done if r.starttime and r.runtime is not None]
+            end = max(finishes) if finishes and len(done) == len(runs) else datetime.now()
+            hours = (end - min(started)).total_seconds()/3600
+            if hours > 0:
+                parts.append(f'{len(done)/hours:.1f} runs/hour')
+
+        if len(done) < len(runs):
+            remaining, unknown = estimate_remaining_runtime(dexp.exp, runs, RunHistory.from_runs(runs))
+            if running and unknown < len(runs) - len(done):
+                # assume the current level of parallelism continues
+                eta = _whole_seconds(remaining/len(running))
+                parts.append(f'ETA {eta}' + (f' ({unknown} runs without history)' if unknown else ''))
+        return Text(' | '.join(parts), style='bold')
+
+    def render(self):
+        table = Table(title=f'wdb dashboard {self.exp_parent_folder}', header_style='default', title_style='default')
+        table.add_column('Folder')
+        table.add_column('Exp name')
+        table.add_column('Run #')
+        table.add_column('Run Name')
+        table.add_column('Status')
+        table.add_column('Runtime')
+        table.add_column('Step Progress')
+        table.add_column('Current Step')
+        table.add_column('Step Runtime')
+        table.add_column('Total Runtime')
+
+        summaries = []
+        for folder, dexp in self._exps.items():
+            summaries.append(self._summary(dexp, self._runs[folder]))
+            # (refresh() already loaded all runs, so this filters them without a reload)
+            run_list = dexp.cache.query_runs(status=RunStatus.RUNNING if self.running_only else None, reload=False)
+            if self.run_numbers:
+                run_list = [r for r in run_list if r.number in self.run_numbers]
+            for r in run_list:
+                folder_name = r.build.recipe.name if len(self._exps) == 1 else folder.name
+                cells, fmt = self._row(dexp, r, folder_name)
+                table.add_row(*cells, style=fmt)
+
+        return Group(table, *summaries)
+
+    def run_live(self):
+        '''
+        Keeps the dashboard on screen until Ctrl+C. While runs are in progress it
+        re-renders every second (so their times tick), reloading runstates only when
+        the watched folders change. When nothing is running it just sleeps until
+        something changes.
+        '''
+        self.refresh()
+        # (our own status cache saves would wake us up again)
+        with FolderWatcher(self.watched_folders(), [ExpRelPaths.StatusCache.name]) as watcher, Live(auto_refresh=False) as live:
+            try:
+                while True:
+                    live.update(self.render(), refresh=True)
+                    if watcher.wait(timeout=1.0 if self.num_running else None):
+                        self.refresh()
+                        for folder in self.watched_folders():
+                            watcher.add_folder(folder)      # new experiments/workloads
+            except KeyboardInterrupt:
+                pass
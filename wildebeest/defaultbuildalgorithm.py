@@ -1,22 +1,32 @@
+from collections import Counter
 import getpass
+import hashlib
 from pathlib import Path
 import os
+import psutil
+import re
 import shutil
 import subprocess
 import tempfile
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Set, Tuple
 
 from wildebeest.buildsystemdriver import BuildSystemDriver, get_buildsystem_driver
 
 from .projectrecipe import ProjectRecipe
 from .experimentalgorithm import ExperimentAlgorithm
 from .run import Run
+from .experimentpaths import ExpRelPaths
+from .compilercache import CompilerCache, STATS_FILENAME, format_cache_stats, read_cache_stats
+from .containerpool import ContainerPool, DEFAULT_POOL_SIZE
+from .dockerstate import docker_state
+from .staging import DEFAULT_STAGING
 from .algorithmstep import ExpStep, RunStep
 from .preprocessing.repos import *
 from .utils import env
 
 def init(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
-    run.build.init()
+    run.build.init(params.get('source_staging', DEFAULT_STAGING), **get_clone_options(params))
     drivername = run.build.recipe.build_system
     driver = get_buildsystem_driver(drivername)
     if not driver:
@@ -38,7 +48,24 @@ def configure(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
     get_driver(outputs).configure(run.config, run.build)
 
 def build(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
-    get_driver(outputs).build(run.config, run.build, numjobs=run.config.num_build_jobs)
+    cc_cache = CompilerCache.from_params(params)
+    if not cc_cache:
+        get_driver(outputs).build(run.config, run.build, numjobs=run.config.num_build_jobs)
+        return
+
+    # the cc_wrapper counts this build's hits/misses in the stats file
+    stats_file = run.build.build_folder/STATS_FILENAME
+    stats_file.unlink(missing_ok=True)
+    # (if cc_cache_relocatable is set, cache hits work across runs/experiments relative to these)
+    base_dirs = [run.build.build_folder, run.build.project_root]
+    with env(cc_cache.build_env(stats_file, base_dirs)):
+        get_driver(outputs).build(run.config, run.build, numjobs=run.config.num_build_jobs)
+
+    stats = read_cache_stats(stats_file)
+    print(f'Compiler cache: {format_cache_stats(stats)}')
+    return {
+        'cc_cache': stats
+    }
 
 def reset_data_folder(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
     if run.data_folder.exists():
@@ -90,6 +117,16 @@ def docker_image_exists(image_name:str) -> bool:
     p = subprocess.run(['docker', 'image', 'inspect', image_name], capture_output=True)
     return p.returncode == 0
 
+def docker_image_names() -> Set[str]:
+    '''Returns the names of all local docker images (in one call, instead of inspecting each one)'''
+    out = subprocess.check_output(['docker', 'image', 'ls', '--format', '{{.Repository}}:{{.Tag}}']).decode('utf-8')
+    names = set()
+    for line in out.split():
+        names.add(line)
+        if line.endswith(':latest'):
+            names.add(line[:-len(':latest')])
+    return names
+
 class TemporaryDockerfile:
     '''
     Create a temporary dockerfile somewhere that gets automatically cleaned up
@@ -109,45 +146,241 @@ class TemporaryDockerfile:
             f.flush()
         return self
 
-    def docker_build(self, image_name) -> int:
+    def docker_build(self, image_name, log=None, buildkit:bool=False) -> int:
         '''
         Runs docker build -t <image_name> -f <tmp_dockerfile> <folder containing tmp_dockerfile>
         and returns the returncode of the subprocess.run() command.
 
         If you need to build your image differently, then call subprocess.run() yourself
         without calling docker_build()
+
+        log: Optional open file to send the build output to
+        buildkit: Build with BuildKit (required for RUN --mount), with plain progress output
         '''
         # build the recipe image from our temporary dockerfile
-        p = subprocess.run(['docker', 'build', '-t', image_name, '-f', self.dockerfile, self.dockerfile.parent])
+        docker_build_cmd = ['docker', 'build', '-t', image_name, '-f', self.dockerfile, self.dockerfile.parent]
+        build_env = None
+        if buildkit:
+            docker_build_cmd.insert(2, '--progress=plain')
+            # (not using utils.env here, builds may be running on several threads)
+            build_env = dict(os.environ, DOCKER_BUILDKIT='1')
+        p = subprocess.run(docker_build_cmd, stdout=log, stderr=subprocess.STDOUT if log else None, env=build_env)
         return p.returncode
 
     def __exit__(self, etype, value, traceback):
         self.tdref.__exit__(etype, value, traceback)
 
-def create_recipe_docker_image(exp:'Experiment', recipe:ProjectRecipe, other_apt_archs:List[str]):
-    if docker_image_exists(recipe.docker_image_name(exp.name)):
-        return
+DEFAULT_DOCKER_BUILD_JOBS = 4
+'''Number of recipe images docker_exp_setup builds at once'''
 
-    dockerfile_lines = [
+def get_other_apt_archs(exp:'Experiment') -> List[str]:
+    '''The extra apt architectures the experiment's run configs target'''
+    return sorted(set(rc.apt_arch for rc in exp.runconfigs if rc.apt_arch))
+
+DEFAULT_APT_LAYER_MIN_RECIPES = 2
+'''An apt dep goes in the shared apt layer if at least this many recipes need it'''
+
+def recipe_apt_deps(recipe:ProjectRecipe, other_apt_archs:List[str]) -> List[str]:
+    '''
+    Returns the apt packages this recipe's image installs. We install the deps for
+    all archs we want to target in the same docker image
+    '''
+    apt_deps = recipe.apt_deps.copy()
+    for arch in other_apt_archs:
+        apt_deps.extend([f'{dep}:{arch}' for dep in recipe.apt_deps if not dep.endswith(':all')])
+    # sorted so recipes with the same deps in a different order share an image
+    return sorted(set(apt_deps))
+
+def get_apt_layer_deps(exp:'Experiment', other_apt_archs:List[str]) -> List[str]:
+    '''
+    Returns the apt deps that go in the experiment's shared apt layer image (if the
+    experiment param apt_shared_layer is set): every package needed by at least
+    apt_shared_layer_min_recipes recipes. These get installed once in the layer image
+    and the recipe images only install their remaining deps on top of it.
+
+    NOTE: a recipe image can then contain packages the recipe didn't ask for, which
+    configure scripts may pick up as optional dependencies
+    '''
+    if not exp.params.get('apt_shared_layer', False):
+        return []
+    min_recipes = exp.params.get('apt_shared_layer_min_recipes', DEFAULT_APT_LAYER_MIN_RECIPES)
+    counts = Counter(dep for r in exp.projectlist for dep in recipe_apt_deps(r, other_apt_archs))
+    return sorted(dep for dep, n in counts.items() if n >= max(1, min_recipes))
+
+APT_CACHE_MOUNTS = '--mount=type=cache,target=/var/cache/apt,sharing=locked --mount=type=cache,target=/var/lib/apt/lists,sharing=locked'
+'''BuildKit cache mounts that keep apt's package cache on the docker host between builds'''
+
+def uses_apt_cache(exp:'Experiment') -> bool:
+    '''
+    True if the experiment param apt_cache is set: image builds then keep downloaded
+    packages in a BuildKit cache mount on the docker host, so every build (of any
+    recipe or experiment) after the first gets them from local disk
+    '''
+    return exp.params.get('apt_cache', False)
+
+def apt_install_line(exp:'Experiment', apt_deps:List[str]) -> str:
+    '''Returns the dockerfile RUN line that installs these apt packages'''
+    if uses_apt_cache(exp):
+        # the ubuntu image deletes downloaded .debs after installing by default
+        return f'RUN {APT_CACHE_MOUNTS} rm -f /etc/apt/apt.conf.d/docker-clean && ' \
+               'echo \'Binary::apt::APT::Keep-Downloaded-Packages "true";\' > /etc/apt/apt.conf.d/keep-cache && ' \
+               f'apt update && apt install -y {" ".join(apt_deps)}'
+    return f'RUN apt update && apt install -y {" ".join(apt_deps)}'
+
+_apt_size_units = {'B': 1, 'kB': 1000, 'MB': 1000**2, 'GB': 1000**3}
+
+def _parse_apt_size(size:str) -> float:
+    num, unit = size.split()
+    return float(num.replace(',', ''))*_apt_size_units[unit]
+
+def apt_download_stats(log_text:str) -> Tuple[float,float]:
+    '''
+    Parses apt install output for (bytes downloaded, bytes of packages installed).
+    apt prints "Need to get X of archives" if nothing was cached, or
+    "Need to get X/Y of archives" if only X of the Y needed came from the network
+    '''
+    downloaded = 0
+    total = 0
+    for m in re.finditer(r'Need to get ([\d.,]+ [kMG]?B)(?:/([\d.,]+ [kMG]?B))? of archives', log_text):
+        need = _parse_apt_size(m.group(1))
+        downloaded += need
+        total += _parse_apt_size(m.group(2)) if m.group(2) else need
+    return downloaded, total
+
+def format_apt_cache_stats(downloaded:float, total:float) -> str:
+    hit_rate = 1 - downloaded/total if total else 0
+    return f'apt cache hit rate {hit_rate:.0%} ({(total-downloaded)/1e6:.1f} of {total/1e6:.1f} MB from local cache)'
+
+def apt_layer_dockerfile_lines(exp:'Experiment', layer_deps:List[str]) -> List[str]:
+    return [
         f'FROM {get_exp_docker_imagename(exp)}',
+        apt_install_line(exp, layer_deps),
+    ]
+
+def _apt_layer_image_name(exp:'Experiment', layer_deps:List[str]) -> str:
+    digest = hashlib.sha1('\n'.join(apt_layer_dockerfile_lines(exp, layer_deps)).encode('utf-8')).hexdigest()[:12]
+    return f'wdb_{exp.name}_apt_{digest}'.lower()
+
+def recipe_dockerfile_lines(exp:'Experiment', recipe:ProjectRecipe, other_apt_archs:List[str],
+                            layer_deps:List[str]=None) -> List[str]:
+    '''
+    Returns the dockerfile for this recipe's image
+
+    layer_deps: The deps in the shared apt layer image (see get_apt_layer_deps), if any.
+                The recipe image is built on top of it and only installs the rest
+    '''
+    base_image = _apt_layer_image_name(exp, layer_deps) if layer_deps else get_exp_docker_imagename(exp)
+    dockerfile_lines = [
+        f'FROM {base_image}',
     ]
 
     if recipe.no_cc_wrapper:
         dockerfile_lines.append('RUN rm -rf /wrapper_bin && hash -r')
 
-    if recipe.apt_deps:
-        apt_deps = recipe.apt_deps.copy()
-        if other_apt_archs:
-            for arch in other_apt_archs:
-                apt_deps.extend([f'{dep}:{arch}' for dep in apt_deps if not dep.endswith(':all')])
+    layer_deps = set(layer_deps) if layer_deps else set()
+    apt_deps = [dep for dep in recipe_apt_deps(recipe, other_apt_archs) if dep not in layer_deps]
+    if apt_deps:
+        dockerfile_lines.append(apt_install_line(exp, apt_deps))
+
+    return dockerfile_lines
 
-        # CLS: try installing deps for all archs we want to target in the same docker image
-        dockerfile_lines.append(f'RUN apt update && apt install -y {" ".join(apt_deps)}')
+def _recipe_image_name(exp:'Experiment', dockerfile_lines:List[str]) -> str:
+    digest = hashlib.sha1('\n'.join(dockerfile_lines).encode('utf-8')).hexdigest()[:12]
+    return f'recipe_{digest}-{exp.name}'.lower()
 
-    with TemporaryDockerfile(dockerfile_lines) as tdf:
-        rcode = tdf.docker_build(recipe.docker_image_name(exp.name))
+def get_recipe_docker_imagename(exp:'Experiment', recipe:ProjectRecipe) -> str:
+    '''
+    Return the name of the docker image for this recipe. Images are named by a hash
+    of their dockerfile, so recipes that would get identical images (same apt deps
+    and cc_wrapper setting) share one
+    '''
+    other_apt_archs = get_other_apt_archs(exp)
+    layer_deps = get_apt_layer_deps(exp, other_apt_archs)
+    return _recipe_image_name(exp, recipe_dockerfile_lines(exp, recipe, other_apt_archs, layer_deps))
+
+def _image_status_file(exp:'Experiment', image_name:str, suffix:str) -> Path:
+    return exp.exp_folder/ExpRelPaths.DockerImages/f'{image_name}.{suffix}'
+
+def _build_recipe_image(exp:'Experiment', image_name:str, dockerfile_lines:List[str]) -> int:
+    building = _image_status_file(exp, image_name, 'building')
+    failed = _image_status_file(exp, image_name, 'failed')
+    logfile = _image_status_file(exp, image_name, 'log')
+    try:
+        with open(logfile, 'w') as log:
+            with TemporaryDockerfile(dockerfile_lines) as tdf:
+                rcode = tdf.docker_build(image_name, log, buildkit=uses_apt_cache(exp))
         if rcode != 0:
-            raise Exception(f'docker build failed to build recipe image for {recipe.name} [return code {rcode}]')
+            failed.write_text(str(rcode))
+        cache_stats = ''
+        if uses_apt_cache(exp):
+            downloaded, total = apt_download_stats(logfile.read_text())
+            if total:
+                cache_stats = f' | {format_apt_cache_stats(downloaded, total)}'
+        print(f'[{"Built" if rcode == 0 else "FAILED to build"} image {image_name}]{cache_stats}', flush=True)
+        return rcode
+    except:
+        failed.write_text('exception')
+        raise
+    finally:
+        building.unlink(missing_ok=True)
+
+def build_recipe_docker_images(exp:'Experiment', images:Dict[str,List[str]], numjobs:int, wait:bool=True):
+    '''
+    Builds these recipe images, numjobs at a time. Each build's output goes to
+    .wildebeest/docker_images/<image>.log
+
+    images: Maps image name -> its dockerfile lines
+    numjobs: Max number of images to build at once
+    wait: Wait for all builds to finish (raising an exception if any failed). Otherwise
+          the builds continue in the background and docker_init waits for its run's image
+    '''
+    status_folder = exp.exp_folder/ExpRelPaths.DockerImages
+    status_folder.mkdir(parents=True, exist_ok=True)
+    for name in images:
+        _image_status_file(exp, name, 'failed').unlink(missing_ok=True)
+        # the pid lets waiters tell if the build died with this process
+        _image_status_file(exp, name, 'building').write_text(str(os.getpid()))
+
+    numjobs = max(1, min(numjobs, len(images)))
+    print(f'Building {len(images)} docker images ({numjobs} at a time)')
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=numjobs)
+    futures = {name: pool.submit(_build_recipe_image, exp, name, lines) for name, lines in images.items()}
+    if not wait:
+        # interpreter exit still waits for these threads to finish
+        pool.shutdown(wait=False)
+        return
+
+    pool.shutdown(wait=True)
+    if uses_apt_cache(exp):
+        stats = [apt_download_stats(_image_status_file(exp, name, 'log').read_text()) for name in images]
+        downloaded = sum(d for d, _ in stats)
+        total = sum(t for _, t in stats)
+        if total:
+            print(f'Image builds: {format_apt_cache_stats(downloaded, total)}')
+
+    failed = [name for name, f in futures.items() if f.exception() or f.result() != 0]
+    if failed:
+        raise Exception(f'docker build failed to build recipe images {", ".join(failed)} (see logs in {status_folder})')
+
+def wait_for_recipe_docker_image(exp:'Experiment', image_name:str, poll_sec:float=5):
+    '''
+    If this image is still being built in the background (see build_recipe_docker_images),
+    waits until it is ready. Raises an exception if its build failed
+    '''
+    building = _image_status_file(exp, image_name, 'building')
+    while building.exists():
+        try:
+            builder_pid = int(building.read_text())
+        except (FileNotFoundError, ValueError):
+            time.sleep(0.1)
+            continue    # just finished (or is being written)
+        if not psutil.pid_exists(builder_pid):
+            break       # the experiment process died, so this won't finish
+        time.sleep(poll_sec)
+
+    if _image_status_file(exp, image_name, 'failed').exists():
+        raise Exception(f'docker build failed for recipe image {image_name} (see {_image_status_file(exp, image_name, "log")})')
 
 def docker_exp_setup(exp:'Experiment', params:Dict[str,Any], outputs:Dict[str,Any]):
     # create base docker image
@@ -192,18 +425,33 @@ def docker_exp_setup(exp:'Experiment', params:Dict[str,Any], outputs:Dict[str,An
             if p.returncode != 0:
                 raise Exception(f'docker build failed to create experiment image "{exp_docker_image}" with return code {p.returncode}')
 
-    other_apt_archs = list(set(rc.apt_arch for rc in exp.runconfigs if rc.apt_arch))
+    other_apt_archs = get_other_apt_archs(exp)
+    existing = docker_image_names()
+
+    # build the shared apt layer first, the recipe images are built on top of it
+    layer_deps = get_apt_layer_deps(exp, other_apt_archs)
+    if layer_deps:
+        layer_image = _apt_layer_image_name(exp, layer_deps)
+        print(f'Shared apt layer {layer_image}: {len(layer_deps)} packages')
+        if layer_image not in existing:
+            build_recipe_docker_images(exp, {layer_image: apt_layer_dockerfile_lines(exp, layer_deps)}, 1)
 
+    # recipes with identical dockerfiles share one image
+    images = {}
     for recipe in exp.projectlist:
-        create_recipe_docker_image(exp, recipe, other_apt_archs)
+        dockerfile_lines = recipe_dockerfile_lines(exp, recipe, other_apt_archs, layer_deps)
+        images.setdefault(_recipe_image_name(exp, dockerfile_lines), dockerfile_lines)
 
-def docker_container_exists(run:Run) -> bool:
-    outstr = subprocess.check_output(['docker', 'container', 'ls', '-a']).decode('utf-8')
-    return run.container_name in outstr
+    to_build = {name: lines for name, lines in images.items() if name not in existing}
+    if to_build:
+        build_recipe_docker_images(exp, to_build, params.get('docker_build_jobs', DEFAULT_DOCKER_BUILD_JOBS),
+                                   wait=not params.get('docker_build_background', False))
 
-def docker_run(run:Run):
+def docker_run(run:Run, container_name:str=None):
     '''
     Execute 'docker run' for this Run's container
+
+    container_name: Name for the container (defaults to run.container_name)
     '''
     # NOTE: if needed, I can create a run-specific docker image here derived from the
     # recipe image. But I'm not sure that is needed...
@@ -223,33 +471,55 @@ def docker_run(run:Run):
 
     # should I change to interactive? it would allow me to attach manually if needed...
     # no, I can run: "docker exec --user USER -it CONTAINER bash" to get a shell
-    docker_run_cmd = ['docker', 'run', '--user', username, '-td', '--name', run.container_name]
+    container_name = container_name if container_name else run.container_name
+    docker_run_cmd = ['docker', 'run', '--user', username, '-td', '--name', container_name]
 
     for bm in bindmounts:
         docker_run_cmd.append('-v')
         docker_run_cmd.append(bm)
 
-    docker_run_cmd.append(run.build.recipe.docker_image_name(run.experiment.name))
+    docker_run_cmd.append(get_recipe_docker_imagename(run.experiment, run.build.recipe))
 
     # -t: TTY, -d: run in background
     p = subprocess.run(docker_run_cmd)
     if p.returncode != 0:
+        docker_state().invalidate()     # not sure what state it's in now
         raise Exception(f'docker run failed for run {run.number} [return code {p.returncode}]')
+    docker_state().set_state(container_name, 'running')
 
 def docker_restart(run:Run):
     '''Restarts the container for this run'''
     rcode = subprocess.run(f'docker restart {run.container_name}', shell=True).returncode
     if rcode != 0:
         raise Exception(f'docker restart failed for run {run.number} [return code {rcode}] - container {run.container_name}')
+    docker_state().set_state(run.container_name, 'running')
 
 def docker_is_running(run:Run) -> bool:
     '''True if the docker container for this run is running'''
-    grep_rcode = subprocess.run(f'docker ps | grep {run.container_name} > /dev/null', shell=True).returncode
-    return bool(grep_rcode == 0)
+    return docker_state().is_running(run.container_name)
 
 def docker_container_exists(run:Run) -> bool:
-    grep_rcode = subprocess.run(f'docker container ls -a | grep {run.container_name} > /dev/null', shell=True).returncode
-    return bool(grep_rcode == 0)
+    '''True if the docker container for this run exists (running or not)'''
+    return docker_state().exists(run.container_name)
+
+def uses_container_pool(run:Run, params:Dict[str,Any]) -> bool:
+    '''True if this run's container comes from the ContainerPool'''
+    return bool(run.leased_container) or params.get('container_pool', False)
+
+def ensure_pooled_container(run:Run, params:Dict[str,Any]) -> bool:
+    '''
+    Makes sure the pooled container leased to this run is running (re-leasing one if the
+    run's lease was lost), without resetting it. Pooled containers are only ever
+    (re)created through the ContainerPool, so it keeps track of them.
+
+    Returns True if run.leased_container changed (so the run needs to be saved)
+    '''
+    if run.leased_container and docker_is_running(run):
+        return False
+    name = ContainerPool(params.get('container_pool_size', DEFAULT_POOL_SIZE)).lease(run, keep_state=True)
+    changed = name != run.leased_container
+    run.leased_container = name
+    return changed
 
 def docker_attach_to_bash(run:Run, as_root:bool=False):
     username = 'root' if as_root else getpass.getuser()
@@ -263,7 +533,13 @@ def docker_init(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
     outputs = init(run, params, outputs)
 
     # docker
-    if not docker_container_exists(run):
+    exp = run.experiment
+    wait_for_recipe_docker_image(exp, get_recipe_docker_imagename(exp, run.build.recipe))
+
+    if params.get('container_pool', False):
+        # reuse a warm container from a previous run of this recipe image
+        run.leased_container = ContainerPool(params.get('container_pool_size', DEFAULT_POOL_SIZE)).lease(run)
+    elif not docker_container_exists(run):
         docker_run(run)
 
     # TODO: allow experiment to specify additional bindmounts? (host, container) pairs
@@ -287,16 +563,26 @@ def docker_init(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
 # docker stop CONTAINER_IMAGE   # when finished for good
 
 def docker_cleanup(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
+    if run.leased_container:
+        # hand it back warm for the next run
+        ContainerPool(params.get('container_pool_size', DEFAULT_POOL_SIZE)).release(run)
+        run.leased_container = None
+        return
+
     # just STOP container for now...eventually REMOVE it!
     p = subprocess.run(['docker', 'stop', run.container_name])
     if p.returncode != 0:
         # does this warrant a "failed run"?
         print(f'Failed to stop run {run.number} docker container [return code {p.returncode}]')
+        docker_state().invalidate()
         return  # don't bother trying to remove it, it's still running or something
+    docker_state().set_state(run.container_name, 'exited')
 
     p = subprocess.run(['docker', 'container', 'rm', run.container_name])
     if p.returncode != 0:
         print(f'Failed to remove run {run.number} docker container [return code {p.returncode}]')
+        return
+    docker_state().set_state(run.container_name, None)
 
 def DockerBuildAlgorithm(preprocess_steps:List[ExpStep]=None,
      pre_init_steps:List[RunStep]=None,
@@ -315,6 +601,22 @@ def DockerBuildAlgorithm(preprocess_steps:List[ExpStep]=None,
     pre_build_steps: Additional steps to run after configure just before the build. Can be inside docker.
     extra_build_steps: Additional steps to run just after the build, before docker cleanup (these can be inside docker)
     post_build_steps: Additional steps to append after the build step (these are outside docker)
+
+    Recipe images are built docker_build_jobs at a time (experiment param). Set
+    docker_build_background to True to start running jobs while they build - each run
+    waits for its own image in the init step.
+
+    Set the experiment param apt_shared_layer to True to install the apt deps most
+    recipes share once, in an image the recipe images are built on top of (see
+    get_apt_layer_deps).
+
+    Set the experiment param apt_cache to True to keep downloaded apt packages in a
+    cache on the docker host, shared by all image builds (needs BuildKit).
+
+    Set the experiment param container_pool to True to lease warm containers from a
+    ContainerPool (shared by runs of the same recipe image) instead of creating and
+    removing a container per run. container_pool_size sets how many idle containers
+    are kept per image.
     '''
     # use None as default param bc of Python's issues with using [] as a default parameter
     if preprocess_steps is None:
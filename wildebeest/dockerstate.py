@@ -0,0 +1,85 @@
+import os
+import subprocess
+import time
+from typing import Dict
+
+DOCKER_STATE_MAX_AGE = 1.0
+'''Seconds a container listing is trusted before we ask the daemon again'''
+
+class DockerState:
+    '''
+    In-memory index of the docker daemon's containers (name -> state), so
+    "does this container exist/is it running" checks don't each shell out to
+    docker and grep its output.
+
+    The index comes from a single "docker ps -a" and is refreshed when it is
+    older than max_age or has been invalidated. The JobRunner invalidates it
+    once per scheduling tick, so all the phases it starts in that tick share
+    one listing. Names are matched exactly (a grep for run1 also matched run12).
+
+    Containers we create/start/stop/remove ourselves should be recorded with
+    set_state() so the index stays accurate without another listing.
+    '''
+    def __init__(self, max_age:float=DOCKER_STATE_MAX_AGE) -> None:
+        '''
+        max_age: Seconds a listing is used for before it is refreshed
+        '''
+        self.max_age = max_age
+        self._states:Dict[str,str] = {}
+        self._timestamp:float = None
+        self.listings = 0
+        '''Number of times we have asked the daemon (for stats/testing)'''
+
+    def refresh(self):
+        '''Reloads the container index from the docker daemon'''
+        out = subprocess.check_output(['docker', 'ps', '-a', '--no-trunc',
+                                       '--format', '{{.Names}}\t{{.State}}']).decode('utf-8')
+        states = {}
+        for line in out.splitlines():
+            if not line.strip():
+                continue
+            name, _, state = line.partition('\t')
+            # docker lists (legacy) links as extra comma-separated names
+            for n in name.split(','):
+                states[n.strip()] = state.strip()
+        self._states = states
+        self._timestamp = time.monotonic()
+        self.listings += 1
+
+    def invalidate(self):
+        '''Forces the next query to reload the index from the daemon'''
+        self._timestamp = None
+
+    def _current(self) -> Dict[str,str]:
+        if self._timestamp is None or time.monotonic() - self._timestamp > self.max_age:
+            self.refresh()
+        return self._states
+
+    def state(self, name:str) -> str:
+        '''Returns the state of this container (e.g. running, exited) or None if it DNE'''
+        return self._current().get(name)
+
+    def exists(self, name:str) -> bool:
+        return self.state(name) is not None
+
+    def is_running(self, name:str) -> bool:
+        return self.state(name) == 'running'
+
+    def set_state(self, name:str, state:str):
+        '''Records a change we made to this container (state None means it was removed)'''
+        if state is None:
+            self._states.pop(name, None)
+        else:
+            self._states[name] = state
+
+# one index per process (a forked child shouldn't trust its parent's listing)
+_docker_state:DockerState = None
+_docker_state_pid = None
+
+def docker_state() -> DockerState:
+    '''Returns this process' DockerState'''
+    global _docker_state, _docker_state_pid
+    if _docker_state is None or _docker_state_pid != os.getpid():
+        _docker_state = DockerState()
+        _docker_state_pid = os.getpid()
+    return _docker_state
@@ -1,7 +1,7 @@
+from datetime import timedelta
 import hashlib
-import pandas as pd
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from .defaultbuildalgorithm import clean
 from. experimentalgorithm import ExperimentAlgorithm
@@ -12,6 +12,9 @@ from .projectbuild import ProjectBuild
 from .projectrecipe import ProjectRecipe
 from .run import Run
 from .runconfig import RunConfig
+from .scheduling import DEFAULT_ORDERING, ResourceScheduler, RunHistory, get_ordering_policy, get_ordering_policy_names, simulate_makespan
+from .statedb import SQLITE_STATE_FORMAT, RunStateDb, close_statedb, statedb_file_names
+from .stateformat import DEFAULT_STATE_FORMAT, get_state_format, get_state_format_names
 from .utils import *
 
 class ExpState:
@@ -22,8 +25,16 @@ class ExpState:
     Finished = 'FINISHED'
     Failed = 'FAILED'
 
+_exp_cache:Dict[Path,Tuple[Tuple[int,int,int],'Experiment']] = {}
+'''Maps resolved exp folder -> (exp.yaml stat key, shared Experiment) (see Experiment.load_cached)'''
+
+def _exp_yaml_key(yamlfile:Path) -> Tuple[int,int,int]:
+    # exp.yaml is replaced atomically, so a save always changes the inode too
+    st = yamlfile.stat()
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
 def _get_exp_from_folder(exp_root:Path):
-    return Experiment.load_exp_from_yaml(exp_root)
+    return Experiment.load_cached(exp_root)
 
 class Experiment:
     postprocess_outputs:Dict[str,Any]
@@ -89,11 +100,38 @@ class Experiment:
 
         return exp
 
+    @staticmethod
+    def load_cached(exp_folder:Path) -> 'Experiment':
+        '''
+        Returns a process-wide Experiment for this folder, only loading exp.yaml again
+        if it changed since we last loaded (or saved) it. This is what Run.experiment
+        uses, so steps can call it freely.
+
+        The returned Experiment is shared - treat it as read-only (use load_exp_from_yaml
+        to get a private copy to modify)
+        '''
+        key = exp_folder.resolve()
+        yamlfile = exp_folder/ExpRelPaths.ExpYaml
+        before = _exp_yaml_key(yamlfile)
+        cached = _exp_cache.get(key)
+        if cached and cached[0] == before:
+            return cached[1]
+
+        exp = Experiment.load_exp_from_yaml(exp_folder)
+        # if it changed while we were loading (a _rebase saved it, or another process
+        # did), don't cache it - the next call reloads the latest version
+        if _exp_yaml_key(yamlfile) == before:
+            _exp_cache[key] = (before, exp)
+        return exp
+
     def save_to_yaml(self):
         # to keep our assumptions sensible, we don't allow saving the experiment
         # .yaml file away from its experiment folder
         yamlfile = self.exp_folder/ExpRelPaths.ExpYaml
         save_to_yaml(self, yamlfile)
+        # the caller may keep modifying self, so it can't become the shared copy -
+        # just make the next load_cached() reload what we wrote
+        _exp_cache.pop(self.exp_folder.resolve(), None)
 
     @property
     def source_folder(self):
@@ -120,6 +158,29 @@ class Experiment:
         '''The folder containing the serialized runstates for this experiment'''
         return self.exp_folder/ExpRelPaths.Runstates
 
+    @property
+    def status_cache_file(self) -> Path:
+        '''The cache of deserialized runstates used by status tools (see RunStatusCache)'''
+        return self.exp_folder/ExpRelPaths.StatusCache
+
+    @property
+    def state_format(self) -> str:
+        '''
+        Name of the StateFormat used for this experiment's runstate files (or 'sqlite'
+        to keep all runstates in a single state db). This lives in params so it can be
+        chosen at creation time (wdb create ... -p state_format=pickle)
+        '''
+        return self.params.get('state_format', DEFAULT_STATE_FORMAT)
+
+    @property
+    def uses_statedb(self) -> bool:
+        return self.state_format == SQLITE_STATE_FORMAT
+
+    @property
+    def statedb(self) -> RunStateDb:
+        '''The sqlite state db holding this experiment's runstates (if it uses one)'''
+        return RunStateDb(self.exp_folder/ExpRelPaths.StateDb)
+
     @property
     def workload_folder(self) -> Path:
         '''Path to JobRunner's workload folder when experiment is started'''
@@ -197,7 +258,8 @@ class Experiment:
                 build_folder = self.get_build_folder_for_run(project_name, run_number)
                 source_folder = self.get_project_source_folder(recipe)
                 proj_build = ProjectBuild(self.exp_folder, source_folder, build_folder, recipe)
-                run_list.append(Run(run_name, run_number, self.exp_folder, proj_build, rc, _get_exp_from_folder))
+                run_list.append(Run(run_name, run_number, self.exp_folder, proj_build, rc, _get_exp_from_folder,
+                                    self.state_format))
                 run_number += 1
         return run_list
 
@@ -216,29 +278,148 @@ class Experiment:
 
         # initialize the runs for the entire experiment
         run_list = self._generate_runlist()
-        for r in run_list:
-            r.save_to_runstate_file()
+        if self.uses_statedb:
+            self.statedb.delete_runs()      # in case we are regenerating (force)
+        self._save_runs(run_list)
 
         # write the run matrix to a file
         self.expdata_folder.mkdir(parents=True, exist_ok=True)
+        import pandas as pd     # (slow to import, so only when needed)
         runs_df = pd.DataFrame([(r.number, r.name) for r in run_list], columns=['RunNumber', 'Name'])
         runs_df.to_csv(self.expdata_folder/'run_matrix.csv', index=False)
 
         return run_list
 
+    def _runstate_files(self) -> Dict[int,Path]:
+        '''
+        Maps each run number to its runstate file. If a run has files in more than
+        one state format (e.g. convert_runstates was interrupted) the experiment's
+        configured format wins
+        '''
+        suffixes = [get_state_format(f).suffix for f in get_state_format_names()]
+        preferred = get_state_format(self.state_format).suffix if not self.uses_statedb else None
+        files = {}
+        for f in self.runstates_folder.glob('run*.run.*'):
+            if f.suffix not in suffixes:
+                continue    # e.g. lock files
+            number = int(f.name.split('.')[0][len('run'):])
+            if number not in files or f.suffix == preferred:
+                files[number] = f
+        return files
+
+    def _save_runs(self, runs:List[Run]):
+        '''Saves the given runs in their state format (in one transaction for the state db)'''
+        if runs and all(r.state_format == SQLITE_STATE_FORMAT for r in runs):
+            self.statedb.save_runs(runs)
+        else:
+            for r in runs:
+                r.save_to_runstate_file()
+
     def load_runs(self) -> List[Run]:
         '''
-        Loads the serialized experiment runs from the runstate folder
+        Loads the serialized experiment runs from the runstate folder (or state db)
+        '''
+        return self.query_runs()
+
+    def query_runs(self, status:str=None, failed_step:str=None) -> List[Run]:
+        '''
+        Loads the experiment runs matching all of the given criteria (all runs if none
+        are given), ordered by run number. With the state db only the matching runs
+        get deserialized
+
+        status: Only load runs with this RunStatus
+        failed_step: Only load runs which failed in this step
         '''
-        yaml_files = list(self.runstates_folder.glob('*.run.yaml'))
-        return sorted([Run.load_from_runstate_file(f, self.exp_folder) for f in yaml_files], key=lambda r: r.number)
+        if self.uses_statedb:
+            return [Run._rebase_if_moved(r, self.exp_folder) for r in self.statedb.query_runs(status, failed_step)]
+
+        runstate_files = self._runstate_files().values()
+        runs = sorted([Run.load_from_runstate_file(f, self.exp_folder) for f in runstate_files], key=lambda r: r.number)
+        return [r for r in runs if (status is None or r.status == status)
+                                and (failed_step is None or r.failed_step == failed_step)]
 
     def load_run_from_id(self, runid) -> Run:
-        yaml_file = self.runstates_folder/f'run{runid}.run.yaml'
-        if yaml_file.exists():
-            return Run.load_from_runstate_file(yaml_file, self.exp_folder)
+        if self.uses_statedb:
+            run = self.statedb.load_run(int(runid))
+            return Run._rebase_if_moved(run, self.exp_folder) if run else None
+
+        formats = [self.state_format, *[f for f in get_state_format_names() if f != self.state_format]]
+        for fmt in formats:
+            runstate_file = self.runstates_folder/f'run{runid}.run{get_state_format(fmt).suffix}'
+            if runstate_file.exists():
+                return Run.load_from_runstate_file(runstate_file, self.exp_folder)
         return None
 
+    def convert_runstates(self, state_format:str):
+        '''
+        Rewrites all of this experiment's runstates in the given state format (or
+        into/out of the sqlite state db) and makes it the format used from now on
+        (this is also the migration path for existing .run.yaml runstates)
+        '''
+        if state_format == self.state_format:
+            return
+        if state_format != SQLITE_STATE_FORMAT:
+            get_state_format(state_format)     # validate before touching anything
+
+        runs = self.load_runs()
+        old_files = set(r.runstate_file for r in runs)
+        for run in runs:
+            run.state_format = state_format
+        self._save_runs(runs)
+
+        # only remove the old runstates once the new ones are safely written
+        if self.uses_statedb:
+            db_file = self.exp_folder/ExpRelPaths.StateDb
+            close_statedb(db_file)
+            for f in statedb_file_names(db_file):
+                if f.exists():
+                    f.unlink()
+        else:
+            for f in old_files:
+                f.unlink()
+
+        self.params['state_format'] = state_format
+        self.save_to_yaml()
+
+    def load_run_history(self, include_siblings:bool=None) -> RunHistory:
+        '''
+        Collects the step runtimes and peak RSS measured by this experiment's runs
+        and (optionally) those of sibling experiments in the same parent folder,
+        which often build the same recipes with similar configs
+
+        include_siblings: Also load the sibling experiments' runs. This loads every run
+                          of every sibling, so it defaults to the experiment's
+                          sibling_history param (off unless set)
+        '''
+        if include_siblings is None:
+            include_siblings = self.params.get('sibling_history', False)
+        history = RunHistory.from_runs(self.load_runs())
+        if include_siblings:
+            for folder in sorted(self.exp_folder.absolute().parent.iterdir()):
+                if folder == self.exp_folder.absolute() or not Experiment.is_exp_folder(folder):
+                    continue
+                try:
+                    for r in Experiment.load_exp_from_yaml(folder).load_runs():
+                        history.add_run(r)
+                except Exception as e:
+                    print(f'Skipping run history from {folder}: {e}')
+        return history
+
+    def simulate_run(self, numjobs:int=1, run_from_step:str='') -> Dict[str,Tuple[timedelta,int]]:
+        '''
+        Predicts the makespan of running this experiment with numjobs parallel jobs
+        under each job ordering policy, based on previous runtimes. Returns a dict mapping
+        policy name to (predicted makespan, number of runs without any history)
+        '''
+        run_list = self.load_runs() or self._generate_runlist()
+        history = self.load_run_history()
+        workload = [RunTask(r, self.algorithm, self.params, run_from_step) for r in run_list]
+        results = {}
+        for name in get_ordering_policy_names():
+            ordered = get_ordering_policy(name).order(workload, history)
+            results[name] = simulate_makespan(ordered, numjobs, history)
+        return results
+
     def generate_workload_id(self) -> str:
         '''
         Generate a unique workload id that is deterministic for a given
@@ -259,7 +440,7 @@ class Experiment:
 
         if not run_from_step:
             # we don't run from beginning if it's already been run (without -f)
-            if self.runstates_folder.exists() and not force:
+            if not force:
                 run_list = self.load_runs()
                 for r in run_list:
                     if r.last_completed_step:
@@ -275,7 +456,8 @@ class Experiment:
 
     def run(self, force:bool=False, numjobs=1, run_list:List[Run]=None, run_from_step:str='',
             no_pre:bool=False, no_post:bool=False, buildjobs:int=None,
-            debug_in_process=False, debug_docker:bool=False):
+            debug_in_process=False, debug_docker:bool=False, cpus:int=None, mem:int=None,
+            order:str=DEFAULT_ORDERING):
         '''
         Run the entire experiment from the beginning.
 
@@ -302,7 +484,14 @@ class Experiment:
         debug_docker: Start the (first) docker container but then kill the experiment, leaving
                       the docker container running. This allows manually attaching and debugging
                       why a build system isn't happy
+        cpus: Cpu slot budget shared by all running jobs (build phases use their number of
+              build jobs, other phases 1). Defaults to the available cpus, 0 disables the limit
+        mem: Memory budget (bytes) shared by all running jobs, estimated from the peak RSS of
+             previous executions. Defaults to 90% of physical memory, 0 disables the limit
+        order: Name of the job ordering policy deciding which runs start first (the default
+               starts the runs expected to take the longest first)
         '''
+        ordering = get_ordering_policy(order)      # validate before we start anything
         if not self.validate_exp_before_run(run_from_step, force):
             return
 
@@ -314,6 +503,9 @@ class Experiment:
         # init/reset
         self.failed_step = ''       # reset this state always
 
+        # grab measurements from previous executions before the runs get regenerated
+        history = self.load_run_history()
+
         if not run_list:
             if run_from_step:
                 # no run_list given - we expect to rerun all runs from this step
@@ -345,13 +537,16 @@ class Experiment:
         # run jobs
         self.state = ExpState.Running
         workload = [RunTask(r, self.algorithm, self.params, run_from_step) for r in run_list]
+        workload = ordering.order(workload, history)
         workload_name = f"{self.name}-{self.generate_workload_id()}"
         print(f'Experiment workload name: {workload_name}')
         if run_from_step:
             print(f"Running experiment from step '{run_from_step}'")
         failed_tasks = []
 
-        with JobRunner(workload_name, workload, numjobs, self.exp_folder, debug_in_process) as runner:
+        scheduler = ResourceScheduler(cpus, mem, history)
+        with JobRunner(workload_name, workload, numjobs, self.exp_folder, debug_in_process,
+                       worker_pool=self.params.get('worker_pool', True), scheduler=scheduler) as runner:
             self.workload_folder = runner.workload_folder
             failed_tasks = runner.run()
 
@@ -1,4 +1,9 @@
 from datetime import datetime
+import os
+from pathlib import Path
+import pickle
+import sys
+import tempfile
 import traceback
 from typing import List, Tuple, Dict, Any
 from typing import TYPE_CHECKING
@@ -31,6 +36,51 @@ def combine_params_with_step(exp_params:Dict[str,Any], step_params:Dict[str,Any]
     combined.update(step_params)
     return combined
 
+def partition_output(output, width:int) -> List:
+    '''
+    Splits a list (or dict) step output into up to width contiguous partitions
+    of the same type
+    '''
+    items = list(output.items()) if isinstance(output, dict) else list(output)
+    width = max(1, min(width, len(items)))
+    size, extra = divmod(len(items), width)
+    parts = []
+    start = 0
+    for i in range(width):
+        end = start + size + (1 if i < extra else 0)
+        parts.append(dict(items[start:end]) if isinstance(output, dict) else items[start:end])
+        start = end
+    return parts
+
+def merge_partition_outputs(outputs:List) -> Any:
+    '''
+    Merges the outputs a step returned for each partition: lists are concatenated
+    and dicts merged (in partition order), all None is None, and anything else is
+    kept as a list with one output per partition
+    '''
+    if all(o is None for o in outputs):
+        return None
+    if all(isinstance(o, list) for o in outputs):
+        return [x for o in outputs for x in o]
+    if all(isinstance(o, dict) for o in outputs):
+        merged = {}
+        for o in outputs:
+            merged.update(o)
+        return merged
+    return outputs
+
+def get_fanout_key(step:RunStep, outputs:Dict[str,Any]) -> str:
+    '''
+    Returns the name of the output this step can be fanned out over (see RunStep
+    parallelism), or None if it doesn't fan out or there's nothing worth partitioning
+    '''
+    # (steps pickled by older versions don't have fanout_over)
+    key = getattr(step, 'fanout_over', None)
+    if not key or step.do_not_parallelize:
+        return None
+    output = outputs.get(key)
+    return key if isinstance(output, (list, dict)) and len(output) > 1 else None
+
 class ExperimentAlgorithm:
     def __init__(self, steps:List[RunStep],
                  preprocess_steps:List[ExpStep]=[], postprocess_steps:List[ExpStep]=[]) -> None:
@@ -166,7 +216,8 @@ class ExperimentAlgorithm:
     # NOTE: docker algorithm's prebuild task HAS to create the bindmount on the image somehow...
     # (specific to this build folder, etc)
 
-    def execute_from(self, from_step:str, run:Run, exp_params:Dict[str,Any], to_step:str=None) -> bool:
+    def execute_from(self, from_step:str, run:Run, exp_params:Dict[str,Any], to_step:str=None,
+                     fanout_width:int=1) -> bool:
         '''
         [Re-]Executes the algorithm beginning at the specified step. Note that the
         preceding steps in the algorithm must have already been completed for this
@@ -178,6 +229,8 @@ class ExperimentAlgorithm:
         step_name: Name of the step (in steps list) from which to begin
         run: The current run
         exp_params: Experiment parameters dict
+        fanout_width: If > 1, steps that opted in with fanout_over are run on up to this
+                      many partitions of that output in parallel (see RunStep parallelism)
         '''
         if not self.is_valid_experiment():
             run.error_msg = f'Experiment invalid - not executing'
@@ -189,42 +242,164 @@ class ExperimentAlgorithm:
         to_idx = len(self.steps)-1 if to_step is None else self.get_index_of_step(to_step)
         steps_to_exec = self.steps[from_idx:to_idx+1]
 
-        # reset status, but don't overwrite outputs in case we're starting
-        # mid-way through
-        run.failed_step = ''
-        run.error_msg = ''
-        run.status = RunStatus.RUNNING
+        # property setters only mark the run dirty inside this batch, so each
+        # step costs a single runstate write (see flush_updates below) instead of
+        # one per property
+        with run.batch_updates():
+            # reset status, but don't overwrite outputs in case we're starting
+            # mid-way through
+            run.failed_step = ''
+            run.error_msg = ''
+            run.status = RunStatus.RUNNING
+
+            if steps_to_exec[0].name == self.steps[0].name:
+                # reset all state - this will apply for initial run or reruns from beginning
+                run.outputs = {}
+                run.last_completed_step = ''
+
+            i = 0
+            while i < len(steps_to_exec):
+                step = steps_to_exec[i]
+                key = get_fanout_key(step, run.outputs) if fanout_width > 1 else None
+                if key:
+                    # this step and the ones right after it over the same output
+                    fanout_steps = [step]
+                    for s in steps_to_exec[i+1:]:
+                        if getattr(s, 'fanout_over', None) != key or s.do_not_parallelize:
+                            break
+                        fanout_steps.append(s)
+                    if not self._execute_fanout(run, exp_params, key, fanout_steps, fanout_width):
+                        return False
+                    run.flush_updates()
+                    i += len(fanout_steps)
+                    continue
 
-        if steps_to_exec[0].name == self.steps[0].name:
-            # reset all state - this will apply for initial run or reruns from beginning
-            run.outputs = {}
-            run.last_completed_step = ''
-
-        for step in steps_to_exec:
-            try:
                 run.save_step_starttime(step.name, datetime.now())
                 run.current_step = step.name
-                print(f'------------------ [Run {run.number} ({run.name})] {step.name} ------------------', flush=True)
+                # write at each step boundary: this captures the previous step's
+                # results together with the start of this step
+                run.flush_updates()
+                try:
+                    print(f'------------------ [Run {run.number} ({run.name})] {step.name} ------------------', flush=True)
+                    params = combine_params_with_step(exp_params, step.params)
+                    step_output = step.process(run, params, run.outputs)
+                except Exception as e:
+                    traceback.print_exc()
+                    print(f"Run '{run.name}' failed during the '{step.name}' step:\n\t'{e}'")
+                    run.save_step_runtime(step.name, datetime.now() - run.step_starttimes[step.name])
+                    run.status = RunStatus.FAILED
+                    run.failed_step = step.name
+                    run.error_msg = str(e)
+                    return False  # bail here (leaving the batch saves the failure)
+
+                run.save_step_runtime(step.name, datetime.now() - run.step_starttimes[step.name])
+                run.outputs[step.name] = step_output
+                run.last_completed_step = step.name
+                i += 1
+
+            if run.last_completed_step == self.steps[-1].name:
+                run.status = RunStatus.FINISHED
+            else:
+                run.status = RunStatus.RUNNING  # this could be something new, like CHECKPOINT or PARTIAL_COMPLETE
+        return True
+
+    def _execute_fanout(self, run:Run, exp_params:Dict[str,Any], fanout_key:str, steps:List[RunStep],
+            fanout_width:int) -> bool:
+        '''
+        Partitions run.outputs[fanout_key] and runs the given steps on each partition in a
+        forked child process, then merges everything back into the run. Only this (parent)
+        process writes the runstate - children report their outputs and step runtimes
+        through a result file.
+
+        Returns False (with the run marked failed) if any partition failed
+        '''
+        parts = partition_output(run.outputs[fanout_key], fanout_width)
+        print(f'[Run {run.number} ({run.name})] fanning out {fanout_key} into {len(parts)} partitions for: '
+              f'{", ".join(s.name for s in steps)}', flush=True)
+        # status tools expect the current step to have a start time
+        run.save_step_starttime(steps[0].name, datetime.now())
+        run.current_step = steps[0].name
+        run.flush_updates()
+
+        with tempfile.TemporaryDirectory(prefix='wdb_fanout_') as td:
+            result_files = [Path(td)/f'part{i}.pkl' for i in range(len(parts))]
+            pids = []
+            for i, part in enumerate(parts):
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    rc = 1
+                    try:
+                        rc = self._execute_partition(run, exp_params, fanout_key, part, steps,
+                                                     f'partition {i+1}/{len(parts)}', result_files[i])
+                    finally:
+                        sys.stdout.flush()
+                        sys.stderr.flush()
+                        os._exit(rc)
+                pids.append(pid)
+            for pid in pids:
+                os.waitpid(pid, 0)
+
+            results = []
+            for i, rf in enumerate(result_files):
+                if rf.exists():
+                    results.append(pickle.loads(rf.read_bytes()))
+                else:
+                    results.append({'error': f'Fan-out partition {i+1} died without reporting results',
+                                    'failed_step': steps[0].name, 'starttimes': {}, 'runtimes': {}})
+
+        # step times: the earliest start and the slowest partition
+        for step in steps:
+            starts = [r['starttimes'][step.name] for r in results if step.name in r['starttimes']]
+            runtimes = [r['runtimes'][step.name] for r in results if step.name in r['runtimes']]
+            if starts:
+                run.save_step_starttime(step.name, min(starts))
+            if runtimes:
+                run.save_step_runtime(step.name, max(runtimes))
+
+        failed = next((r for r in results if r['error'] is not None), None)
+        if failed:
+            print(f"Run '{run.name}' failed during the '{failed['failed_step']}' step (fan-out):\n\t'{failed['error']}'")
+            run.status = RunStatus.FAILED
+            run.current_step = failed['failed_step']
+            run.failed_step = failed['failed_step']
+            run.error_msg = failed['error']
+            return False
+
+        # (this picks up changes the steps made to the partitioned items)
+        run.outputs[fanout_key] = merge_partition_outputs([r['outputs'][fanout_key] for r in results])
+        for step in steps:
+            run.outputs[step.name] = merge_partition_outputs([r['outputs'][step.name] for r in results])
+            run.current_step = step.name
+            run.last_completed_step = step.name
+        return True
+
+    def _execute_partition(self, run:Run, exp_params:Dict[str,Any], fanout_key:str, part:Any,
+            steps:List[RunStep], part_name:str, result_file:Path) -> int:
+        '''Fan-out child: runs the steps on one partition and pickles the results to result_file'''
+        run.detach_runstate()       # the parent owns the runstate
+        run.outputs[fanout_key] = part
+        result = {'outputs': {}, 'starttimes': {}, 'runtimes': {}, 'error': None, 'failed_step': None}
+        for step in steps:
+            result['starttimes'][step.name] = datetime.now()
+            try:
+                print(f'------------------ [Run {run.number} ({run.name})] {step.name} ({part_name}) ------------------', flush=True)
                 params = combine_params_with_step(exp_params, step.params)
                 step_output = step.process(run, params, run.outputs)
             except Exception as e:
                 traceback.print_exc()
-                print(f"Run '{run.name}' failed during the '{step.name}' step:\n\t'{e}'")
-                run.save_step_runtime(step.name, datetime.now() - run.step_starttimes[step.name])
-                run.status = RunStatus.FAILED
-                run.failed_step = step.name
-                run.error_msg = str(e)
-                return False  # bail here
-
-            run.save_step_runtime(step.name, datetime.now() - run.step_starttimes[step.name])
+                result['error'] = str(e)
+                result['failed_step'] = step.name
+                break
+            finally:
+                result['runtimes'][step.name] = datetime.now() - result['starttimes'][step.name]
             run.outputs[step.name] = step_output
-            run.last_completed_step = step.name
 
-        if run.last_completed_step == self.steps[-1].name:
-            run.status = RunStatus.FINISHED
-        else:
-            run.status = RunStatus.RUNNING  # this could be something new, like CHECKPOINT or PARTIAL_COMPLETE
-        return True
+        if result['error'] is None:
+            result['outputs'] = {k: v for k, v in run.outputs.items() if k == fanout_key or k in result['runtimes']}
+        result_file.write_bytes(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        return 0 if result['error'] is None else 1
 
     def is_valid_experiment(self) -> bool:
         '''Validates the experiment'''
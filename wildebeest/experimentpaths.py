@@ -5,6 +5,9 @@ class ExpRelPaths:
     Wdb = Path('.wildebeest')
     ExpYaml = Wdb/'exp.yaml'
     Runstates = Wdb/'runstates'
+    StateDb = Wdb/'state.db'
+    DockerImages = Wdb/'docker_images'
+    StatusCache = Wdb/'status_cache.pkl'
     Source = Path('source')
     Build = Path('build')
     Rundata = Path('rundata')
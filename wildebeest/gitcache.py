@@ -0,0 +1,157 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import subprocess
+from typing import Any, Dict
+
+from .scheduling import format_mem_size, parse_mem_size
+from .utils import file_lock, load_from_yaml, save_to_yaml
+
+DEFAULT_GIT_CACHE_SIZE = '20G'
+'''Max total size of the git mirror cache before the least recently used mirrors are removed'''
+
+DEFAULT_GIT_CACHE_FETCH_SEC = 3600
+'''Mirrors older than this are fetched before they are cloned from'''
+
+def _git(*args:str, cwd:Path=None) -> subprocess.CompletedProcess:
+    return subprocess.run(['git', *args], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+def _folder_size(folder:Path) -> int:
+    size = 0
+    for root, _, files in os.walk(folder):
+        for f in files:
+            try:
+                size += os.lstat(os.path.join(root, f)).st_blocks*512
+            except OSError:
+                pass
+    return size
+
+class GitMirrorCache:
+    '''
+    Host-wide cache of bare mirrors of project git remotes (~/.wildebeest/gitcache),
+    so every experiment over the same projects doesn't clone them from the network.
+
+    GitRepository clones from the local mirror and then points origin back at the
+    real remote. A local clone hardlinks the mirror's objects, so it is fast, uses
+    no network, and doesn't depend on the mirror afterwards (mirrors can be removed
+    without breaking anything cloned from them).
+
+    A mirror is fetched before use when it is older than fetch_interval or doesn't
+    have the requested head yet. Once the cache is bigger than max_size the least
+    recently used mirrors are removed (skipping any that are being cloned from).
+
+    Each mirror has its own file_lock (exclusive while it is created/fetched, shared
+    while it is cloned from) and the cache index (mirrors.yaml) is only touched
+    under its own file_lock, so any number of wdb processes can share the cache.
+    '''
+    def __init__(self, cache_dir:Path=None, max_size:int=None, fetch_interval:int=DEFAULT_GIT_CACHE_FETCH_SEC) -> None:
+        '''
+        cache_dir: The cache folder (defaults to ~/.wildebeest/gitcache)
+        max_size: Max total size of the mirrors in bytes (defaults to DEFAULT_GIT_CACHE_SIZE)
+        fetch_interval: Seconds after which a mirror is fetched again before being used
+        '''
+        self.cache_dir = cache_dir if cache_dir else Path.home()/'.wildebeest'/'gitcache'
+        self.max_size = max_size if max_size is not None else parse_mem_size(DEFAULT_GIT_CACHE_SIZE)
+        self.fetch_interval = fetch_interval
+        self.index_file = self.cache_dir/'mirrors.yaml'
+
+    @staticmethod
+    def from_params(params:Dict[str,Any]) -> 'GitMirrorCache':
+        '''Returns the cache configured by these experiment params, or None if git_cache isn't enabled'''
+        if not params.get('git_cache', False):
+            return None
+        return GitMirrorCache(max_size=parse_mem_size(params.get('git_cache_size', DEFAULT_GIT_CACHE_SIZE)),
+                              fetch_interval=params.get('git_cache_fetch_interval', DEFAULT_GIT_CACHE_FETCH_SEC))
+
+    def mirror_path(self, remote:str) -> Path:
+        name = remote.rstrip('/').split('/')[-1]
+        name = name[:-len('.git')] if name.endswith('.git') else name
+        return self.cache_dir/f'{name}-{hashlib.sha1(remote.encode("utf-8")).hexdigest()[:12]}.git'
+
+    def _load(self) -> Dict[str,Dict[str,Any]]:
+        '''Maps remote -> {mirror, size, last_fetch, last_used}'''
+        if not self.index_file.exists():
+            return {}
+        mirrors = load_from_yaml(self.index_file)
+        return mirrors if mirrors else {}
+
+    def _update(self, remote:str, **fields):
+        with file_lock(self.index_file):
+            mirrors = self._load()
+            entry = mirrors.setdefault(remote, {'mirror': self.mirror_path(remote).name, 'size': 0,
+                                                'last_fetch': None, 'last_used': None})
+            entry.update(fields)
+            save_to_yaml(mirrors, self.index_file)
+
+    @staticmethod
+    def _has_revision(mirror:Path, head:str) -> bool:
+        return _git('rev-parse', '--verify', '--quiet', f'{head}^{{commit}}', cwd=mirror).returncode == 0
+
+    def _refresh(self, remote:str, mirror:Path, head:str):
+        '''Creates the mirror, or fetches it if it is stale (call with the mirror's lock held)'''
+        if not mirror.exists():
+            print(f'Creating git mirror of {remote} in {mirror}')
+            # clone next to it and rename, so a partial mirror is never used
+            tmp = mirror.with_name(f'{mirror.name}.tmp')
+            shutil.rmtree(tmp, ignore_errors=True)
+            p = _git('clone', '--mirror', remote, str(tmp))
+            if p.returncode != 0:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise Exception(f'git clone --mirror {remote} failed [return code {p.returncode}]\n{p.stdout.decode("utf-8", errors="replace")}')
+            tmp.rename(mirror)
+            self._update(remote, last_fetch=datetime.now(), size=_folder_size(mirror))
+            return
+
+        entry = self._load().get(remote, {})
+        last_fetch = entry.get('last_fetch')
+        stale = last_fetch is None or datetime.now() - last_fetch > timedelta(seconds=self.fetch_interval)
+        if stale or (head and not self._has_revision(mirror, head)):
+            p = _git('remote', 'update', '--prune', cwd=mirror)
+            if p.returncode != 0:
+                # (e.g. offline) - the mirror might still have what we need
+                print(f'Warning: failed to fetch git mirror {mirror}:\n{p.stdout.decode("utf-8", errors="replace")}')
+            else:
+                self._update(remote, last_fetch=datetime.now(), size=_folder_size(mirror))
+
+    @contextmanager
+    def mirror(self, remote:str, head:str=''):
+        '''
+        Context manager that makes sure the mirror of remote exists and is fresh
+        (and has head, if given) and yields its path. The mirror won't be evicted
+        until the with block exits, so clone from it inside the block.
+        '''
+        mirror = self.mirror_path(remote)
+        while True:
+            with file_lock(mirror):
+                self._refresh(remote, mirror, head)
+            with file_lock(mirror, shared=True):
+                if not mirror.exists():
+                    continue    # evicted between the locks (rare), start over
+                self._update(remote, last_used=datetime.now())
+                yield mirror
+                break
+        self.evict()
+
+    def evict(self):
+        '''Removes the least recently used mirrors until the cache fits in max_size'''
+        with file_lock(self.index_file):
+            mirrors = self._load()
+            total = sum(m['size'] for m in mirrors.values())
+            if total <= self.max_size:
+                return
+            lru = sorted(mirrors.keys(), key=lambda r: mirrors[r]['last_used'] or datetime.min)
+            for remote in lru:
+                if total <= self.max_size:
+                    break
+                path = self.cache_dir/mirrors[remote]['mirror']
+                try:
+                    with file_lock(path, blocking=False):
+                        shutil.rmtree(path, ignore_errors=True)
+                except BlockingIOError:
+                    continue    # in use
+                print(f'Evicted git mirror {path.name} ({format_mem_size(mirrors[remote]["size"])})')
+                total -= mirrors.pop(remote)['size']
+            save_to_yaml(mirrors, self.index_file)
@@ -2,8 +2,13 @@ from pathlib import Path
 import subprocess
 import shutil
 import time
+from typing import Callable, List, TYPE_CHECKING
 
-from .utils import cd
+from .archivecache import ArchiveCache, extract_archive, is_archive_url
+from .utils import file_lock
+
+if TYPE_CHECKING:
+    from .gitcache import GitMirrorCache
 
 ################################################################
 # keeping this here for now until I need it...
@@ -57,45 +62,104 @@ class GitRepository:
         self.head = head
         '''Optional pathspec specifying the desired revision to checkout after clone'''
 
-    def init(self):
+    @staticmethod
+    def is_initialized(project_root:Path) -> bool:
+        '''True if project_root exists and is nonempty (init() leaves these alone)'''
+        return project_root.exists() and any(project_root.iterdir())
+
+    def init(self, filter:str=None, shallow:bool=False, jobs:int=None, capture_output:bool=False,
+            git_cache:'GitMirrorCache'=None, archive_cache:ArchiveCache=None):
         '''
         Clones and initializes the project repository into project_root if it doesn't
-        already exist
+        already exist. Raises an exception if any step fails, after removing whatever
+        was cloned (so it can simply be retried).
+
+        filter: Partial clone filter (e.g. blob:none fetches file contents only when
+                they are checked out)
+        shallow: Clone only the head revision (depth 1). This only works when head is
+                 a branch or tag (or not specified), otherwise we fall back to a full clone
+        jobs: Number of submodules to fetch in parallel
+        capture_output: Collect the command output (and include it in any exception)
+                        instead of printing it. Use this when cloning repos in parallel
+        git_cache: Clone from this cache's local mirror of the remote instead of the
+                   remote itself (filter and shallow don't apply then)
+        archive_cache: Where archive (.tar.gz etc) remotes are downloaded to (defaults to
+                       the ~/.wildebeest/archives cache)
         '''
-        if self.project_root.exists() and list(self.project_root.iterdir()):
+        if GitRepository.is_initialized(self.project_root):
             print(f'Warning: {self.project_root} exists and is nonempty - no git operations performed')
             return
 
-        if self.git_remote.endswith('.tar.gz') or self.git_remote.endswith('.tar.xz') or self.git_remote.endswith('.tar'):
-            # download and unzip instead of clone
-            source_folder = self.project_root.parent    # source/ folder is parent of project_root
-            self.project_root.mkdir(parents=True)
-
-            unpack_folder = (source_folder/f'{self.project_root.name}_unpack').absolute()
-            unpack_folder.mkdir()
-
-            # this is a relative path, so save absolute before we chdir
-            proj_root = self.project_root.absolute()
-
-            # download and unpack in parent 'source' folder
-            with cd(unpack_folder):
-                subprocess.run(['wget', self.git_remote])
-                tar_name = self.git_remote.split('/')[-1]
-                subprocess.run(['tar', 'xvf', tar_name])
-
-                untarred_folder = [x for x in Path.cwd().iterdir() if x.name != tar_name][0]
-                untarred_folder.rename(proj_root)   # move out of here to source/ folder
-
-                # move tar file up a level
-                tar_file = Path(tar_name)
-                tar_file.rename(unpack_folder.parent/tar_file.name)
-
+        output = []
+        def run_cmd(cmd:List[str], cwd:Path=None, check:bool=True) -> bool:
+            # use cwd= rather than cd() so this is safe to call from multiple threads
+            p = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE if capture_output else None,
+                               stderr=subprocess.STDOUT if capture_output else None)
+            if capture_output:
+                output.append(p.stdout.decode('utf-8', errors='replace'))
+            if check and p.returncode != 0:
+                raise Exception(f'{" ".join(cmd)} failed [return code {p.returncode}]' +
+                                (f'\n{"".join(output)}' if capture_output else ''))
+            return p.returncode == 0
+
+        # runs sharing this source folder may be initializing it at the same time
+        with file_lock(self.project_root):
+            if GitRepository.is_initialized(self.project_root):
+                return  # someone else just did
+            try:
+                if is_archive_url(self.git_remote):
+                    self._download_tarball(archive_cache if archive_cache else ArchiveCache(),
+                                           output if capture_output else None)
+                else:
+                    self._clone(run_cmd, filter, shallow, jobs, git_cache)
+            except:
+                shutil.rmtree(self.project_root, ignore_errors=True)
+                shutil.rmtree(self._unpack_folder, ignore_errors=True)
+                raise
+
+    @property
+    def _unpack_folder(self) -> Path:
+        return (self.project_root.parent/f'{self.project_root.name}_unpack').absolute()
+
+    def _download_tarball(self, archive_cache:ArchiveCache, log:List[str]):
+        # download (or reuse) the archive and unpack it instead of cloning
+        archive = archive_cache.fetch(self.git_remote, log)
+
+        unpack_folder = self._unpack_folder
+        unpack_folder.mkdir(parents=True)
+        extract_archive(archive, unpack_folder)
+
+        # archives normally hold a single top-level folder, which becomes the project root
+        contents = list(unpack_folder.iterdir())
+        if len(contents) == 1 and contents[0].is_dir():
+            contents[0].rename(self.project_root.absolute())   # move out of here to source/ folder
             unpack_folder.rmdir()   # clean up unpack folder
         else:
-            # normal git repo
-            subprocess.run(['git', 'clone', self.git_remote, str(self.project_root)])
-
-            with cd(self.project_root):
-                if self.head:
-                    subprocess.run(['git', 'checkout', self.head])
-                subprocess.run(['git', 'submodule', 'update', '--init', '--recursive'])
+            unpack_folder.rename(self.project_root.absolute())
+
+    def _clone(self, run_cmd:Callable, filter:str, shallow:bool, jobs:int, git_cache:'GitMirrorCache'):
+        # normal git repo
+        options = [f'--filter={filter}'] if filter else []
+        cloned = False
+        if git_cache:
+            with git_cache.mirror(self.git_remote, self.head) as mirror:
+                run_cmd(['git', 'clone', str(mirror), str(self.project_root)])
+            run_cmd(['git', 'remote', 'set-url', 'origin', self.git_remote], cwd=self.project_root)
+            if self.head:
+                run_cmd(['git', 'checkout', self.head], cwd=self.project_root)
+            cloned = True
+        elif shallow:
+            branch = ['--branch', self.head] if self.head else []
+            cloned = run_cmd(['git', 'clone', '--depth', '1', *branch, *options, self.git_remote, str(self.project_root)],
+                             check=False)
+            if not cloned:
+                # (head is probably a commit)
+                shutil.rmtree(self.project_root, ignore_errors=True)
+
+        if not cloned:
+            run_cmd(['git', 'clone', *options, self.git_remote, str(self.project_root)])
+            if self.head:
+                run_cmd(['git', 'checkout', self.head], cwd=self.project_root)
+
+        submodule_jobs = ['--jobs', str(jobs)] if jobs else []
+        run_cmd(['git', 'submodule', 'update', '--init', '--recursive', *submodule_jobs], cwd=self.project_root)
@@ -1,17 +1,24 @@
 from datetime import datetime, timedelta
 import getpass
+import multiprocessing as mp
 from pathlib import Path
+import os
 import psutil
+import select
+import shlex
 import shutil
 import subprocess
 import sys
 from termcolor import colored
 import time
 import traceback
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, List, Tuple
 
 from .utils import *
-from .defaultbuildalgorithm import docker_container_exists, docker_run
+from .scheduling import ResourceScheduler, JobCost, process_tree_rss
+from .containerpool import ContainerPool
+from .defaultbuildalgorithm import docker_container_exists, docker_run, ensure_pooled_container, uses_container_pool
+from .dockerstate import docker_state
 
 from wildebeest.run import Run, RunStatus
 from wildebeest import experimentalgorithm
@@ -39,6 +46,8 @@ class RunTask:
         '''Start time of this task (set by job runner)'''
         self.finishtime:timedelta = None
         '''Finish time of this task (set by job runner after task is complete)'''
+        self.fanout_width = 1
+        '''How many ways list/dict step outputs may be split across processes (set by job runner per phase)'''
 
     @property
     def run_from_step_idx(self) -> int:
@@ -66,7 +75,7 @@ class RunTask:
         if to_step:
             last_step = to_step
 
-        if not self.algorithm.execute_from(first_step, self.run, self.exp_params, last_step):
+        if not self.algorithm.execute_from(first_step, self.run, self.exp_params, last_step, self.fanout_width):
             raise Exception(self.run.error_msg)
 
     def execute(self, from_step:str='', to_step:str=''):
@@ -93,12 +102,60 @@ class RunTask:
     def on_failed(self):
         '''Derived tasks can override this to indicate the task has failed'''
         # reload in case run was already updated
-        self.run = Run.load_from_runstate_file(self.run.runstate_file, self.run.exp_root)
+        self.run = self.run.reload_runstate()
 
-        self.run.runtime = self.runtime
-        self.run.status = RunStatus.FAILED
-        if not self.run.error_msg:
-            self.run.error_msg = 'RunTask failed without an error message (possibly killed?)'
+        with self.run.batch_updates():
+            self.run.runtime = self.runtime
+            self.run.status = RunStatus.FAILED
+            if not self.run.error_msg:
+                self.run.error_msg = 'RunTask failed without an error message (possibly killed?)'
+
+_worker_context = None
+
+def _get_worker_context():
+    '''
+    Returns the forkserver multiprocessing context used for worker processes. The
+    fork server imports wildebeest (and all its heavy dependencies) once, then each
+    worker is forked from it ready to go
+    '''
+    # (import wildebeest itself is lazy, so name the modules the steps use)
+    global _worker_context
+    if _worker_context is None:
+        _worker_context = mp.get_context('forkserver')
+        _worker_context.set_forkserver_preload(['wildebeest.experiment', 'wildebeest.jobrunner', 'wildebeest.postprocessing', 'pandas'])
+    return _worker_context
+
+def _run_job_in_worker(yamlfile:Path, from_step:str, to_step:str, logfile:Path, cwd:Path):
+    '''Worker process entry point: the equivalent of wdb run --job N --from X --to Y'''
+    os.chdir(cwd)
+    # redirect at the fd level so anything we launch (build tools, etc.) logs here too
+    log_fd = os.open(logfile, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log_fd, sys.stdout.fileno())
+    os.dup2(log_fd, sys.stderr.fileno())
+    os.close(log_fd)
+    sys.exit(run_job(yamlfile, from_step, to_step))
+
+class WorkerProcess:
+    '''
+    Wraps a worker (multiprocessing) Process in the parts of the subprocess.Popen
+    interface that Job and JobRunner use
+    '''
+    def __init__(self, process:mp.Process) -> None:
+        self._process = process
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def returncode(self) -> int:
+        # like Popen, this is -N if killed by signal N
+        return self._process.exitcode
+
+    def poll(self) -> int:
+        return self._process.exitcode
 
 class JobPaths:
     Workloads = Path().home()/'.wildebeest'/'workloads'
@@ -286,15 +343,23 @@ class Job:
         '''
         Starts the job in docker (via a subprocess), returning its PID
         '''
-        # create/start the run container if it does not already exist
-        if not docker_container_exists(self.task.run):
-            docker_run(self.task.run)
+        run = self.task.run
+        if uses_container_pool(run, self.task.exp_params):
+            if ensure_pooled_container(run, self.task.exp_params):
+                run.save_to_runstate_file()
+                self.save_to_yaml()     # (the job in the container loads the run from here)
+        elif not docker_container_exists(run):
+            # create/start the run container if it does not already exist
+            docker_run(run)
 
         # we can use this exp_folder cwd since we exactly mirror it within the container
         cwd = self.exp_folder if self.exp_folder else Path().cwd()  # in case this wasn't specified
 
         with self.logfile.open('a') as log:
             username = getpass.getuser()
+            # NOTE: this is the wdb installed in the experiment's docker image, which may be
+            # older than ours (the image is reused as long as it exists), so stick to the
+            # cli it has always had
             self.process = subprocess.Popen([f'docker exec -w {cwd} --user {username} {self.task.run.container_name} wdb run --job {self.jobid} --from {from_step} --to {to_step}'],
                 shell=True, stdout=log, stderr=log)
 
@@ -302,6 +367,21 @@ class Job:
         self.pid = self.process.pid
         return self.pid
 
+    def start_in_worker(self, from_step:str, to_step:str) -> int:
+        '''
+        Starts the job in a worker process forked from the (preloaded) fork server,
+        returning its PID
+        '''
+        cwd = self.exp_folder if self.exp_folder else Path().cwd()  # in case this wasn't specified
+        ctx = _get_worker_context()
+        p = ctx.Process(target=_run_job_in_worker, name=self.jobname,
+                        args=(self.yamlfile, from_step, to_step, self.logfile, cwd))
+        p.start()
+        self.process = WorkerProcess(p)
+        # process doesn't get serialized, so we save pid separately
+        self.pid = self.process.pid
+        return self.pid
+
     def start_in_subprocess(self, from_step:str, to_step:str) -> int:
         '''
         Starts the job in a subprocess, returning its PID
@@ -309,7 +389,7 @@ class Job:
         cwd = self.exp_folder if self.exp_folder else Path().cwd()  # in case this wasn't specified
         with cd(cwd):
             with self.logfile.open('a') as log:
-                self.process = subprocess.Popen([f'wdb run --job {self.jobid} --from {from_step} --to {to_step}'],
+                self.process = subprocess.Popen([f'wdb run --job-yaml {shlex.quote(str(self.yamlfile))} --from {from_step} --to {to_step}'],
                     shell=True, stdout=log, stderr=log)
         # process doesn't get serialized, so we save pid separately
         self.pid = self.process.pid
@@ -317,6 +397,8 @@ class Job:
 
     def kill(self):
         '''Kill this job'''
+        if self.pid is None:
+            return      # never started (psutil.Process(None) would be US)
         try:
             kill_process_and_descendents(psutil.Process(self.pid))
         except psutil.NoSuchProcess as nsp:
@@ -333,7 +415,7 @@ class Job:
         if self.debug_in_process:
             return self._debug_finished
         else:
-            # works for EITHER docker or nondocker (both using subprocess)
+            # works for docker, nondocker subprocess or worker process
             # if returncode is None it's still running
             return self.process.poll() is not None
 
@@ -342,7 +424,7 @@ class Job:
         if self.debug_in_process:
             return self._debug_failed
         else:
-            # works for EITHER docker or nondocker (both using subprocess)
+            # works for docker, nondocker subprocess or worker process
             return self.process.returncode != 0 if self.finished() else False
 
 class WorkloadStatus:
@@ -358,6 +440,44 @@ ONLY THE JOB RUNNER MODIFIES JOB STATE - job processes do not do this!!
 --------------------------------------
 """
 
+def _job_wait_method() -> str:
+    '''
+    Picks how the JobRunner waits for job processes to exit:
+        pidfd:  select() on a pidfd per running job (Linux 5.3+)
+        waitid: block in waitid(WNOWAIT) until any child exits, leaving it for Popen to reap
+        poll:   poll each job periodically
+    '''
+    if hasattr(os, 'pidfd_open'):
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            return 'pidfd'
+        except OSError:
+            pass    # kernel too old, or pidfds are blocked (seccomp)
+    if hasattr(os, 'waitid') and hasattr(os, 'WNOWAIT'):
+        return 'waitid'
+    return 'poll'
+
+class SchedulerStats:
+    '''Latency metrics for the JobRunner's scheduling loop'''
+    def __init__(self, wait_method:str) -> None:
+        self.wait_method = wait_method
+        self.wakeups = 0
+        '''Number of times the scheduler woke up and found finished jobs'''
+        self.reaped = 0
+        '''Number of finished job phases handled'''
+        self.max_reaped = 0
+        '''Most finished job phases handled in a single wakeup'''
+        self.launch_latencies:List[float] = []
+        '''Seconds from noticing finished job(s) until each follow-on process was launched'''
+
+    def summary(self) -> str:
+        if not self.wakeups:
+            return f'Scheduler [{self.wait_method}]: no jobs reaped'
+        lat = self.launch_latencies
+        lat_str = f'launch latency avg {sum(lat)/len(lat)*1000:.1f}ms, max {max(lat)*1000:.1f}ms' if lat else 'no follow-on launches'
+        return f'Scheduler [{self.wait_method}]: {self.reaped} job phases reaped in {self.wakeups} wakeups ' \
+               f'(max {self.max_reaped} at once), {lat_str}'
+
 def reset_folder(folder:Path, delete_existing:bool=False):
     '''
     Creates the folder if it does not exist. If delete_existing is specified and
@@ -370,15 +490,17 @@ def reset_folder(folder:Path, delete_existing:bool=False):
 class JobRunner:
     ready_jobs:List[Job]
     running_jobs:List[Job]
+    pending_phases:List[Tuple[Job,int]]
     failed_jobs:List[Job]
     finished_jobs:List[Job]
 
     '''
     Runs a set of Tasks (work units) using a specified max number of parallel
-    jobs.
+    jobs (and, if given a ResourceScheduler, only as many job phases as fit in
+    its cpu/memory budget).
     '''
     def __init__(self, name:str, workload:List[RunTask], numjobs:int, exp_folder:Path=None,
-        debug_in_process:bool=False) -> None:
+        debug_in_process:bool=False, worker_pool:bool=False, scheduler:ResourceScheduler=None) -> None:
         '''
         name: Descriptive name for the workload
         workload: The tasks to be executed
@@ -386,6 +508,9 @@ class JobRunner:
         exp_folder: The experiment folder (this facilitates running wdb commands in new processes)
         debug_in_process: Debug flag to prevent running subprocesses - will serialize all
                           jobs and run within this process to facilitate breakpoints, etc.
+        worker_pool: Run non-docker phases in worker processes forked from a preloaded
+                     fork server instead of launching a new wdb process for each phase
+        scheduler: Optional resource budget each job phase must fit into before it is started
         '''
         self.name = name
         self.workload = workload
@@ -399,9 +524,30 @@ class JobRunner:
 
         self.ready_jobs = []
         self.running_jobs = []
+        self.pending_phases = []
+        '''Jobs between phases whose next phase (first step index) is waiting for resources'''
         self.failed_jobs = []
         self.finished_jobs = []
 
+        self.scheduler = scheduler if not debug_in_process else None
+        self._phase_costs:Dict[Tuple[int,int],JobCost] = {}
+        '''Maps (jobid, first step index) -> estimated cost of that phase (when using a scheduler)'''
+        self._phase_steps:Dict[int,List[str]] = {}
+        '''Maps jobid -> names of the steps in its current phase'''
+        self._phase_peak_rss:Dict[int,int] = {}
+        '''Maps jobid -> peak RSS sampled for its current phase'''
+        self._last_rss_sample = 0
+
+        self.worker_pool = worker_pool and not debug_in_process
+        self.wait_method = 'poll' if debug_in_process else _job_wait_method()
+        if self.worker_pool and self.wait_method == 'waitid':
+            self.wait_method = 'poll'   # workers are children of the fork server, not us
+        self.stats = SchedulerStats(self.wait_method)
+        self._pidfds:Dict[int,int] = {}
+        '''Maps jobid -> pidfd of its current process (pidfd wait method only)'''
+        self._wakeup_time = None
+        '''perf_counter() time we last noticed finished jobs (for launch latency)'''
+
     def __enter__(self):
         reset_folder(self.workload_folder)
         reset_folder(self.workload_folder/JobRelPaths.Logs)
@@ -416,6 +562,9 @@ class JobRunner:
                 j.kill()
         except:
             pass    # oh well, we tried... :P
+        for fd in self._pidfds.values():
+            os.close(fd)
+        self._pidfds.clear()
 
     def mark_job_running(self, job:Job):
         '''
@@ -451,11 +600,29 @@ class JobRunner:
 
         self.start_next_phase(next_job, next_job.task.run_from_step_idx)
 
+    def _phase_cost(self, job:Job, first_step_idx:int) -> JobCost:
+        '''Returns the (cached) cost of the phase beginning at first_step_idx'''
+        key = (job.jobid, first_step_idx)
+        if key not in self._phase_costs:
+            stop_idx = job.task.algorithm.indexof_last_contiguous_step(first_step_idx)
+            self._phase_costs[key] = self.scheduler.phase_cost(job.task, first_step_idx, stop_idx)
+        return self._phase_costs[key]
+
+    def can_start_phase(self, job:Job, first_step_idx:int) -> bool:
+        '''True if the resource budget (if any) has room for this job phase'''
+        if not self.scheduler:
+            return True
+        return self.scheduler.can_admit(self._phase_cost(job, first_step_idx))
+
     def start_next_phase(self, job:Job, first_step_idx:int):
         '''Starts the next phase for this job and adds it to the running job queue'''
         # detect next docker/nondocker phase
         start_idx = first_step_idx
         stop_idx = job.task.algorithm.indexof_last_contiguous_step(start_idx)
+        self._phase_steps[job.jobid] = [s.name for s in job.task.algorithm.steps[start_idx:stop_idx+1]]
+        self._phase_peak_rss[job.jobid] = 0
+        if self.scheduler:
+            self.scheduler.acquire(job.jobid, self._phase_cost(job, start_idx))
         docker_phase = job.task.algorithm.steps[start_idx].run_in_docker
 
         # ...now in string form to make cmd-line happy :)
@@ -466,11 +633,17 @@ class JobRunner:
         if start_idx == 0:
             job.logfile.write_text('')
 
+        # let the job fan out its own work over the slots the other runs aren't using
+        in_flight = len(self.running_jobs) + len(self.ready_jobs) + len(self.pending_phases) + 1
+        job.task.fanout_width = max(1, self.numjobs // in_flight)
+
         self.mark_job_running(job)
         job.task.starttime = datetime.now()
         job.starttime = job.task.starttime
 
         from_to_descr = f'{from_step} -> {to_step}' if start_idx != stop_idx else from_step
+        if job.task.fanout_width > 1:
+            from_to_descr += f' (fan-out up to {job.task.fanout_width})'
 
         if self.debug_in_process:
             print(f'[Started {job.task.name} (job {job.jobid}, IN PROCESS)]')
@@ -485,21 +658,54 @@ class JobRunner:
         else:
             # non-docker phase
             job.running_in_docker = False      # save this before it gets read by job
-            pid = job.start_in_subprocess(from_step, to_step)
-            print(f'[Started {job.task.name} in subprocess] {from_to_descr} | job {job.jobid}, pid = {pid}')
+            if self.worker_pool:
+                pid = job.start_in_worker(from_step, to_step)
+                print(f'[Started {job.task.name} in worker] {from_to_descr} | job {job.jobid}, pid = {pid}')
+            else:
+                pid = job.start_in_subprocess(from_step, to_step)
+                print(f'[Started {job.task.name} in subprocess] {from_to_descr} | job {job.jobid}, pid = {pid}')
+
+        if job.process is not None:
+            self._watch_process(job)
+            if self._wakeup_time is not None:
+                self.stats.launch_latencies.append(time.perf_counter() - self._wakeup_time)
         self.running_jobs.append(job)
 
+    def _watch_process(self, job:Job):
+        '''Registers the job's current process so we get woken up when it exits'''
+        if self.wait_method != 'pidfd':
+            return
+        try:
+            # (pidfds work for worker processes too, even though the fork server is their parent)
+            self._pidfds[job.jobid] = os.pidfd_open(job.process.pid)
+        except OSError:
+            # shouldn't happen for our own (unreaped) child, but don't hang on it if it does
+            print(f'Unable to open pidfd for job {job.jobid}, falling back to polling')
+            self.wait_method = self.stats.wait_method = 'poll'
+
+    def _unwatch_process(self, job:Job):
+        fd = self._pidfds.pop(job.jobid, None)
+        if fd is not None:
+            os.close(fd)
+
     def handle_finished_job(self, j:Job):
         '''
         Mark finish time, move job from running list to appropriate list, print status
         '''
         failed = j.failed()     # have to read this NOW before we lose handle to process via yaml reload
         self.running_jobs.remove(j)
+        self._unwatch_process(j)
+        if self.scheduler:
+            self.scheduler.release(j.jobid)
 
         # load any updated state from job process BEFORE setting any
         # new properties on this job
         j = Job.load_job_from_yaml(j.yamlfile)
 
+        # (a failed phase still tells us how much memory it got to - most
+        # importantly when it was killed for using too much)
+        self._record_peak_rss(j, failed)
+
         if failed:
             self.mark_job_finished(j, failed)
             self.failed_jobs.append(j)
@@ -508,10 +714,19 @@ class JobRunner:
             j.task.on_failed()      # allow the task a chance to mark itself failed
             print(colored(f'[{j.task.name} FAILED in {j.runtime}]: {j.error_msg}', 'red', attrs=['bold']))
             if j.running_in_docker:
-                # at least stop the container, then I can manually "docker container prune" to clean up if needed
-                p = subprocess.run(['docker', 'stop', j.task.run.container_name])
-                if p.returncode != 0:
-                    print(f'docker stop failed for run {j.task.run.number} container [return code {p.returncode}]')
+                run = j.task.run
+                if run.leased_container:
+                    # the container is shared through the pool, so don't stop it behind the pool's
+                    # back - discard it (we don't know what the failed phase left running in it)
+                    ContainerPool().discard_lease(run)
+                    run.leased_container = None
+                    run.save_to_runstate_file()
+                else:
+                    # at least stop the container, then I can manually "docker container prune" to clean up if needed
+                    p = subprocess.run(['docker', 'stop', run.container_name])
+                    if p.returncode != 0:
+                        print(f'docker stop failed for run {run.number} container [return code {p.returncode}]')
+                docker_state().invalidate()
             return
 
         # did we actually COMPLETE the run, or just finish this phase?
@@ -522,27 +737,93 @@ class JobRunner:
             self.finished_jobs.append(j)
             print(colored(f'[{j.task.name} finished in {j.runtime}]', 'green'))
         else:
-            # not finished - start next phase!
+            # not finished - queue up the next phase (it starts as soon as it fits)
             last_step_name = j.task.run.last_completed_step
             last_step_idx = j.task.algorithm.get_index_of_step(last_step_name)
-            self.start_next_phase(j, last_step_idx + 1)
+            self.pending_phases.append((j, last_step_idx + 1))
 
-    def wait_for_finished_job(self):
+    def _record_peak_rss(self, j:Job, failed:bool):
+        '''Saves the peak RSS sampled for the job's phase that just finished in its runstate'''
+        peak_rss = self._phase_peak_rss.pop(j.jobid, 0)
+        if not peak_rss:
+            return
+        steps = self._phase_steps[j.jobid]
+        if failed:
+            # the phase didn't get to finish, so don't lower what a complete execution used
+            peak_rss = max(peak_rss, *(j.task.run.step_peak_rss.get(s, 0) for s in steps))
+        # the job process isn't running now, so we can update the runstate (the
+        # next phase gets this run from the job yaml, which is saved as it starts)
+        j.task.run.save_step_peak_rss(steps, peak_rss)
+
+    def sample_resources(self):
+        '''Records the peak RSS of each running job's process tree (throttled to once a second)'''
+        now = time.monotonic()
+        if now - self._last_rss_sample < 1.0:
+            return
+        self._last_rss_sample = now
+        for j in self.running_jobs:
+            # docker phases run under the docker daemon, all we would see is the docker
+            # exec client (and the container's usage includes whatever else it holds),
+            # so we only measure phases running on the host
+            if j.process is not None and not j.running_in_docker:
+                rss = process_tree_rss(j.process.pid)
+                self._phase_peak_rss[j.jobid] = max(rss, self._phase_peak_rss.get(j.jobid, 0))
+
+    def _wait_for_exit(self, timeout:float):
+        '''Blocks until a running job process (probably) exits, or the timeout expires'''
+        if self.wait_method == 'pidfd' and self._pidfds:
+            select.select(list(self._pidfds.values()), [], [], timeout)
+        elif self.wait_method == 'waitid':
+            # WNOWAIT leaves the child as a zombie so Popen.poll() can still reap it
+            # and get its return code. (This has no timeout, but every running job
+            # is our child so something will exit)
+            try:
+                os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOWAIT)
+            except ChildProcessError:
+                time.sleep(timeout)
+        else:
+            time.sleep(timeout)
+
+    def wait_for_finished_jobs(self):
         '''
-        Blocks until at least one job finishes running. When a job does finish,
-        it is removed from the running queue and marked as finished before
-        returning.
+        Blocks until at least one job finishes running, then handles EVERY job
+        that has finished (moving it to the proper list or starting its next phase)
+        before returning, so the caller can refill all of the free slots at once.
         '''
-        while True:
-            for j in self.running_jobs:
-                if j.finished():
-                    self.handle_finished_job(j)
-                    return
-            time.sleep(0.25)    # 250ms?
+        finished = [j for j in self.running_jobs if j.finished()]
+        while not finished:
+            if self.scheduler:
+                self.sample_resources()
+            self._wait_for_exit(timeout=0.25)
+            finished = [j for j in self.running_jobs if j.finished()]
+            if not finished and self.wait_method == 'waitid':
+                # an exited child that isn't one of our jobs would keep waitid from
+                # blocking - don't spin on it
+                time.sleep(0.05)
+
+        self._wakeup_time = time.perf_counter()
+        self.stats.wakeups += 1
+        self.stats.reaped += len(finished)
+        self.stats.max_reaped = max(self.stats.max_reaped, len(finished))
+        for j in finished:
+            self.handle_finished_job(j)
 
     def start_parallel_jobs(self, max_jobs:int):
-        '''Starts as many jobs as possible in parallel, up to max_jobs'''
-        while self.ready_jobs and len(self.running_jobs) < max_jobs:
+        '''
+        Starts as many jobs as possible in parallel, up to max_jobs (and the resource
+        budget). Jobs that are already in progress get first pick when starting their
+        next phase, and new jobs aren't started while any of them are still waiting
+        '''
+        # job processes may have created/removed containers since last time, but
+        # everything we start in this tick can share one listing
+        docker_state().invalidate()
+
+        while self.pending_phases and self.can_start_phase(*self.pending_phases[0]):
+            self.start_next_phase(*self.pending_phases.pop(0))
+
+        while self.ready_jobs and not self.pending_phases \
+                and len(self.running_jobs) < max_jobs \
+                and self.can_start_phase(self.ready_jobs[0], self.ready_jobs[0].task.run_from_step_idx):
             self.start_next_job()
 
     def run(self) -> List[RunTask]:
@@ -563,16 +844,17 @@ class JobRunner:
         print(f'Running {len(self.ready_jobs)} tasks using up to {MAX_JOBS} parallel jobs')
         if MAX_JOBS < self.numjobs:
             print(f'({self.numjobs} specified, but only {len(self.ready_jobs)} jobs to run)')
+        if self.scheduler:
+            print(self.scheduler.describe())
 
-        while self.ready_jobs:
+        while self.ready_jobs or self.running_jobs or self.pending_phases:
             self.start_parallel_jobs(MAX_JOBS)
-            self.wait_for_finished_job()    # running jobs are full, wait for one to finish
-
-        # wait for final jobs to finish
-        while self.running_jobs:
-            self.wait_for_finished_job()
+            self._wakeup_time = None    # (only refills count toward launch latency)
+            if self.running_jobs:
+                self.wait_for_finished_jobs()
 
         print(f'Finished running {self.name}')
+        print(self.stats.summary())
         return [j.task for j in self.failed_jobs]
 
 def run_job(yaml:Path, from_step:str='', to_step:str='') -> int:
@@ -1,4 +1,3 @@
-import pandas as pd
 from pathlib import Path
 import re
 import shutil
@@ -138,6 +137,7 @@ def _do_flatten_binaries(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
         bdict[i] = FlatLayoutBinary(i, b, lobj, run)
         bdict[i].data['percent_cpp'] = calc_percent_cpp_names_in_binary(b)
 
+    import pandas as pd     # (slow to import, so only when needed)
     df = pd.DataFrame([vars(fb) for fb in bdict.values()])
     df.to_csv(run.data_folder/'flat_layout.csv', index=False)
 
@@ -225,4 +225,6 @@ def _do_strip_binaries(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
     # import IPython; IPython.embed()
 
 def strip_binaries(run_in_docker:bool=True) -> RunStep:
-    return RunStep('strip_binaries', _do_strip_binaries, run_in_docker=run_in_docker)
+    # (each binary is stripped on its own, so this can be split across processes)
+    return RunStep('strip_binaries', _do_strip_binaries, run_in_docker=run_in_docker,
+                   fanout_over='flatten_binaries')
@@ -6,7 +6,6 @@ linking.
 '''
 
 from pathlib import Path
-import pandas as pd
 import re
 import subprocess
 from typing import Any, Dict, List
@@ -21,6 +20,7 @@ def do_find_instr_files(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
     if 'extensions' not in params:
         raise Exception('No instrumentation file extensions specified')
 
+    import pandas as pd     # (slow to import, so only when needed)
     for fb in outputs['flatten_binaries'].values():
         lo = fb.linker_objs
         binary_instr = {}
@@ -72,6 +72,8 @@ def _rebase_linker_objects(old_exp:Path, new_exp:Path, build_folder:Path):
     build_folder: The build folder within which to rebase all .linker-objects files
     '''
     lobjs = list(build_folder.rglob('*.linker-objects'))
+    if lobjs:
+        import pandas as pd     # (slow to import, so only when needed)
 
     for lo in lobjs:
         df = pd.read_csv(lo, names=['Object','Status'])
@@ -1,15 +1,28 @@
 import os
 from pathlib import Path
+import shlex
 import shutil
 import subprocess
 import sys
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 from .. import RunStep
+from ..compilercache import CompilerCache
 from ..run import Run, RunConfig
 from ..runconfig import recognized_opt_levels
 from ..utils import env
 
+CC_WRAPPER_MODES = ['shim', 'python']
+
+DEFAULT_CC_WRAPPER_MODE = 'shim'
+'''Install generated sh shims that exec the compiler directly (python only runs for the compiler cache)'''
+
+# the shims pass the compiler paths to the python cc_wrapper in these
+# (instead of it reading ~/cc_path.txt and ~/cxx_path.txt every time)
+CC_PATH_ENV = 'WDB_CC_PATH'
+CXX_PATH_ENV = 'WDB_CXX_PATH'
+WRAPPED_COMPILER_ENV = 'WDB_WRAPPED_COMPILER'
+
 def get_cc_wrapper_path() -> Path:
     return Path(subprocess.check_output(['which', 'cc_wrapper']).decode('utf-8').strip())
 
@@ -36,9 +49,19 @@ def do_install_cc_wrapper(run:Run, params:Dict[str,Any], outputs:Dict[str,Any]):
     cc_link = Path('/wrapper_bin')/c_compiler_path.name
     cxx_link = Path('/wrapper_bin')/cpp_compiler_path.name
 
-    # create symlink to cc_wrapper named <target_compiler> in /wrapper_bin
-    subprocess.run(['ln', '-s', get_cc_wrapper_path(), cc_link])
-    subprocess.run(['ln', '-s', get_cxx_wrapper_path(), cxx_link])
+    mode = params.get('cc_wrapper_mode', DEFAULT_CC_WRAPPER_MODE)
+    if mode == 'shim':
+        # shell script named <target_compiler> in /wrapper_bin that does what cc_wrapper
+        # does, without starting python for every compile
+        for compiler, link in [(c_compiler_path, cc_link), (cpp_compiler_path, cxx_link)]:
+            link.write_text(make_cc_shim(compiler, c_compiler_path, cpp_compiler_path, get_cc_wrapper_path()))
+            link.chmod(0o755)
+    elif mode == 'python':
+        # create symlink to cc_wrapper named <target_compiler> in /wrapper_bin
+        subprocess.run(['ln', '-s', get_cc_wrapper_path(), cc_link])
+        subprocess.run(['ln', '-s', get_cxx_wrapper_path(), cxx_link])
+    else:
+        raise Exception(f'Unknown cc_wrapper_mode {mode} (expected one of {", ".join(CC_WRAPPER_MODES)})')
     subprocess.run(['hash', '-r'], shell=True)  # apparently bash caches program locations... https://unix.stackexchange.com/a/91176
 
     # allow cc_wrapper to find full path to target compiler for actual invocation later
@@ -62,6 +85,60 @@ def optflag_in_string(s:str) -> bool:
 def filter_optimization_args(argv:List[str]) -> List[str]:
     return [x for x in argv if x not in recognized_opt_levels()]
 
+def make_cc_shim(compiler:Path, c_compiler:Path, cxx_compiler:Path, python_wrapper:Path) -> str:
+    '''
+    Generates the sh script that wraps compiler the same way main() does: the
+    optimization flags are removed from its arguments and CFLAGS/CXXFLAGS, OPT_LEVEL
+    (or -O0) goes in front, and the compiler is exec'd. When the compiler cache is
+    enabled the script hands off to the python wrapper instead.
+
+    compiler: Full path to the compiler this shim wraps
+    c_compiler: Full path to the C compiler (for the python wrapper)
+    cxx_compiler: Full path to the C++ compiler (for the python wrapper)
+    python_wrapper: Path to the cc_wrapper script
+    '''
+    flags_var = 'CXXFLAGS' if compiler == cxx_compiler else 'CFLAGS'
+    opt_levels = '|'.join(recognized_opt_levels())
+    q = lambda p: shlex.quote(str(p))
+    return f'''#!/bin/sh
+# wildebeest cc_wrapper shim for {compiler} (generated by install_cc_wrapper)
+if [ -n "${{WDB_CC_CACHE:-}}" ]; then
+    # the compiler cache is implemented by the python cc_wrapper
+    {CC_PATH_ENV}={q(c_compiler)} {CXX_PATH_ENV}={q(cxx_compiler)} {WRAPPED_COMPILER_ENV}={q(compiler)} exec {q(python_wrapper)} "$@"
+fi
+set -f
+for arg do
+    shift
+    case "$arg" in
+        {opt_levels}) ;;
+        *) set -- "$@" "$arg" ;;
+    esac
+done
+if [ -n "${{{flags_var}:-}}" ]; then
+    flags=
+    for f in ${flags_var}; do
+        case "$f" in
+            {opt_levels}) ;;
+            *) flags="${{flags:+$flags }}$f" ;;
+        esac
+    done
+    if [ -n "$flags" ]; then
+        export {flags_var}="$flags"
+    fi
+fi
+exec {q(compiler)} "${{OPT_LEVEL--O0}}" "$@"
+'''
+
+def _wrapped_compilers() -> Tuple[Path,Path]:
+    '''Returns the (C, C++) compiler paths, from the environment if a shim passed them on'''
+    if CC_PATH_ENV in os.environ and CXX_PATH_ENV in os.environ:
+        return Path(os.environ[CC_PATH_ENV]), Path(os.environ[CXX_PATH_ENV])
+    with open(Path.home()/'cc_path.txt', 'r') as f:
+        c_compiler = Path(f.readlines()[0].strip())
+    with open(Path.home()/'cxx_path.txt', 'r') as f:
+        cxx_compiler = Path(f.readlines()[0].strip())
+    return c_compiler, cxx_compiler
+
 def main():
     '''
     From GCC docs: https://gcc.gnu.org/onlinedocs/gcc/Optimize-Options.html
@@ -70,16 +147,13 @@ def main():
 
     Instead of trying to ensure we are LAST, we just eat everything and replace with the one we want :)
     '''
-    # we ASSUME we are called via the symlink - our symlink name will match
-    # the name of our target compiler
-    symlink_path = Path(sys.argv[0])
+    # we ASSUME we are called via the symlink (or a shim that tells us which
+    # compiler it wraps) - our symlink name will match the name of our target compiler
+    symlink_path = Path(os.environ.get(WRAPPED_COMPILER_ENV, sys.argv[0]))
     opt_level = os.environ['OPT_LEVEL'] if 'OPT_LEVEL' in os.environ else '-O0'
 
     # handle cc vs cxx compiler
-    with open(Path.home()/'cxx_path.txt', 'r') as f:
-        cxx_compiler = Path(f.readlines()[0].strip())
-    with open(Path.home()/'cc_path.txt', 'r') as f:
-        c_compiler = Path(f.readlines()[0].strip())
+    c_compiler, cxx_compiler = _wrapped_compilers()
 
     is_cxx = symlink_path.name == cxx_compiler.name
     compiler = str(cxx_compiler) if is_cxx else str(c_compiler)
@@ -110,12 +184,17 @@ def main():
     # print(f'Called with: {sys.argv}', file=sys.stderr)
     # print(f'Filtered to: {compiler_args}', file=sys.stderr)
 
-    # have to escape quotes since we are running with shell=True
-    escaped_args = [x.replace('"', r'\"') for x in compiler_args]
+    # (no shell, so the arguments reach the compiler exactly as we got them)
+    def run_compiler(args:List[str], **kwargs) -> subprocess.CompletedProcess:
+        return subprocess.run([compiler, *args], **kwargs)
 
     with env(envdict):
         # print(f'sys.arv was: {" ".join(sys.argv)}', flush=True)
         # print(f'sys.arv was: {" ".join(sys.argv)}', file=sys.stderr, flush=True)
         # print(f'CALLING COMPILER: {" ".join([compiler, *compiler_args])}', flush=True)
         # print(f'CALLING COMPILER: {" ".join([compiler, *compiler_args])}', file=sys.stderr, flush=True)
-        return subprocess.run(' '.join([compiler, *escaped_args]), shell=True).returncode
+        cache = CompilerCache.from_env()
+        if cache:
+            return cache.compile(compiler, compiler_args, filtered_flags, run_compiler)
+        # nothing left to do after the compiler, so it can just replace us
+        os.execv(compiler, [compiler, *compiler_args])
@@ -1,12 +1,36 @@
+from pathlib import Path
 from typing import Any, Dict
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     # avoid cyclic dependencies this way
     from ..experiment import Experiment
+    from ..projectbuild import ProjectBuild
 
 from ..experimentalgorithm import ExpStep
 
+DEFAULT_CLONE_JOBS = 8
+'''Number of repos cloned at once by clone_repos'''
+
+DEFAULT_CLONE_FILTER = 'blob:none'
+'''Partial clone filter used by clone_repos (file contents are fetched at checkout)'''
+
+def get_clone_options(params:Dict[str,Any]) -> Dict[str,Any]:
+    '''
+    Returns the GitRepository.init options for these experiment params:
+    clone_filter, clone_shallow, submodule_jobs, git_cache (see GitMirrorCache)
+    and archive_mirror/archive_sha256 (see ArchiveCache)
+    '''
+    from ..archivecache import ArchiveCache
+    from ..gitcache import GitMirrorCache
+    return {
+        'filter': params.get('clone_filter', DEFAULT_CLONE_FILTER),
+        'shallow': params.get('clone_shallow', False),
+        'jobs': params.get('submodule_jobs', DEFAULT_CLONE_JOBS),
+        'git_cache': GitMirrorCache.from_params(params),
+        'archive_cache': ArchiveCache.from_params(params),
+    }
+
 def _clone_repos(exp:'Experiment', params:Dict[str,Any], outputs:Dict[str,Any]):
     '''
     I'm seeing some races with parallel builds sharing the same source folder, so
@@ -18,10 +42,41 @@ def _clone_repos(exp:'Experiment', params:Dict[str,Any], outputs:Dict[str,Any]):
     If I know I don't need this for an experiment (one build per repository) I
     COULD omit it...however I think we will usually be rerunning postprocessing
     on a set of pre-built stuff, so might be a good default
+
+    Repos are cloned in parallel (clone_jobs) with the options from get_clone_options.
+    A repo that fails to clone is reported but doesn't stop the
+    others - its runs will try again (and fail) in their own init step.
     '''
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from ..gitrepository import GitRepository
+
+    # runs of the same recipe share a source folder, so only clone each one once
+    builds:Dict[Path,'ProjectBuild'] = {}
     for run in exp.load_runs():
-        # this doesn't have races because we're not running in parallel right now
-        run.build.init_project_root()
+        builds.setdefault(exp.get_project_source_folder(run.build.recipe), run.build)
+    # (an empty folder isn't cloned yet either, same as GitRepository.init sees it)
+    to_clone = [b for folder, b in builds.items() if not GitRepository.is_initialized(folder)]
+    if not to_clone:
+        return
+
+    clone_options = get_clone_options(params)
+    clone_options['capture_output'] = True
+    numjobs = min(params.get('clone_jobs', DEFAULT_CLONE_JOBS), len(to_clone))
+    print(f'Cloning {len(to_clone)} project repos ({numjobs} at a time)')
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=numjobs) as pool:
+        futures = {pool.submit(b.init_project_root, **clone_options): b.recipe.name for b in to_clone}
+        for f in as_completed(futures):
+            try:
+                f.result()
+                print(f'Cloned {futures[f]}')
+            except Exception as e:
+                failed.append(futures[f])
+                print(f'Failed to clone {futures[f]}: {e}')
+
+    if failed:
+        print(f'{len(failed)}/{len(to_clone)} repos failed to clone: {", ".join(sorted(failed))}')
 
 def clone_repos() -> ExpStep:
     '''
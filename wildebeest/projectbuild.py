@@ -3,6 +3,7 @@ import shutil
 
 from .gitrepository import GitRepository
 from .projectrecipe import ProjectRecipe
+from .staging import DEFAULT_STAGING, stage_tree
 
 class ProjectBuild:
     '''
@@ -50,26 +51,34 @@ class ProjectBuild:
         self.project_root = exp_root/self.project_root.relative_to(old_exp)
         self.build_folder = exp_root/self.build_folder.relative_to(old_exp)
 
-    def init_project_root(self):
+    def init_project_root(self, **clone_options):
         '''
         Creates the project source code folder, cloning it from the git repo
+
+        clone_options: Options passed to GitRepository.init
         '''
         if not self.project_root.exists():
-            self.gitrepo.init()     # clone the project from github if it dne
+            self.gitrepo.init(**clone_options)     # clone the project from github if it dne
 
-    def init(self):
+    def init(self, source_staging:str=DEFAULT_STAGING, **clone_options):
         '''
         Ensures the project build is initialized by cloning the project if needed
         and creating the build folder if needed. This may be called on an existing
         project build without harm.
+
+        source_staging: How the source folder is copied to the build folder for projects
+                        that don't support out-of-tree builds (see stage_tree)
+        clone_options: Options passed to GitRepository.init
         '''
-        self.init_project_root()
+        self.init_project_root(**clone_options)
 
         if self.recipe.supports_out_of_tree:
             self.build_folder.mkdir(parents=True, exist_ok=True)
         elif not self.build_folder.exists():
-            print(f'Copying source folder to build folder as this project does not support out-of-tree builds')
-            shutil.copytree(self.project_root, self.build_folder)
+            print(f'Staging source folder in build folder as this project does not support out-of-tree builds')
+            self.build_folder.parent.mkdir(parents=True, exist_ok=True)
+            counts = stage_tree(self.project_root, self.build_folder, source_staging)
+            print(f'Staged {sum(counts.values())} files ({", ".join(f"{n} {m}" for m, n in counts.items())})')
 
     def destroy(self, destroy_repo:bool=False):
         '''
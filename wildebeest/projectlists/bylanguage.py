@@ -4,10 +4,10 @@ from .. import *
 from ..sourcelanguages import *
 
 def create_c_projects() -> List[str]:
-    return [r.name for r in get_recipes() if LANG_C in r.source_languages]
+    return [r for r in get_recipe_names() if LANG_C in get_recipe_source_languages(r)]
 
 def create_c_only_projects() -> List[str]:
-    return [r.name for r in get_recipes() if len(r.source_languages) == 1 and r.source_languages[0] == LANG_C]
+    return [r for r in get_recipe_names() if get_recipe_source_languages(r) == [LANG_C]]
 
 c_projects = ProjectList('c_projects', create_c_projects)
 c_only_projects = ProjectList('c_only_projects', create_c_only_projects)
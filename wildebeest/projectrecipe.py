@@ -1,9 +1,11 @@
 from pathlib import Path
-from typing import Any, Callable, List, Dict
+from typing import Any, Callable, List, Dict, Union
 from typing import TYPE_CHECKING
+import warnings
 
 if TYPE_CHECKING:
     # avoid cyclic dependencies this way :)
+    from .experiment import Experiment
     from .projectbuild import ProjectBuild
 
 from .runconfig import RunConfig
@@ -143,6 +145,17 @@ class ProjectRecipe:
             return f'{self.git_reponame}@{self.git_head}' if self.git_head else self.git_reponame
         return self._name
 
-    def docker_image_name(self, exp_name:str) -> str:
-        # filtering the @ symbol should be good enough for now? lol
-        return f'recipe_{self.name.replace("@", "_")}-{exp_name}'.lower()
+    def docker_image_name(self, exp:Union['Experiment',str]) -> str:
+        '''
+        Deprecated, use defaultbuildalgorithm.get_recipe_docker_imagename(exp, recipe)
+
+        Recipe images are named by a hash of their dockerfile now (which depends on the
+        experiment, not just its name), so this needs the Experiment itself
+        '''
+        warnings.warn('ProjectRecipe.docker_image_name is deprecated, use get_recipe_docker_imagename(exp, recipe)',
+                      DeprecationWarning, stacklevel=2)
+        if isinstance(exp, str):
+            raise Exception(f'Recipe docker images are no longer named by experiment name ({exp}) - ' +
+                            'pass the Experiment or use get_recipe_docker_imagename(exp, recipe)')
+        from .defaultbuildalgorithm import get_recipe_docker_imagename
+        return get_recipe_docker_imagename(exp, self)
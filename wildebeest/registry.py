@@ -0,0 +1,190 @@
+from importlib import import_module
+import os
+from pathlib import Path
+import pickle
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+from .utils import atomic_write
+
+_INDEX_VERSION = 1
+
+RECIPES_GROUP = 'wildebeest.recipes'
+PROJECT_LISTS_GROUP = 'wildebeest.project_lists'
+EXPERIMENTS_GROUP = 'wildebeest.experiments'
+
+def _entry_points(group:str) -> List:
+    from importlib import metadata      # (slow to import, and only needed to build the index)
+    try:
+        return list(metadata.entry_points(group=group))
+    except TypeError:
+        # python < 3.10 only has the dict interface
+        return list(metadata.entry_points().get(group, []))
+
+def _index_recipe_list(recipe_list:List[Callable]) -> List[Tuple[int,str,Dict[str,Any]]]:
+    # a recipe entry point is a list of recipe callables, we have to create each
+    # recipe to learn its name (this is the expensive part we're caching)
+    entries = []
+    for i, create_recipe in enumerate(recipe_list):
+        r = create_recipe()
+        entries.append((i, r.name, {'source_languages': list(r.source_languages)}))
+    return entries
+
+def _index_named(obj) -> List[Tuple[int,str,Dict[str,Any]]]:
+    return [(None, obj.name, {})]
+
+def _index_class(cls) -> List[Tuple[int,str,Dict[str,Any]]]:
+    return [(None, cls().name, {})]
+
+_GROUPS = {
+    # group: (indexer, first registered name wins)
+    RECIPES_GROUP: (_index_recipe_list, True),
+    PROJECT_LISTS_GROUP: (_index_named, False),
+    EXPERIMENTS_GROUP: (_index_class, False),
+}
+
+class EntryPointIndex:
+    '''
+    Maps the names of registered recipes, project lists and experiments to the
+    entry points that provide them, so looking one up doesn't mean loading (and
+    for recipes, constructing) everything that is registered.
+
+    Each group is indexed the first time it is used and the index is saved to
+    ~/.wildebeest/registry_index.pkl for later wdb processes. The saved index is
+    thrown away when the installed distributions change (by name, version or
+    install time) or when a module that provided an indexed entry is modified
+    (editable installs).
+    '''
+    def __init__(self, index_file:Path=None) -> None:
+        '''
+        index_file: Index cache file (defaults to ~/.wildebeest/registry_index.pkl)
+        '''
+        self.index_file = index_file if index_file else Path.home()/'.wildebeest'/'registry_index.pkl'
+        self._key = None
+        self._groups:Dict[str,Dict[str,Tuple[str,str,int,Dict[str,Any]]]] = None
+        '''Maps group -> name -> (entry point name, entry point value, list position, info)'''
+        self._module_files:Dict[str,Tuple[int,int]] = {}
+        '''Source file -> (mtime_ns, size) of each module that provided an entry'''
+        self.builds = 0
+        '''Number of groups we (re)indexed (for stats/testing)'''
+
+    @staticmethod
+    def _installed_dists() -> Tuple:
+        '''Identifies the installed distributions (dist-info names include the version)'''
+        dists = []
+        for p in sys.path:
+            try:
+                with os.scandir(p or '.') as it:
+                    for entry in it:
+                        if entry.name.endswith(('.dist-info', '.egg-info', '.egg-link', '.pth')):
+                            dists.append((p, entry.name, entry.stat().st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(dists)
+
+    @staticmethod
+    def _file_key(path:str) -> Tuple[int,int]:
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load(self):
+        self._key = self._installed_dists()
+        self._groups = {}
+        self._module_files = {}
+        try:
+            with open(self.index_file, 'rb') as f:
+                version, key, module_files, groups = pickle.load(f)
+        except Exception:
+            return  # missing or unreadable, we just rebuild it
+        if version != _INDEX_VERSION or key != self._key:
+            return
+        if any(self._file_key(path) != fkey for path, fkey in module_files.items()):
+            return
+        self._groups = groups
+        self._module_files = module_files
+
+    def _save(self):
+        data = pickle.dumps((_INDEX_VERSION, self._key, self._module_files, self._groups))
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.index_file, data, fsync=False)
+        except OSError:
+            pass    # we just don't get to keep the index
+
+    def _group(self, group:str) -> Dict[str,Tuple[str,str,int,Dict[str,Any]]]:
+        if self._groups is None:
+            self._load()
+        if group not in self._groups:
+            self._build_group(group)
+        return self._groups[group]
+
+    def _build_group(self, group:str):
+        indexer, first_wins = _GROUPS[group]
+        entries = {}
+        for ep in _entry_points(group):
+            obj = ep.load()
+            for pos, name, info in indexer(obj):
+                if first_wins and name in entries:
+                    continue
+                entries[name] = (ep.name, ep.value, pos, info)
+            module = sys.modules.get(ep.value.partition(':')[0].strip())
+            modfile = getattr(module, '__file__', None)
+            if modfile:
+                self._module_files[modfile] = self._file_key(modfile)
+        self._groups[group] = entries
+        self.builds += 1
+        self._save()
+
+    def invalidate(self):
+        '''Drops the index, so the next lookup re-indexes the entry points'''
+        self._groups = {}
+        self._module_files = {}
+        self._key = self._installed_dists()
+
+    def names(self, group:str) -> List[str]:
+        '''Returns the registered names in this group (in registration order)'''
+        return list(self._group(group).keys())
+
+    def info(self, group:str, name:str) -> Dict[str,Any]:
+        '''Returns the indexed info for this name (e.g. a recipe's source_languages), or None if not registered'''
+        entry = self._group(group).get(name)
+        return entry[3] if entry else None
+
+    @staticmethod
+    def _load_entry(group:str, entry:Tuple[str,str,int,Dict[str,Any]]) -> Any:
+        # same as EntryPoint.load() for module:attr values, without importing importlib.metadata
+        _, ep_value, pos, _ = entry
+        module, _, attrs = ep_value.partition(':')
+        obj = import_module(module.strip())
+        for attr in attrs.split('[')[0].strip().split('.'):
+            if attr:
+                obj = getattr(obj, attr)
+        return obj[pos] if pos is not None else obj
+
+    def load(self, group:str, name:str) -> Any:
+        '''
+        Loads the registered object with this name (for recipes this is the recipe
+        callable) or returns None if it is not registered
+        '''
+        entry = self._group(group).get(name)
+        if entry is None:
+            return None
+        try:
+            return self._load_entry(group, entry)
+        except (ImportError, AttributeError, IndexError):
+            # stale index (e.g. the entry point moved) - reindex and try once more
+            self.invalidate()
+            entry = self._group(group).get(name)
+            return self._load_entry(group, entry) if entry else None
+
+_registry_index:EntryPointIndex = None
+
+def registry_index() -> EntryPointIndex:
+    '''Returns this process' EntryPointIndex'''
+    global _registry_index
+    if _registry_index is None:
+        _registry_index = EntryPointIndex()
+    return _registry_index
@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, Callable, List, Dict
@@ -5,6 +6,8 @@ from typing import Any, Callable, List, Dict
 from .experimentpaths import ExpRelPaths
 from .projectbuild import ProjectBuild
 from .runconfig import RunConfig
+from .statedb import SQLITE_STATE_FORMAT, RunStateDb
+from .stateformat import DEFAULT_STATE_FORMAT, get_state_format, load_state, save_state
 from .utils import *
 
 class RunStatus:
@@ -23,7 +26,7 @@ class Run:
     ExperimentAlgorithm does that and is able to execute a Run.
     '''
     def __init__(self, name:str, number:int, exp_root:Path, build:ProjectBuild, config:RunConfig,
-                get_exp_from_folder:Callable[[Path], Any]) -> None:
+                get_exp_from_folder:Callable[[Path], Any], state_format:str=DEFAULT_STATE_FORMAT) -> None:
         '''
         name: The name for this run
         number: The run number within the experiment
@@ -33,6 +36,7 @@ class Run:
         get_exp_from_folder: Callable that will return the Experiment object given
                              the exp_root folder (we can't type hint since we can't know about
                              Experiment class from here)
+        state_format: Name of the StateFormat used for this run's runstate file
         '''
         self.exp_root = exp_root
         '''The root experiment folder. We save this so we can rebase if needed'''
@@ -52,6 +56,12 @@ class Run:
         self.workload_id = None     # filled in by JobRunner
         '''The workload id, which is unique & deterministic per exp folder location'''
 
+        self.state_format = state_format
+        '''Name of the StateFormat used for this run's runstate file'''
+
+        self.leased_container:str = None
+        '''Name of the pooled docker container leased to this run, if any (see ContainerPool)'''
+
         self._get_exp_from_folder = get_exp_from_folder
         self._last_completed_step = ''
         self._failed_step = ''
@@ -63,6 +73,34 @@ class Run:
         self._runtime:timedelta = None
         self._step_starttimes:Dict[str,datetime] = {}
         self._step_runtimes:Dict[str,timedelta] = {}
+        self._step_peak_rss:Dict[str,int] = {}
+
+        self._batch_depth = 0
+        '''Nesting depth of active batch_updates() blocks (not serialized)'''
+        self._batch_dirty = False
+        '''True if a runstate write was deferred by batch_updates() (not serialized)'''
+        self._detached = False
+        '''True if this copy of the run never writes its runstate (not serialized)'''
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # batching is transient, per-process state - don't persist it
+        state.pop('_batch_depth', None)
+        state.pop('_batch_dirty', None)
+        state.pop('_detached', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'state_format' not in state:
+            self.state_format = DEFAULT_STATE_FORMAT    # runstates from before state formats existed
+        if '_step_peak_rss' not in state:
+            self._step_peak_rss = {}
+        if 'leased_container' not in state:
+            self.leased_container = None
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self._detached = False
 
     @property
     def experiment(self) -> Any:
@@ -72,6 +110,8 @@ class Run:
     @property
     def container_name(self) -> str:
         '''The name of the docker container for this run, if one exists'''
+        if self.leased_container:
+            return self.leased_container
         return f'{self.workload_id}_run{self.number}'
 
     @property
@@ -97,6 +137,20 @@ class Run:
         self._step_runtimes[stepname] = runtime
         self.save_to_runstate_file()
 
+    @property
+    def step_peak_rss(self) -> Dict[str, int]:
+        '''
+        Maps this run's algorithm step names to the peak RSS (in bytes) measured
+        by the JobRunner for the job phase that ran them (steps that run together
+        in one phase share the same value)
+        '''
+        return self._step_peak_rss
+
+    def save_step_peak_rss(self, stepnames:List[str], peak_rss:int):
+        for s in stepnames:
+            self._step_peak_rss[s] = peak_rss
+        self.save_to_runstate_file()
+
     @property
     def last_completed_step(self) -> str:
         '''The name of the last algorithm step that was completed successfully'''
@@ -181,8 +235,12 @@ class Run:
 
     @property
     def runstate_file(self) -> Path:
-        '''Returns the path to this run's runstate file'''
-        return self.exp_root/ExpRelPaths.Runstates/f'run{self.number}.run.yaml'
+        '''Returns the path to this run's runstate file (this is the experiment's shared
+        state db if the run uses the sqlite state format)'''
+        if self.state_format == SQLITE_STATE_FORMAT:
+            return self.exp_root/ExpRelPaths.StateDb
+        suffix = get_state_format(self.state_format).suffix
+        return self.exp_root/ExpRelPaths.Runstates/f'run{self.number}.run{suffix}'
 
     @property
     def data_folder(self) -> Path:
@@ -203,19 +261,79 @@ class Run:
         self.save_to_runstate_file()
 
     @staticmethod
-    def load_from_runstate_file(yamlfile:Path, exp_root:Path) -> 'Run':
+    def _rebase_if_moved(run:'Run', exp_root:Path) -> 'Run':
+        '''Rebases a freshly-loaded run if its experiment folder has moved'''
+        if run.exp_root.absolute() != exp_root.absolute():
+            run.rebase(exp_root)    # rebase saves the runstate file
+        return run
+
+    @staticmethod
+    def load_from_runstate_file(runstate_file:Path, exp_root:Path) -> 'Run':
         '''
+        runstate_file: The runstate file (in any state format) to load
         exp_root: The current experiment root folder
         '''
-        run:Run = load_from_yaml(yamlfile)
-        if run.exp_root.absolute() != exp_root.absolute():
-            run.rebase(exp_root)
-            run.save_to_runstate_file()
-        return run
+        return Run._rebase_if_moved(load_state(runstate_file), exp_root)
+
+    def reload_runstate(self) -> 'Run':
+        '''
+        Loads a fresh copy of this run from its runstate file (or state db), e.g. to
+        pick up changes made by a job process
+        '''
+        if self.state_format == SQLITE_STATE_FORMAT:
+            return Run._rebase_if_moved(RunStateDb(self.runstate_file).load_run(self.number), self.exp_root)
+        return Run.load_from_runstate_file(self.runstate_file, self.exp_root)
+
+    def _write_runstate(self):
+        if self._detached:
+            return
+        if self.state_format == SQLITE_STATE_FORMAT:
+            RunStateDb(self.runstate_file).save_run(self)
+        else:
+            save_state(self, self.runstate_file)
 
     def save_to_runstate_file(self):
-        '''Saves this Run to its runstate file'''
-        save_to_yaml(self, self.runstate_file)
+        '''
+        Saves this Run to its runstate file. Inside a batch_updates() block the
+        write is deferred until the outermost block exits (or flush_updates() is called)
+        '''
+        if self._batch_depth > 0:
+            self._batch_dirty = True
+            return
+        self._write_runstate()
+
+    def flush_updates(self):
+        '''Writes any updates deferred by batch_updates() to the runstate file now'''
+        if self._batch_dirty:
+            self._batch_dirty = False
+            self._write_runstate()
+
+    def detach_runstate(self):
+        '''
+        Permanently stops this in-memory copy of the run from writing its runstate,
+        e.g. in a forked child process that reports its results back to the parent
+        (which owns the runstate)
+        '''
+        self._detached = True
+
+    @contextmanager
+    def batch_updates(self):
+        '''
+        Coalesces the runstate file writes from every property setter inside the
+        with block into a single write when the (outermost) block exits.
+
+        The pending write happens even if the block raises, so the runstate file
+        never falls behind what actually happened by more than the current batch.
+        Use flush_updates() to force a write at a meaningful point mid-batch (e.g.
+        step boundaries).
+        '''
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush_updates()
 
     def init_running_state(self):
         self._outputs = {}
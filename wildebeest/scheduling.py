@@ -0,0 +1,284 @@
+from datetime import timedelta
+import heapq
+import os
+import psutil
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # avoid cyclic dependencies this way
+    from .jobrunner import RunTask
+    from .run import Run
+
+HEAVY_STEPS = ['configure', 'build']
+'''Phases containing any of these steps use the run's build jobs worth of cpus (others use 1)'''
+
+DEFAULT_MEM_PER_BUILD_JOB = 512*1024*1024
+'''Memory estimate per build job for heavy phases we have no history for'''
+
+DEFAULT_LIGHT_PHASE_MEM = 256*1024*1024
+'''Memory estimate for light phases we have no history for'''
+
+PEAK_RSS_MARGIN = 1.25
+'''Headroom applied to historical peak RSS'''
+
+def parse_mem_size(size:str) -> int:
+    '''
+    Parses a memory size like 512M, 32G or 1.5T (or plain bytes) into bytes
+    '''
+    size = str(size).strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    if size and size[-1] in units:
+        return int(float(size[:-1])*units[size[-1]])
+    return int(size)
+
+def format_mem_size(size:int) -> str:
+    return f'{size/1024**3:.1f}G'
+
+def available_cpus() -> int:
+    '''The number of cpus this process may run on'''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+def effective_build_jobs(run:'Run') -> int:
+    '''The number of build jobs the build driver will actually use for this run'''
+    # (this mirrors BuildSystemDriver.build)
+    max_jobs = run.build.recipe.max_build_jobs
+    return max_jobs if max_jobs > 0 else run.config.num_build_jobs
+
+def process_tree_rss(pid:int) -> int:
+    '''Returns the total RSS (bytes) of this process and its descendents, or 0 if it is gone'''
+    try:
+        p = psutil.Process(pid)
+        procs = [p, *p.children(recursive=True)]
+    except psutil.NoSuchProcess:
+        return 0
+    total = 0
+    for proc in procs:
+        try:
+            total += proc.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass    # exited while we were looking
+    return total
+
+class RunHistory:
+    '''
+    Per-step resource usage from earlier executions of runs, keyed by
+    (recipe name, run config name). Lookups fall back to any config of the
+    same recipe if this exact combination hasn't run before.
+    '''
+    def __init__(self) -> None:
+        self._runtimes:Dict[Tuple[str,str],Dict[str,List[timedelta]]] = {}
+        self._peak_rss:Dict[Tuple[str,str],Dict[str,int]] = {}
+
+    @staticmethod
+    def key(run:'Run') -> Tuple[str,str]:
+        return (run.build.recipe.name, run.config.name)
+
+    @staticmethod
+    def from_runs(runs:List['Run']) -> 'RunHistory':
+        history = RunHistory()
+        for r in runs:
+            history.add_run(r)
+        return history
+
+    def add_run(self, run:'Run'):
+        '''Adds the measurements recorded in this run'''
+        k = RunHistory.key(run)
+        step_runtimes = self._runtimes.setdefault(k, {})
+        for step, rt in run.step_runtimes.items():
+            step_runtimes.setdefault(step, []).append(rt)
+        step_rss = self._peak_rss.setdefault(k, {})
+        for step, rss in run.step_peak_rss.items():
+            step_rss[step] = max(rss, step_rss.get(step, 0))
+
+    def _lookup(self, table:Dict[Tuple[str,str],Dict], run:'Run', steps:List[str]) -> List[Dict]:
+        '''Returns the entries for this run's recipe/config (or else the same recipe) that cover all of steps'''
+        exact = table.get(RunHistory.key(run), {})
+        if all(s in exact for s in steps):
+            return [exact]
+        recipe = run.build.recipe.name
+        return [v for k, v in table.items() if k[0] == recipe and all(s in v for s in steps)]
+
+    def peak_rss(self, run:'Run', steps:List[str]) -> int:
+        '''Historical peak RSS (bytes) across these steps, or 0 if unknown'''
+        entries = self._lookup(self._peak_rss, run, steps)
+        return max((e[s] for e in entries for s in steps), default=0)
+
+    def runtime(self, run:'Run', steps:List[str]) -> timedelta:
+        '''
+        Historical mean runtime of these steps, or None if none of them have run
+        before (steps without history count as 0)
+        '''
+        known = False
+        total = timedelta()
+        for s in steps:
+            entries = self._lookup(self._runtimes, run, [s])
+            if entries:
+                samples = [rt for e in entries for rt in e[s]]
+                total += sum(samples, timedelta())/len(samples)
+                known = True
+        return total if known else None
+
+class JobCost:
+    def __init__(self, cpus:int, mem:int) -> None:
+        self.cpus = cpus
+        '''Number of cpu slots'''
+        self.mem = mem
+        '''Memory in bytes'''
+
+    def __repr__(self) -> str:
+        return f'{self.cpus} cpus, {format_mem_size(self.mem)}'
+
+class ResourceScheduler:
+    '''
+    Admission control for JobRunner: each job phase is charged a JobCost (cpu
+    slots and memory) and a phase is only started if it fits in what's left of
+    the global budget. Build phases cost the run's effective build jobs, light
+    (post-processing) phases a single cpu, and memory comes from the peak RSS
+    previous executions of the same recipe/config measured for these steps
+    (docker phases, which we can't measure, get the default estimate).
+
+    A phase is always admitted if nothing else is running, so a job that is
+    bigger than the whole budget still runs (by itself).
+    '''
+    def __init__(self, cpus:int=None, mem:int=None, history:RunHistory=None) -> None:
+        '''
+        cpus: Cpu slot budget (defaults to the available cpus, 0 for no limit)
+        mem: Memory budget in bytes (defaults to 90% of physical memory, 0 for no limit)
+        history: Measurements from previous runs used to estimate job costs
+        '''
+        self.cpus = available_cpus() if cpus is None else cpus
+        self.mem = int(psutil.virtual_memory().total*0.9) if mem is None else mem
+        self.history = history if history else RunHistory()
+        self._in_use:Dict[int,JobCost] = {}
+        '''Maps jobid -> cost of its running phase'''
+
+    def describe(self) -> str:
+        cpus = f'{self.cpus} cpus' if self.cpus else 'unlimited cpus'
+        mem = f'{format_mem_size(self.mem)} memory' if self.mem else 'unlimited memory'
+        return f'Resource budget: {cpus}, {mem}'
+
+    @property
+    def cpus_used(self) -> int:
+        return sum(c.cpus for c in self._in_use.values())
+
+    @property
+    def mem_used(self) -> int:
+        return sum(c.mem for c in self._in_use.values())
+
+    def phase_cost(self, task:'RunTask', start_idx:int, stop_idx:int) -> JobCost:
+        '''Estimates the cost of running steps start_idx..stop_idx of this task'''
+        steps = [s.name for s in task.algorithm.steps[start_idx:stop_idx+1]]
+        heavy = any(s in HEAVY_STEPS for s in steps)
+        cpus = effective_build_jobs(task.run) if heavy else 1
+        if self.cpus:
+            cpus = min(cpus, self.cpus)
+
+        # we can't measure docker phases (see JobRunner.sample_resources), so any
+        # history for them is from the docker client and not the build
+        docker_phase = task.algorithm.steps[start_idx].run_in_docker
+        mem = 0 if docker_phase else int(self.history.peak_rss(task.run, steps)*PEAK_RSS_MARGIN)
+        if not mem:
+            mem = DEFAULT_MEM_PER_BUILD_JOB*cpus if heavy else DEFAULT_LIGHT_PHASE_MEM
+        return JobCost(cpus, mem)
+
+    def can_admit(self, cost:JobCost) -> bool:
+        '''True if a phase with this cost fits in the remaining budget'''
+        if not self._in_use:
+            return True
+        if self.cpus and self.cpus_used + cost.cpus > self.cpus:
+            return False
+        if self.mem:
+            if self.mem_used + cost.mem > self.mem:
+                return False
+            # also respect what's actually free (other users, estimates that were too low)
+            if cost.mem > psutil.virtual_memory().available:
+                return False
+        return True
+
+    def acquire(self, jobid:int, cost:JobCost):
+        self._in_use[jobid] = cost
+
+    def release(self, jobid:int):
+        self._in_use.pop(jobid, None)
+
+def estimate_task_runtime(task:'RunTask', history:RunHistory) -> timedelta:
+    '''
+    Estimates the runtime of this task (from its first step to the end of the
+    algorithm) from history, or None if this recipe hasn't run before
+    '''
+    steps = [s.name for s in task.algorithm.steps[task.run_from_step_idx:]]
+    return history.runtime(task.run, steps)
+
+def _fill_unknown_estimates(estimates:List[timedelta]) -> List[timedelta]:
+    '''Replaces unknown (None) estimates with the mean of the known ones'''
+    known = [e for e in estimates if e is not None]
+    mean = sum(known, timedelta())/len(known) if known else timedelta()
+    return [e if e is not None else mean for e in estimates]
+
+class JobOrderingPolicy:
+    '''
+    Decides the order the JobRunner starts the tasks of a workload in
+    '''
+    name = ''
+    description = ''
+
+    def order(self, tasks:List['RunTask'], history:RunHistory) -> List['RunTask']:
+        raise NotImplementedError(f'{type(self).__name__} has not implemented order()')
+
+class FifoOrdering(JobOrderingPolicy):
+    name = 'fifo'
+    description = 'Start runs in run number order'
+
+    def order(self, tasks:List['RunTask'], history:RunHistory) -> List['RunTask']:
+        return list(tasks)
+
+class LongestFirstOrdering(JobOrderingPolicy):
+    '''
+    Longest processing time first (LPT): start the runs with the longest estimated
+    runtime first so big projects don't start late and stretch out the tail of the
+    experiment while other slots sit idle. Since each run is a chain of steps, its
+    critical path is simply its total remaining runtime.
+
+    Runs with no history are estimated as the mean of the known runs, and ties keep
+    run number order (so with no history at all this is the same as fifo)
+    '''
+    name = 'lpt'
+    description = 'Start the runs with the longest estimated runtime first'
+
+    def order(self, tasks:List['RunTask'], history:RunHistory) -> List['RunTask']:
+        estimates = _fill_unknown_estimates([estimate_task_runtime(t, history) for t in tasks])
+        ordered = sorted(zip(tasks, estimates), key=lambda x: x[1], reverse=True)   # sort is stable
+        return [t for t, _ in ordered]
+
+_ordering_policies:Dict[str,JobOrderingPolicy] = {p.name: p for p in [FifoOrdering(), LongestFirstOrdering()]}
+
+DEFAULT_ORDERING = LongestFirstOrdering.name
+
+def get_ordering_policy_names() -> List[str]:
+    '''Returns the names of the available job ordering policies'''
+    return list(_ordering_policies.keys())
+
+def get_ordering_policy(name:str) -> JobOrderingPolicy:
+    '''Returns the JobOrderingPolicy with the given name'''
+    if name not in _ordering_policies:
+        raise Exception(f'Unknown job ordering "{name}" (expected one of {", ".join(_ordering_policies)})')
+    return _ordering_policies[name]
+
+def simulate_makespan(tasks:List['RunTask'], numjobs:int, history:RunHistory) -> Tuple[timedelta, int]:
+    '''
+    Predicts the makespan of running these tasks (in this order) with numjobs
+    parallel jobs, using estimated runtimes: each task starts in the first slot
+    that frees up, like the JobRunner. This ignores the resource budget.
+
+    Returns the predicted makespan and the number of tasks that had no history
+    (and were estimated as the mean of the others)
+    '''
+    raw = [estimate_task_runtime(t, history) for t in tasks]
+    estimates = _fill_unknown_estimates(raw)
+    slots = [timedelta()]*max(1, min(numjobs, len(tasks)))
+    heapq.heapify(slots)
+    for est in estimates:
+        heapq.heappush(slots, heapq.heappop(slots) + est)
+    return max(slots), raw.count(None)
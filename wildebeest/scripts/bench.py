@@ -0,0 +1,262 @@
+import argparse
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import yaml
+
+from wildebeest.stateformat import StateFormat, YamlStateFormat, get_state_format, get_state_format_names
+
+# Benchmarks for the wildebeest machinery itself (not experiments). Run as:
+#   wdb_bench state                 # synthetic runstates
+#   wdb_bench state --exp fp.exp    # use the runs of a real experiment
+#   wdb_bench startup               # wdb ls recipes startup time
+#   wdb_bench startup --exp fp.exp --job 1  # ...and wdb run --job 1 (re-runs that job!)
+#   wdb_bench importtime            # import time of the wdb cli (fails if over budget)
+#   wdb_bench ccwrapper             # per-compile overhead of the cc_wrapper modes
+
+class _PurePythonYamlFormat(YamlStateFormat):
+    '''The yaml format without libyaml, for comparison'''
+    name = 'yaml (pure python)'
+
+    def dumps(self, obj) -> bytes:
+        return yaml.dump(obj, Dumper=yaml.Dumper).encode('utf-8')
+
+    def loads(self, data:bytes):
+        return yaml.load(data, yaml.Loader)
+
+def _synthetic_run(number:int):
+    from wildebeest.buildsystemdriver import get_buildsystem_driver
+    from wildebeest.projectbuild import ProjectBuild
+    from wildebeest.projectrecipe import ProjectRecipe
+    from wildebeest.run import Run, RunStatus
+    from wildebeest.runconfig import RunConfig
+    from wildebeest.sourcelanguages import LANG_C
+
+    exp_root = Path('/tmp/bench.exp')
+    recipe = ProjectRecipe('make', 'https://github.com/example/project.git', source_languages=[LANG_C],
+                           apt_deps=['libssl-dev', 'zlib1g-dev'])
+    build = ProjectBuild(exp_root, exp_root/'source'/recipe.name, exp_root/'build'/recipe.name/f'run{number}', recipe)
+    run = Run(f'{recipe.name}-default', number, exp_root, build, RunConfig(), None)
+    run._status = RunStatus.FINISHED
+    run._outputs = {
+        'init': {'driver': get_buildsystem_driver('make')},
+        'find_binaries': {'binaries': [build.build_folder/f'bin{i}' for i in range(50)]},
+    }
+    for i in range(10):
+        run._step_starttimes[f'step{i}'] = datetime.now()
+        run._step_runtimes[f'step{i}'] = timedelta(seconds=i)
+    return run
+
+def _bench_format(fmt:StateFormat, runs:List, folder:Path):
+    files = [folder/f'run{i}.run{fmt.suffix}' for i in range(len(runs))]
+
+    start = time.perf_counter()
+    for run, f in zip(runs, files):
+        f.write_bytes(fmt.dumps(run))
+    save_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for f in files:
+        fmt.loads(f.read_bytes())
+    load_sec = time.perf_counter() - start
+
+    avg_size = sum(f.stat().st_size for f in files)/len(files)
+    for f in files:
+        f.unlink()
+    return save_sec, load_sec, avg_size
+
+def bench_state(exp_folder:Path=None, count:int=500):
+    '''
+    Compares save/load throughput of the runstate formats for count runstates
+    (cycling through the runs of exp_folder if given, otherwise synthetic runs)
+    '''
+    if exp_folder:
+        from wildebeest.experiment import Experiment
+        exp_runs = Experiment.load_exp_from_yaml(exp_folder).load_runs()
+        if not exp_runs:
+            print(f'No runs in {exp_folder}')
+            return 1
+        runs = [exp_runs[i % len(exp_runs)] for i in range(count)]
+    else:
+        runs = [_synthetic_run(i+1) for i in range(count)]
+
+    formats = [_PurePythonYamlFormat(), *[get_state_format(n) for n in get_state_format_names()]]
+
+    print(f'{count} runstates')
+    print(f'{"Format":<20} {"save/sec":>10} {"load/sec":>10} {"avg size":>10}')
+    with tempfile.TemporaryDirectory() as td:
+        for fmt in formats:
+            save_sec, load_sec, avg_size = _bench_format(fmt, runs, Path(td))
+            print(f'{fmt.name:<20} {count/save_sec:>10,.0f} {count/load_sec:>10,.0f} {avg_size/1024:>8,.1f}KB')
+    return 0
+
+def _time_cmd(cmd:List[str], repeat:int, cwd:Path=None) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+def bench_startup(exp_folder:Path=None, job:int=None, repeat:int=5):
+    '''
+    Times the registry lookups with a cold vs cached entry point index, and the
+    wall time of wdb commands that every job/listing pays for
+    '''
+    from wildebeest.registry import EXPERIMENTS_GROUP, PROJECT_LISTS_GROUP, RECIPES_GROUP, EntryPointIndex
+    groups = [RECIPES_GROUP, PROJECT_LISTS_GROUP, EXPERIMENTS_GROUP]
+
+    with tempfile.TemporaryDirectory() as td:
+        index_file = Path(td)/'registry_index.pkl'
+        start = time.perf_counter()
+        for g in groups:
+            EntryPointIndex(index_file).names(g)
+        cold_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for g in groups:
+            EntryPointIndex(index_file).names(g)
+        warm_sec = time.perf_counter() - start
+
+    print(f'{"Registry index":<30} cold {cold_sec*1000:>8.1f}ms  cached {warm_sec*1000:>8.1f}ms')
+
+    wdb = str(Path(sys.executable).parent/'wdb')
+    cmds = [('wdb ls recipes', [wdb, 'ls', 'recipes'], None)]
+    if exp_folder and job is not None:
+        cmds.append((f'wdb run --job {job}', [wdb, 'run', '--job', str(job)], exp_folder))
+    for name, cmd, cwd in cmds:
+        times = _time_cmd(cmd, repeat, cwd)
+        print(f'{name:<30} min {min(times)*1000:>9.1f}ms  median {statistics.median(times)*1000:>8.1f}ms')
+    return 0
+
+IMPORT_BUDGET_MS = 150
+'''Import time budget for the wdb cli (wildebeest.scripts.cmdline), which every job phase pays'''
+
+HEAVY_MODULES = ['pandas', 'numpy', 'rich', 'IPython', 'nbconvert', 'tqdm']
+'''Modules the wdb cli must not import up front (the commands that need them import them)'''
+
+def _importtime(module:str) -> Tuple[float, Dict[str,float]]:
+    '''
+    Imports module in a fresh interpreter with -X importtime, returning its
+    cumulative import time and the cumulative time of every module imported (ms)
+    '''
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                       capture_output=True, check=True)
+    times = {}
+    for line in p.stderr.decode('utf-8').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)/1000
+    return times[module], times
+
+def bench_importtime(module:str='wildebeest.scripts.cmdline', repeat:int=5, budget_ms:float=IMPORT_BUDGET_MS, top:int=10):
+    '''
+    Reports the import time of module (the wdb cli by default) and its heaviest
+    imports. Returns 1 if the best time is over budget_ms or a heavy module got
+    imported (so this can be used as a regression check)
+    '''
+    results = [_importtime(module) for _ in range(repeat)]
+    best, times = min(results, key=lambda r: r[0])
+    print(f'{module}: min {best:.1f}ms  median {statistics.median(r[0] for r in results):.1f}ms  (budget {budget_ms:.0f}ms)')
+
+    print('Heaviest imports:')
+    for name, ms in sorted(times.items(), key=lambda x: x[1], reverse=True)[1:top+1]:
+        print(f'  {ms:>8.1f}ms  {name}')
+
+    rcode = 0
+    heavy = [m for m in HEAVY_MODULES if m in times]
+    if heavy:
+        print(f'FAIL: {module} imports {", ".join(heavy)}')
+        rcode = 1
+    if best > budget_ms:
+        print(f'FAIL: {module} import time {best:.1f}ms is over budget ({budget_ms:.0f}ms)')
+        rcode = 1
+    return rcode
+
+def bench_ccwrapper(repeat:int=200):
+    '''
+    Times invocations of a no-op "compiler" directly, through the sh shim and
+    through the python cc_wrapper, and reports the overhead each wrapper adds
+    to every compile
+    '''
+    from wildebeest.preprocessing.cc_wrapper import make_cc_shim
+
+    compiler = Path(subprocess.check_output(['which', 'true']).decode('utf-8').strip())
+    python_wrapper = Path(sys.executable).parent/'cc_wrapper'
+    args = ['-O2', '-Wall', '-g', '-c', 'a.c', '-o', 'a.o']
+
+    with tempfile.TemporaryDirectory() as td:
+        home = Path(td)
+        (home/'cc_path.txt').write_text(str(compiler))
+        (home/'cxx_path.txt').write_text(str(compiler))
+        shim = home/'bin'/'shim'/compiler.name
+        shim.parent.mkdir(parents=True)
+        shim.write_text(make_cc_shim(compiler, compiler, compiler, python_wrapper))
+        shim.chmod(0o755)
+        symlink = home/'bin'/'python'/compiler.name
+        symlink.parent.mkdir(parents=True)
+        symlink.symlink_to(python_wrapper)
+
+        env = {k: v for k, v in os.environ.items() if not k.startswith('WDB_CC_')}
+        env.update({'HOME': str(home), 'OPT_LEVEL': '-O0', 'CFLAGS': '-O2 -Wall'})
+        modes = [('direct', compiler), ('shim', shim), ('python', symlink)]
+        results = {}
+        for name, exe in modes:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run([str(exe), *args], env=env, check=True)
+                times.append(time.perf_counter() - start)
+            results[name] = statistics.median(times)
+
+    print(f'{"mode":<10} {"median":>10} {"overhead":>10}')
+    for name, _ in modes:
+        print(f'{name:<10} {results[name]*1000:>8.2f}ms {(results[name]-results["direct"])*1000:>8.2f}ms')
+    return 0
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmarks for wildebeest internals')
+    subparsers = p.add_subparsers(dest='bench')
+
+    state_p = subparsers.add_parser('state', help='Runstate serialization throughput per state format')
+    state_p.add_argument('--exp', type=Path, help='Benchmark using the runs of this experiment')
+    state_p.add_argument('-n', '--count', type=int, default=500, help='Number of runstates to save/load')
+
+    startup_p = subparsers.add_parser('startup', help='Startup time of the entry point registry and wdb commands')
+    startup_p.add_argument('--exp', type=Path, help='Experiment folder for timing wdb run --job')
+    startup_p.add_argument('--job', type=int, help='Job to time with wdb run --job (this re-runs the job)')
+    startup_p.add_argument('-n', '--repeat', type=int, default=5, help='Number of times to run each command')
+
+    importtime_p = subparsers.add_parser('importtime', help='Import time of the wdb cli (fails if over budget or importing heavy modules)')
+    importtime_p.add_argument('--module', default='wildebeest.scripts.cmdline', help='Module to time')
+    importtime_p.add_argument('-n', '--repeat', type=int, default=5, help='Number of times to import it (the best time is checked)')
+    importtime_p.add_argument('--budget', type=float, default=IMPORT_BUDGET_MS, help='Import time budget in ms')
+
+    ccwrapper_p = subparsers.add_parser('ccwrapper', help='Per-compile overhead of the cc_wrapper (sh shim vs python)')
+    ccwrapper_p.add_argument('-n', '--repeat', type=int, default=200, help='Number of invocations to time per mode')
+
+    args = p.parse_args()
+
+    if args.bench == 'state':
+        return bench_state(args.exp, args.count)
+    elif args.bench == 'startup':
+        return bench_startup(args.exp, args.job, args.repeat)
+    elif args.bench == 'importtime':
+        return bench_importtime(args.module, args.repeat, args.budget)
+    elif args.bench == 'ccwrapper':
+        return bench_ccwrapper(args.repeat)
+
+    p.print_help()
+    return 1
+
+if __name__ == '__main__':
+    main()
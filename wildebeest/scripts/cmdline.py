@@ -1,20 +1,28 @@
 import argparse
 from datetime import datetime, timedelta
+import os
 import shutil
 from itertools import chain
-import argcomplete
 from pathlib import Path
-import pandas as pd
 from termcolor import colored
 from typing import List, Tuple
-from rich.console import Console
-from rich.table import Table
 
-from wildebeest import Experiment, ExpState
+# NOTE: keep the imports here light - every job phase starts a "wdb run --job"
+# (pandas, rich etc. are imported by the commands that need them)
+from wildebeest.experiment import Experiment, ExpState
+from wildebeest.experimentrepository import create_experiment, get_experiment_names
 from wildebeest.jobrunner import Job, run_job
-from wildebeest import *
-from wildebeest.defaultbuildalgorithm import *
+from wildebeest.projectlistrepository import get_project_list, get_project_list_names
+from wildebeest.reciperepository import get_recipe, get_recipe_names
+from wildebeest.containerpool import ContainerPool
+from wildebeest.defaultbuildalgorithm import docker_attach_to_bash, docker_cleanup, docker_container_exists, \
+    docker_is_running, docker_restart, docker_run, ensure_pooled_container, get_recipe_docker_imagename, \
+    uses_container_pool
 from wildebeest.run import RunStatus
+from wildebeest.scheduling import DEFAULT_ORDERING, get_ordering_policy_names, parse_mem_size
+from wildebeest.statedb import SQLITE_STATE_FORMAT
+from wildebeest.statuscache import RunStatusCache
+from wildebeest.stateformat import get_state_format_names
 
 # Other wdb command line examples/ideas:
 # --------------------------------------
@@ -127,7 +135,7 @@ def extract_run_numbers(run_spec:str) -> List[int]:
 
 def cmd_run_exp(exp:Experiment, run_spec:str='', numjobs=1, force=False, run_from_step:str='',
         no_pre:bool=False, no_post:bool=False, buildjobs:int=None, debug:bool=False,
-        debug_docker:bool=False):
+        debug_docker:bool=False, cpus:int=None, mem:str=None, order:str=DEFAULT_ORDERING):
 
     run_list = None
     if run_spec:
@@ -144,7 +152,19 @@ def cmd_run_exp(exp:Experiment, run_spec:str='', numjobs=1, force=False, run_fro
     return exp.run(force=force, numjobs=numjobs, run_list=run_list,
                    run_from_step=run_from_step,
                    no_pre=no_pre, no_post=no_post, buildjobs=buildjobs,
-                   debug_in_process=debug, debug_docker=debug_docker)
+                   debug_in_process=debug, debug_docker=debug_docker,
+                   cpus=cpus, mem=parse_mem_size(mem) if mem is not None else None,
+                   order=order)
+
+def cmd_simulate_exp(exp:Experiment, numjobs:int=1, run_from_step:str=''):
+    results = exp.simulate_run(numjobs, run_from_step)
+    print(f'Predicted makespan with {numjobs} parallel jobs:')
+    for name, (makespan, _) in results.items():
+        print(f'  {name:<6} {timedelta(seconds=int(makespan.total_seconds()))}')
+    num_unknown = next(iter(results.values()))[1]
+    if num_unknown:
+        print(f'({num_unknown} runs have no history and were estimated as the average run)')
+    return 0
 
 def cmd_docker_shell(exp:Experiment, run_number:int, run_as_root:bool):
     matching_runs = [r for r in exp.load_runs() if r.number == run_number]
@@ -154,6 +174,17 @@ def cmd_docker_shell(exp:Experiment, run_number:int, run_as_root:bool):
 
     run = matching_runs[0]
 
+    if uses_container_pool(run, exp.params):
+        # pooled containers only go through the pool, so it keeps track of them
+        leased = bool(run.leased_container)
+        if ensure_pooled_container(run, exp.params) and leased:
+            run.save_to_runstate_file()
+        docker_attach_to_bash(run, run_as_root)
+        if not leased:
+            docker_cleanup(run, exp.params, {})     # just leased it for the shell, give it back
+        # (otherwise the run still holds it, and its own docker_cleanup gives it back)
+        return 0
+
     if not docker_is_running(run):
         if docker_container_exists(run):
             print(f'Restarting existing container...')
@@ -241,37 +272,9 @@ def cmd_info_exp(exp1:Experiment):
     print(f'Total # of runs = {num_runs}')
     return 0
 
-def calc_inprogress_runtime(r:'Run') -> Tuple[timedelta, timedelta]:
-    now = datetime.now()
-    totalrt = now - r.starttime
-    totalrt = timedelta(days=totalrt.days, seconds=totalrt.seconds)    # remove subsecond precision
-    steprt = now - r.step_starttimes[r.current_step]
-    steprt = timedelta(days=steprt.days, seconds=steprt.seconds)
-    return steprt, totalrt
-
-def calc_total_completed_runtime(r:'Run', step_rt:timedelta=None) -> timedelta:
-    '''
-    step_rt: In-progress step runtime, if applicable
-    '''
-    all_runtimes = list(r.step_runtimes.values())
-    if step_rt:
-        all_runtimes.append(step_rt)
-    all_steps_rt = all_runtimes[0] if all_runtimes else timedelta(days=0, seconds=0)
-    for x in all_runtimes[1:]:
-        all_steps_rt += x
-    all_steps_rt = timedelta(days=all_steps_rt.days, seconds=all_steps_rt.seconds)  # remove subsecond precision
-
-    return all_steps_rt
-
-run_formats = {
-    RunStatus.RUNNING: 'bold cyan',
-    RunStatus.READY: '',
-    RunStatus.FAILED: 'bold red',
-    RunStatus.FINISHED: 'bold green',
-}
-
 def cmd_status_exp(exp:Experiment):
-    runs = exp.load_runs()
+    from wildebeest.dashboard import calc_inprogress_runtime
+    runs = RunStatusCache(exp).load_runs()
     for r in runs:
         if r.status == RunStatus.FINISHED:
             print(colored(f'Run {r.number} ({r.name}) - finished [{r.runtime}]', 'green'))
@@ -291,6 +294,9 @@ def cmd_status_exp(exp:Experiment):
     return 0
 
 def cmd_runtimes_exp(exp:Experiment):
+    from rich.console import Console
+    from rich.table import Table
+    from wildebeest.dashboard import calc_inprogress_runtime, calc_total_completed_runtime
     console = Console()
     runs = exp.load_runs()
     for r in runs:
@@ -340,62 +346,15 @@ def cmd_runtimes_exp(exp:Experiment):
         console.print(table)
     return 0
 
-def cmd_dashboard(exp_parent_folder:Path, running_only:bool, run_numbers:List[int]=None):
-    global run_formats
-
-    console = Console()
-    table = Table(title=f'wdb dashboard {exp_parent_folder}', header_style='default', title_style='default')
-    table.add_column('Folder')
-    table.add_column('Exp name')
-    table.add_column('Run #')
-    table.add_column('Run Name')
-    table.add_column('Status')
-    table.add_column('Runtime')
-    table.add_column('Step Progress')
-    table.add_column('Current Step')
-    table.add_column('Step Runtime')
-    table.add_column('Total Runtime')
-
-    exp_folders = [exp_parent_folder] if Experiment.is_exp_folder(exp_parent_folder) else [x for x in exp_parent_folder.iterdir() if not x.is_file()]
-
-    for exp_folder in sorted(exp_folders):
-        if not Experiment.is_exp_folder(exp_folder):
-            return
-
-        exp = Experiment.load_exp_from_yaml(exp_folder)
-
-        run_list = sorted([exp.load_run_from_id(n) for n in run_numbers], key=lambda r: r.number) if run_numbers else exp.load_runs()
-        if running_only:
-            run_list = [r for r in run_list if r.status == RunStatus.RUNNING]
-
-        for r in run_list:
-            fmt = run_formats[r.status]
-            if r.status == RunStatus.RUNNING:
-                step_rt, run_runtime = calc_inprogress_runtime(r)
-            else:
-                step_rt = '--'
-                run_runtime = r.runtime
-            step_num = exp.algorithm.get_index_of_step(r.current_step)+1 if r.current_step else 1
-            num_steps = len(exp.algorithm.steps)
-            step_prog = f'{step_num}/{num_steps} ({step_num/num_steps*100:.1f}%)'
-            step_color = '[yellow]' if r.status == RunStatus.RUNNING else ''
-            overall_rt_color = '[blue]' if r.status == RunStatus.RUNNING else ''
-
-            folder_name = r.build.recipe.name if len(exp_folders) == 1 else exp_folder.name
-
-            overall_rt = calc_total_completed_runtime(r, None if step_rt == '--' else step_rt)
-            table.add_row(folder_name,
-                        exp.name,
-                        f'Run {r.number}',
-                        r.config.name,
-                        r.status,
-                        str(run_runtime),
-                        step_prog,
-                        f'{step_color}{r.current_step}',
-                        f'{step_color}{str(step_rt)}',
-                        f'{overall_rt_color}{overall_rt}', style=fmt)
-
-    console.print(table)
+def cmd_dashboard(exp_parent_folder:Path, running_only:bool, run_numbers:List[int]=None, live:bool=False):
+    from rich.console import Console
+    from wildebeest.dashboard import Dashboard
+    dashboard = Dashboard(exp_parent_folder, running_only, run_numbers)
+    if live:
+        dashboard.run_live()
+        return 0
+    dashboard.refresh()
+    Console().print(dashboard.render())
     return 0
 
 def load_job_from_id(exp:Experiment, jobid:int) -> Job:
@@ -452,6 +411,24 @@ def cmd_rm_build(exp:Experiment, force:bool):
         print(f'No build folder at {exp.build_folder}')
         return 1
 
+def cmd_rm_containers(exp:Experiment, force:bool):
+    pool = ContainerPool()
+    images = [get_recipe_docker_imagename(exp, r) for r in exp.projectlist]
+    removed = pool.remove_containers(images, include_leased=force)
+    print(f'Removed {len(removed)} pooled containers')
+    leased = [n for n, c in pool.containers().items() if c['image'] in images]
+    if leased:
+        print(f'Skipped {len(leased)} containers that are leased to runs (rerun with -f to remove them too)')
+    return 0
+
+def cmd_convert_state(exp:Experiment, state_format:str):
+    if state_format == exp.state_format:
+        print(f'Experiment {exp.exp_folder} already uses the {state_format} state format')
+        return 0
+    print(f'Converting runstates from {exp.state_format} to {state_format}...')
+    exp.convert_runstates(state_format)
+    return 0
+
 def main():
     p = argparse.ArgumentParser(description='Runs wildebeest commands')
     p.add_argument('--exp', type=Path, default=Path().cwd(), help='The experiment folder')
@@ -471,10 +448,16 @@ def main():
     run_p.add_argument('run_numbers', nargs='?', type=str,
                         help='Subset of runs to execute (e.g. "1", "2-5", "1,4", "1,4-8,9-10")')
     run_p.add_argument('--job', help='Job number to run', type=int)
+    run_p.add_argument('--job-yaml', help='Job yaml file to run (like --job, but without loading the experiment first)', type=Path)
     run_p.add_argument('-j', '--numjobs', help='Number of parallel jobs to use while running', type=int, default=1)
     run_p.add_argument('-b', '--buildjobs', help='Number of jobs to use for each individual build (independent of --numjobs)',
                         type=int)
     run_p.add_argument('-f', '--force', help='Force running the experiment or job', action='store_true')
+    run_p.add_argument('--cpus', type=int, help='Cpu budget shared by all jobs, where build phases count as their # build jobs (default: all cpus, 0 = no limit)')
+    run_p.add_argument('--mem', type=str, help='Memory budget shared by all jobs, e.g. 32G (default: 90%% of RAM, 0 = no limit)')
+    run_p.add_argument('--order', choices=get_ordering_policy_names(), default=DEFAULT_ORDERING,
+                        help='Order to start runs in (lpt: longest estimated runtime first, fifo: run number order)')
+    run_p.add_argument('--simulate', action='store_true', help='Predict the makespan for -j under each --order from previous runtimes instead of running')
     run_p.add_argument('--from', dest='run_from_step', type=str, help='The step name to begin running (existing runs) from', default='')
     run_p.add_argument('--to', dest='run_to_step', type=str, help='The step name to run to (including this step)', default='')
     run_p.add_argument('--no-pre', help='Skip preprocessing steps', action='store_true')
@@ -509,6 +492,8 @@ def main():
     dashboard_p.add_argument('run_numbers', nargs='?', type=str,
                             help='Subset of runs to execute (e.g. "1", "2-5", "1,4", "1,4-8,9-10")')
     dashboard_p.add_argument('-r', action='store_true', help='Only show status on currently executing runs')
+    dashboard_p.add_argument('--live', '--watch', dest='live', action='store_true',
+                             help='Keep the dashboard up, updating it as runs change')
 
     # --- runtimes: Print experiment step runtimes
     runtimes_p = subparsers.add_parser('runtimes', help='Show runtimes of experiment steps')
@@ -521,9 +506,14 @@ def main():
     # --- rm: Remove folders/artifacts from experiment
     rm_p = subparsers.add_parser('rm', help='Delete folders or artifacts from the experiment')
     rm_p.add_argument('object', help='The object to delete',
-                       choices=['build'])
+                       choices=['build', 'containers'])
     rm_p.add_argument('-f', '--force', help='Force option required to remove experiment data', action='store_true')
 
+    # --- state: Manage how experiment state is stored
+    state_p = subparsers.add_parser('state', help='Manage how the experiment state is stored')
+    state_p.add_argument('action', help='The state operation to perform', choices=['convert'])
+    state_p.add_argument('format', help='The state format to convert runstates to', choices=[*get_state_format_names(), SQLITE_STATE_FORMAT])
+
     # --- docker_shell: Interact with a run's docker container
     docker_p = subparsers.add_parser('docker_shell', help='Attach to an interactive bash shell for a run\'s docker container')
     docker_p.add_argument('run_number', help='The run number whose docker container should be launched', type=int)
@@ -535,7 +525,9 @@ def main():
     #     help='Yaml file for the job to run',
     #     type=Path)
 
-    argcomplete.autocomplete(p)
+    if '_ARGCOMPLETE' in os.environ:
+        import argcomplete      # only needed when completing
+        argcomplete.autocomplete(p)
     args = p.parse_args()
 
     # --- wdb create
@@ -553,11 +545,16 @@ def main():
         return cmd_create_exp(exp_folder, name, proj_list, **exp_kwargs)
     # --- wdb run
     elif args.subcmd == 'run':
+        if args.job_yaml is not None:
+            return run_job(args.job_yaml, args.run_from_step, args.run_to_step)
         if args.job is not None:
             return cmd_run_job(args)
+        if args.simulate:
+            return cmd_simulate_exp(get_experiment(args), args.numjobs, args.run_from_step)
         return cmd_run_exp(get_experiment(args), args.run_numbers, args.numjobs, args.force, args.run_from_step,
                             no_pre=args.no_pre, no_post=args.no_post, buildjobs=args.buildjobs,
-                            debug=args.debug, debug_docker=args.debug_docker)
+                            debug=args.debug, debug_docker=args.debug_docker,
+                            cpus=args.cpus, mem=args.mem, order=args.order)
 
     # --- wdb docker_shell
     elif args.subcmd == 'docker_shell':
@@ -589,7 +586,7 @@ def main():
     # --- wdb dashboard
     elif args.subcmd == 'dashboard':
         run_numbers = extract_run_numbers(args.run_numbers) if args.run_numbers else None
-        return cmd_dashboard(Path(args.exp_parent_folder), running_only=args.r, run_numbers=run_numbers)
+        return cmd_dashboard(Path(args.exp_parent_folder), running_only=args.r, run_numbers=run_numbers, live=args.live)
     # --- wdb kill
     elif args.subcmd == 'kill':
         exp = get_experiment(args)
@@ -610,6 +607,13 @@ def main():
         exp = get_experiment(args)
         if args.object == 'build':
             return cmd_rm_build(exp, args.force)
+        elif args.object == 'containers':
+            return cmd_rm_containers(exp, args.force)
+    # --- wdb state
+    elif args.subcmd == 'state':
+        exp = get_experiment(args)
+        if args.action == 'convert':
+            return cmd_convert_state(exp, args.format)
     import sys
     print(f'Unhandled cmd-line: {" ".join(sys.argv)}')
     p.print_help()
@@ -0,0 +1,101 @@
+from collections import Counter
+import errno
+import fcntl
+import os
+from pathlib import Path
+import shutil
+from typing import Dict
+
+FICLONE = 0x40049409
+'''ioctl to reflink a whole file (_IOW(0x94, 9, int) from linux/fs.h)'''
+
+STAGING_METHODS = ['auto', 'reflink', 'hardlink', 'copy']
+
+DEFAULT_STAGING = 'auto'
+'''Reflink the source files if the filesystem supports it, otherwise copy them'''
+
+# errors that mean "this filesystem (pair) can't do that", as opposed to real failures
+_UNSUPPORTED_ERRNOS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM)
+
+def reflink_file(src:str, dst:str) -> bool:
+    '''
+    Creates dst as a reflink (copy-on-write clone) of src, so they share data blocks
+    until one of them is written. Returns False if the filesystem doesn't support it
+    (dst may be left behind, empty)
+    '''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                return False
+            raise
+    return True
+
+class _TreeStager:
+    '''shutil.copytree copy_function that reflinks/hardlinks where it can, counting what it did'''
+    def __init__(self, method:str) -> None:
+        self.method = method
+        self.can_reflink = method in ('auto', 'reflink')
+        self.can_hardlink = method == 'hardlink'
+        self.counts = Counter()
+
+    def __call__(self, src:str, dst:str) -> str:
+        if self.can_reflink:
+            if reflink_file(src, dst):
+                shutil.copystat(src, dst)
+                self.counts['reflink'] += 1
+                return dst
+            self.can_reflink = False    # (the whole tree is on the same filesystems)
+        elif self.can_hardlink and not os.path.islink(src):
+            # (os.link would link the symlink itself, not copy what it points to like
+            # the other methods do)
+            try:
+                os.link(src, dst)
+                self.counts['hardlink'] += 1
+                return dst
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                self.can_hardlink = e.errno == errno.EMLINK     # (too many links is per-file)
+        shutil.copy2(src, dst)
+        self.counts['copy'] += 1
+        return dst
+
+def stage_tree(src:Path, dest:Path, method:str=DEFAULT_STAGING) -> Dict[str,int]:
+    '''
+    Copies the src folder tree to dest (like shutil.copytree) as cheaply as the
+    filesystem allows, returning the number of files staged each way.
+
+    Symlinks are followed (dest gets a copy of what they point to) with every method,
+    as shutil.copytree does by default.
+
+    Nothing is visible at dest until the whole tree has been staged, so a failure
+    part way through doesn't leave a partial tree behind to be mistaken for a
+    complete one.
+
+    method: auto:     reflink files if the filesystem supports it (btrfs, xfs...),
+                      otherwise copy them
+            reflink:  same as auto (reflinks are invisible to the build, so falling
+                      back to a copy is always safe)
+            hardlink: hardlink files (falling back to a copy across filesystems).
+                      This is nearly free on any filesystem, but the files are SHARED
+                      with src: a build that modifies an existing file in place (rather
+                      than replacing it, like most tools do) changes it for src and all
+                      other runs too
+            copy:     plain copy
+    '''
+    if method not in STAGING_METHODS:
+        raise Exception(f'Unknown source staging method {method} (expected one of {", ".join(STAGING_METHODS)})')
+
+    tmp = dest.with_name(f'{dest.name}.staging')
+    if tmp.exists():
+        shutil.rmtree(tmp)     # left over from a failed attempt
+    stager = _TreeStager(method)
+    try:
+        shutil.copytree(src, tmp, copy_function=stager)
+    except:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    tmp.rename(dest)
+    return dict(stager.counts)
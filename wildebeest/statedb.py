@@ -0,0 +1,153 @@
+import json
+import os
+from pathlib import Path
+import sqlite3
+from typing import Dict, List, TYPE_CHECKING
+
+from .stateformat import PickleStateFormat
+
+if TYPE_CHECKING:
+    # avoid cyclic dependencies this way
+    from .run import Run
+
+SQLITE_STATE_FORMAT = 'sqlite'
+'''Runstate "format" name for experiments whose runstates live in a RunStateDb'''
+
+_SCHEMA_VERSION = 1
+
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS runs (
+        number INTEGER PRIMARY KEY,
+        name TEXT,
+        status TEXT,
+        current_step TEXT,
+        last_completed_step TEXT,
+        failed_step TEXT,
+        error_msg TEXT,
+        starttime TEXT,
+        runtime REAL,
+        output_keys TEXT,
+        state BLOB
+    )''',
+    '''CREATE INDEX IF NOT EXISTS runs_status ON runs (status)''',
+    '''CREATE INDEX IF NOT EXISTS runs_failed_step ON runs (failed_step)''',
+    '''CREATE TABLE IF NOT EXISTS step_times (
+        run INTEGER,
+        step TEXT,
+        starttime TEXT,
+        runtime REAL,
+        PRIMARY KEY (run, step)
+    )''',
+]
+
+# one connection per db file per process (sqlite connections can't cross a fork,
+# so we remember which pid opened them)
+_connections:Dict[str,sqlite3.Connection] = {}
+_connections_pid = None
+
+def _connect(db_file:Path) -> sqlite3.Connection:
+    global _connections_pid
+    if _connections_pid != os.getpid():
+        _connections.clear()
+        _connections_pid = os.getpid()
+
+    key = str(db_file.absolute())
+    if key not in _connections:
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        # generous timeout: hundreds of job processes may be writing at once
+        con = sqlite3.connect(key, timeout=120, isolation_level=None)
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute('PRAGMA synchronous=NORMAL')    # still crash-safe in WAL mode
+        for stmt in _SCHEMA:
+            con.execute(stmt)
+        con.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('schema_version', str(_SCHEMA_VERSION)))
+        _connections[key] = con
+    return _connections[key]
+
+class RunStateDb:
+    '''
+    Single-file sqlite store for an experiment's runstates (.wildebeest/state.db),
+    used instead of per-run files when the experiment's state_format is 'sqlite'.
+
+    Each run is a row holding the (pickled) Run plus indexed copies of the fields
+    status tools filter on, so queries like "all running runs" or "runs that failed
+    in step X" only deserialize the matching rows. Job processes update their own
+    run's row, and the database runs in WAL mode so readers never block writers.
+    '''
+    def __init__(self, db_file:Path) -> None:
+        self.db_file = db_file
+        self._format = PickleStateFormat()
+
+    @property
+    def con(self) -> sqlite3.Connection:
+        return _connect(self.db_file)
+
+    def _run_rows(self, run:'Run'):
+        run_row = (run.number, run.name, run.status, run.current_step, run.last_completed_step,
+                   run.failed_step, run.error_msg,
+                   run.starttime.isoformat() if run.starttime else None,
+                   run.runtime.total_seconds() if run.runtime else None,
+                   json.dumps(list(run.outputs.keys())),
+                   self._format.dumps(run))
+        step_rows = [(run.number, step, st.isoformat(),
+                      run.step_runtimes[step].total_seconds() if step in run.step_runtimes else None)
+                     for step, st in run.step_starttimes.items()]
+        return run_row, step_rows
+
+    def save_runs(self, runs:List['Run']):
+        '''Saves (inserts or replaces) the given runs in a single transaction'''
+        rows = [self._run_rows(r) for r in runs]
+        con = self.con
+        with con:
+            con.execute('BEGIN IMMEDIATE')
+            for run_row, step_rows in rows:
+                con.execute('INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?,?,?,?,?,?)', run_row)
+                con.execute('DELETE FROM step_times WHERE run = ?', (run_row[0],))
+                con.executemany('INSERT INTO step_times VALUES (?,?,?,?)', step_rows)
+
+    def save_run(self, run:'Run'):
+        '''Saves (inserts or replaces) this run's row'''
+        self.save_runs([run])
+
+    def load_run(self, number:int) -> 'Run':
+        '''Loads the run with the given number, or None if it isn't in the db'''
+        row = self.con.execute('SELECT state FROM runs WHERE number = ?', (number,)).fetchone()
+        return self._format.loads(row[0]) if row else None
+
+    def query_runs(self, status:str=None, failed_step:str=None) -> List['Run']:
+        '''
+        Loads the runs matching all of the given criteria (all runs if none are given),
+        ordered by run number
+        '''
+        where = []
+        args = []
+        if status is not None:
+            where.append('status = ?')
+            args.append(status)
+        if failed_step is not None:
+            where.append('failed_step = ?')
+            args.append(failed_step)
+        sql = 'SELECT state FROM runs'
+        if where:
+            sql += f' WHERE {" AND ".join(where)}'
+        sql += ' ORDER BY number'
+        return [self._format.loads(row[0]) for row in self.con.execute(sql, args)]
+
+    def delete_runs(self):
+        '''Removes all runs from the db'''
+        con = self.con
+        with con:
+            con.execute('BEGIN IMMEDIATE')
+            con.execute('DELETE FROM runs')
+            con.execute('DELETE FROM step_times')
+
+def statedb_file_names(db_file:Path) -> List[Path]:
+    '''Returns the db file along with its WAL-mode sidecar files'''
+    return [db_file, db_file.with_name(f'{db_file.name}-wal'), db_file.with_name(f'{db_file.name}-shm')]
+
+def close_statedb(db_file:Path):
+    '''Closes this process' connection to the db file, if it has one'''
+    con = _connections.pop(str(db_file.absolute()), None)
+    if con is not None and _connections_pid == os.getpid():
+        con.close()
@@ -0,0 +1,96 @@
+import pickle
+from pathlib import Path
+from typing import Any, Dict
+
+from .utils import atomic_write, yaml_dump, yaml_load
+
+class StateFormat:
+    '''
+    Interface for a serialization format used to persist wildebeest state
+    (runstate files). Each format is identified by its name (which is what
+    gets saved in experiment params) and by its file suffix (which is how we
+    recognize existing state files on disk).
+    '''
+    name = ''
+    suffix = ''
+
+    def dumps(self, obj) -> bytes:
+        raise NotImplementedError(f'{type(self).__name__} has not implemented dumps()')
+
+    def loads(self, data:bytes) -> Any:
+        raise NotImplementedError(f'{type(self).__name__} has not implemented loads()')
+
+class YamlStateFormat(StateFormat):
+    '''
+    The original (human-readable) yaml format. Uses libyaml when PyYAML was
+    built with it, which reads/writes the exact same documents much faster
+    '''
+    name = 'yaml'
+    suffix = '.yaml'
+
+    def dumps(self, obj) -> bytes:
+        return yaml_dump(obj).encode('utf-8')
+
+    def loads(self, data:bytes) -> Any:
+        return yaml_load(data)
+
+class PickleStateFormat(StateFormat):
+    '''
+    Compact binary format: a magic string and format version followed by a pickle
+    of the object.
+
+    NOTE: a schema-based JSON/msgpack format isn't an option for runstates since
+    run outputs hold arbitrary step objects (build drivers, FlatLayoutBinary, ...).
+    Pickle handles the same objects yaml does (functions by reference, no lambdas)
+    '''
+    name = 'pickle'
+    suffix = '.pkl'
+
+    MAGIC = b'WDBSTATE'
+    VERSION = 1
+    '''Bump this if the envelope changes so older versions refuse newer files'''
+
+    def dumps(self, obj) -> bytes:
+        return self.MAGIC + bytes([self.VERSION]) + pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data:bytes) -> Any:
+        header_len = len(self.MAGIC) + 1
+        if data[:len(self.MAGIC)] != self.MAGIC:
+            raise Exception('Not a wildebeest pickle state file (bad magic)')
+        version = data[len(self.MAGIC)]
+        if version > self.VERSION:
+            raise Exception(f'State file format version {version} is newer than supported version {self.VERSION}')
+        return pickle.loads(data[header_len:])
+
+_state_formats:Dict[str,StateFormat] = {f.name: f for f in [YamlStateFormat(), PickleStateFormat()]}
+
+DEFAULT_STATE_FORMAT = YamlStateFormat.name
+
+def get_state_format_names():
+    '''Returns the names of the available state formats'''
+    return list(_state_formats.keys())
+
+def get_state_format(name:str) -> StateFormat:
+    '''Returns the StateFormat with the given name'''
+    if name not in _state_formats:
+        raise Exception(f'Unknown state format "{name}" (expected one of {", ".join(_state_formats)})')
+    return _state_formats[name]
+
+def state_format_from_path(path:Path) -> StateFormat:
+    '''Returns the StateFormat for an existing state file based on its suffix'''
+    fmt = next((f for f in _state_formats.values() if f.suffix == path.suffix), None)
+    if fmt is None:
+        raise Exception(f'No state format recognizes the file {path}')
+    return fmt
+
+def load_state(path:Path) -> Any:
+    '''Deserializes an object from the given state file (any format)'''
+    return state_format_from_path(path).loads(path.read_bytes())
+
+def save_state(obj, path:Path):
+    '''
+    Serializes obj to the given state file, in the format matching its suffix.
+    The containing folder is created if needed and the file is replaced atomically.
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, state_format_from_path(path).dumps(obj))
@@ -0,0 +1,211 @@
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import pickle
+import select
+import struct
+import time
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+from .run import Run
+from .utils import atomic_write
+
+if TYPE_CHECKING:
+    # avoid cyclic dependencies this way
+    from .experiment import Experiment
+
+_CACHE_VERSION = 1
+
+class RunStatusCache:
+    '''
+    Keeps an experiment's deserialized runs alongside the (inode, mtime, size) of
+    the runstate file each came from, so status tools only reload the runstates that
+    changed since the last time they looked. Runstates are replaced atomically, so
+    every save gets a new inode even if the mtime and size don't change. The cache is saved to
+    .wildebeest/status_cache.pkl (so separate "wdb dashboard" invocations share it)
+    and lives in memory for long-running readers like "wdb dashboard --watch".
+
+    Experiments using the state db don't need this (the db is already indexed),
+    so this just queries the db for them.
+    '''
+    def __init__(self, exp:'Experiment') -> None:
+        self.exp = exp
+        self.cache_file = exp.status_cache_file
+        self._entries:Dict[str,Tuple[Tuple[int,int,int],Run]] = None
+        '''Maps runstate file name -> ((inode, mtime_ns, size), Run)'''
+        self._runs:List[Run] = None
+
+    def _load_cache(self) -> Dict[str,Tuple[Tuple[int,int,int],Run]]:
+        try:
+            with open(self.cache_file, 'rb') as f:
+                version, exp_folder, entries = pickle.load(f)
+            # the cached runs were rebased to the folder they were loaded from
+            if version == _CACHE_VERSION and exp_folder == str(self.exp.exp_folder.resolve()):
+                return entries
+        except Exception:
+            pass    # missing, stale or unreadable - we just rebuild it
+        return {}
+
+    def _save_cache(self):
+        data = pickle.dumps((_CACHE_VERSION, str(self.exp.exp_folder.resolve()), self._entries))
+        try:
+            atomic_write(self.cache_file, data, fsync=False)
+        except OSError:
+            pass    # e.g. read-only experiment folder, we just don't get to keep the cache
+
+    def load_runs(self, reload:bool=True) -> List[Run]:
+        '''
+        Returns all runs in the experiment (ordered by run number)
+
+        reload: Check for changed runstates. Otherwise the runs from the last call are
+                returned as-is (for callers that know nothing changed)
+        '''
+        if not reload and self._runs is not None:
+            return self._runs
+        if self.exp.uses_statedb:
+            self._runs = self.exp.load_runs()
+            return self._runs
+
+        if self._entries is None:
+            self._entries = self._load_cache()
+
+        changed = False
+        entries = {}
+        for f in self.exp._runstate_files().values():
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue    # removed while we were looking
+            key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            cached = self._entries.get(f.name)
+            if cached and cached[0] == key:
+                entries[f.name] = cached
+            else:
+                entries[f.name] = (key, Run.load_from_runstate_file(f, self.exp.exp_folder))
+                changed = True
+
+        if changed or entries.keys() != self._entries.keys():
+            self._entries = entries
+            self._save_cache()
+
+        self._runs = sorted([run for _, run in self._entries.values()], key=lambda r: r.number)
+        return self._runs
+
+    def query_runs(self, status:str=None, reload:bool=True) -> List[Run]:
+        '''
+        Returns the runs with this status (all runs if status is None)
+
+        reload: Check for changed runs. Otherwise the runs from the last load_runs() call
+                are filtered (for callers that need all runs as well)
+        '''
+        if self.exp.uses_statedb and (reload or self._runs is None):
+            # let the db do the filtering (this isn't all runs, so it doesn't replace self._runs)
+            return self.exp.query_runs(status=status)
+        return [r for r in self.load_runs(reload) if status is None or r.status == status]
+
+# inotify constants (from linux/inotify.h)
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')     # wd, mask, cookie, len (then the name)
+
+def _event_names(data:bytes) -> List[str]:
+    '''Returns the file names from a buffer of inotify events'''
+    names = []
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(data):
+        _, _, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+        offset += _EVENT_HEADER.size
+        names.append(data[offset:offset+name_len].rstrip(b'\0').decode('utf-8', 'surrogateescape'))
+        offset += name_len
+    return names
+
+def _load_libc():
+    if not hasattr(os, 'uname') or os.uname().sysname != 'Linux':
+        return None
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+class FolderWatcher:
+    '''
+    Waits for files in a set of folders to change using inotify, so live views can
+    re-render when something actually changes instead of rescanning on a timer.
+    Where inotify isn't available, wait() just sleeps for the timeout and reports
+    a change (i.e. it degrades to polling).
+    '''
+    def __init__(self, folders:List[Path], ignore_names:List[str]=None) -> None:
+        '''
+        folders: The folders to watch
+        ignore_names: Changes to files with these names don't count (including the
+                      temp files atomic_write() writes them through)
+        '''
+        self._libc = _load_libc()
+        self._fd = None
+        self._watched = set()
+        self.ignore_names = set(ignore_names) if ignore_names else set()
+        if self._libc:
+            fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+        for folder in folders:
+            self.add_folder(folder)
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def add_folder(self, folder:Path):
+        '''Starts watching this folder (if it exists, and isn't watched already)'''
+        if self._fd is None or folder in self._watched or not folder.is_dir():
+            return
+        if self._libc.inotify_add_watch(self._fd, str(folder).encode('utf-8'), _WATCH_MASK) >= 0:
+            self._watched.add(folder)
+
+    def wait(self, timeout:float=None) -> bool:
+        '''
+        Waits up to timeout seconds (forever if None) for a change in any of the watched
+        folders. Returns True if something changed
+        '''
+        if self._fd is None:
+            time.sleep(timeout if timeout is not None else 2.0)
+            return True
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return False
+            # drain all pending events, we only care that something (not ignored) happened
+            changed = False
+            while True:
+                try:
+                    data = os.read(self._fd, 64*1024)
+                except BlockingIOError:
+                    break
+                if not data:
+                    break
+                changed = changed or any(not self._ignored(name) for name in _event_names(data))
+            if changed:
+                return True
+
+    def _ignored(self, name:str) -> bool:
+        return name in self.ignore_names or any(name.startswith(f'.{x}.') for x in self.ignore_names)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
@@ -1,13 +1,20 @@
 from datetime import timedelta
+import fcntl
 import os
 import sys
 from pathlib import Path
 import psutil
 import socket
+import tempfile
 import time
-from tqdm import tqdm
 from typing import Dict, List, Tuple
-from yaml import load, dump, Loader
+import yaml
+
+try:
+    # libyaml versions of the full Loader/Dumper - same documents, much faster
+    from yaml import CLoader as Loader, CDumper as Dumper
+except ImportError:
+    from yaml import Loader, Dumper
 
 class print_runtime:
     '''
@@ -85,6 +92,7 @@ def show_progress(iterator, total:int, use_tqdm:bool=None, progress_period:int=5
         use_tqdm = sys.stdout.isatty()
 
     if use_tqdm:
+        from tqdm import tqdm
         for x in tqdm(iterator, total=total, desc=desc):
             yield x
     else:
@@ -95,22 +103,108 @@ def show_progress(iterator, total:int, use_tqdm:bool=None, progress_period:int=5
             ctr += 1
             yield x
 
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+_umask = _read_umask()
+
+class file_lock:
+    def __init__(self, path:Path, shared:bool=False, blocking:bool=True) -> None:
+        '''
+        Holds an advisory (flock) lock on path for the duration of a with block.
+        The lock is taken on a sidecar "<path>.lock" file so it survives the
+        target being replaced by atomic_write().
+
+        Only cooperating processes that also use file_lock are excluded - this
+        is for serializing read-modify-write cycles between writers. Readers of
+        files written with atomic_write() don't need it.
+
+        path: The file to lock
+        shared: Take a shared (read) lock instead of an exclusive one
+        blocking: Wait for the lock. Otherwise entering the with block raises
+                  BlockingIOError if someone else holds it
+        '''
+        self.lockfile = path.with_name(f'{path.name}.lock')
+        self.shared = shared
+        self.blocking = blocking
+
+    def __enter__(self):
+        self.lockfile.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(self.lockfile, os.O_RDWR | os.O_CREAT, 0o666 & ~_umask)
+        try:
+            fcntl.flock(self.fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | (0 if self.blocking else fcntl.LOCK_NB))
+        except:
+            os.close(self.fd)
+            raise
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+def atomic_write(path:Path, data, fsync:bool=True):
+    '''
+    Replaces the contents of path with data (str or bytes) atomically: the data is
+    written to a temp file in the same folder, flushed to disk, then renamed over
+    path. Concurrent readers see either the old or the new file, never a
+    truncated one, and a crash mid-write leaves the old file intact.
+
+    fsync: Flush the temp file to disk before the rename. Without this the rename
+           can land before the data does if the machine (not just the process) dies
+    '''
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    # the leading dot/.tmp suffix keep temp files out of globs like *.run.yaml
+    fd, tmpname = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        # mkstemp creates files 0600, so match what open() would have given us
+        file_mode = path.stat().st_mode & 0o777 if path.exists() else 0o666 & ~_umask
+        os.chmod(tmpname, file_mode)
+        os.replace(tmpname, path)
+    except BaseException:
+        if os.path.exists(tmpname):
+            os.unlink(tmpname)
+        raise
+
+def yaml_load(data):
+    '''Deserializes an object from a yaml string (or bytes)'''
+    return yaml.load(data, Loader)
+
+def yaml_dump(obj) -> str:
+    '''Serializes an object to a yaml string'''
+    return yaml.dump(obj, Dumper=Dumper)
+
 def load_from_yaml(yamlfile:Path):
     '''
     Deserializes an object from the specified yaml file
     '''
     with open(yamlfile, 'r') as f:
-        return load(f.read(), Loader)
+        return yaml_load(f.read())
 
-def save_to_yaml(obj, yamlfile:Path):
+def save_to_yaml(obj, yamlfile:Path, lock:bool=False):
     '''
     Serializes the given object and writes it to the specified yaml file.
     If any part of the containing directory path doesn't exist, it will
     be created.
+
+    The file is replaced atomically (see atomic_write) so readers polling it
+    never see a half-written file.
+
+    lock: Also hold a file_lock on yamlfile while writing
     '''
     yamlfile.parent.mkdir(parents=True, exist_ok=True)
-    with open(yamlfile, 'w') as f:
-        f.write(dump(obj))
+    data = yaml_dump(obj)   # serialize first so a failure here leaves the old file alone
+    if lock:
+        with file_lock(yamlfile):
+            atomic_write(yamlfile, data)
+    else:
+        atomic_write(yamlfile, data)
 
 def kill_process(p:psutil.Process):
     parent = p.parent()